@@ -0,0 +1,106 @@
+from typing import Any, Callable, Dict
+from collections import defaultdict
+from time import perf_counter_ns
+
+
+class BacktestProfiler(object):
+    '''
+    Opt-in instrumentation of a replay. Wraps callbacks to record per stage wall time, counts
+    ticks and order submissions and keeps a log2 histogram of tick-to-order latency, the time
+    between the start of a tick's dispatch and an order submitted while handling it.
+
+    Nothing is wrapped unless a profiler is attached, so a run without one pays no overhead.
+    '''
+    def __init__(self):
+        self.stages = defaultdict(lambda: [0, 0]) # Key is stage name. Value is [calls, total ns]
+        self.latency_histogram = defaultdict(int) # Key is bucket upper bound in ns
+        self.latency_count = 0
+        self.latency_total_ns = 0
+        self.latency_max_ns = 0
+        self.ticks = 0
+        self.orders = 0
+        self.elapsed_ns = 0
+        self.tick_start_ns = None
+        self.patched = []
+
+    def wrap(self, stage: str, fn: Callable) -> Callable:
+        '''Return fn wrapped to record its wall time under stage.
+        '''
+        record = self.stages[stage]
+
+        def timed(*args, **kwargs):
+            start = perf_counter_ns()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record[0] += 1
+                record[1] += perf_counter_ns() - start
+        return timed
+
+    def instrument_broker(self, broker) -> None:
+        '''Time order submission, cancellation, order execution and account updates of a broker
+        and record tick-to-order latency of every submission. Undone by detach.
+        '''
+        submit = self.wrap('broker.submit_order', broker.submit_order)
+
+        def submit_order(order):
+            self.orders += 1
+            if self.tick_start_ns is not None:
+                self.record_latency(perf_counter_ns() - self.tick_start_ns)
+            return submit(order)
+
+        self._patch(broker, 'submit_order', submit_order)
+        submit_batch = self.wrap('broker.submit_orders', broker.submit_orders)
+
+        def submit_orders(orders):
+            self.orders += len(orders)
+            if self.tick_start_ns is not None:
+                self.record_latency(perf_counter_ns() - self.tick_start_ns)
+            return submit_batch(orders)
+
+        self._patch(broker, 'submit_orders', submit_orders)
+        self._patch(broker, 'cancel_order', self.wrap('broker.cancel_order', broker.cancel_order))
+        self._patch(broker, '_exec_order', self.wrap('broker.exec_order', broker._exec_order))
+        self._patch(broker.account, 'update_position', self.wrap('account.update_position', broker.account.update_position))
+
+    def detach(self) -> None:
+        for obj, name in self.patched:
+            obj.__dict__.pop(name, None)
+        self.patched = []
+
+    def _patch(self, obj, name: str, fn: Callable) -> None:
+        setattr(obj, name, fn)
+        self.patched.append((obj, name))
+
+    def record_latency(self, latency_ns: int) -> None:
+        self.latency_histogram[1 << max(latency_ns, 1).bit_length()] += 1
+        self.latency_count += 1
+        self.latency_total_ns += latency_ns
+        self.latency_max_ns = max(self.latency_max_ns, latency_ns)
+
+    def report(self) -> Dict[str, Any]:
+        '''Structured summary of everything recorded so far.
+        '''
+        elapsed_s = self.elapsed_ns / 1e9
+        return {
+            'elapsed_s': elapsed_s,
+            'ticks': self.ticks,
+            'ticks_per_sec': self.ticks / elapsed_s if elapsed_s else 0.0,
+            'orders': self.orders,
+            'orders_per_sec': self.orders / elapsed_s if elapsed_s else 0.0,
+            'stages': {
+                stage: {
+                    'calls': calls,
+                    'total_s': total_ns / 1e9,
+                    'mean_us': total_ns / calls / 1e3 if calls else 0.0,
+                    'share': total_ns / self.elapsed_ns if self.elapsed_ns else 0.0,
+                }
+                for stage, (calls, total_ns) in self.stages.items()
+            },
+            'tick_to_order_latency': {
+                'count': self.latency_count,
+                'mean_us': self.latency_total_ns / self.latency_count / 1e3 if self.latency_count else 0.0,
+                'max_us': self.latency_max_ns / 1e3,
+                'histogram_ns': dict(sorted(self.latency_histogram.items())),
+            },
+        }
@@ -1,9 +1,19 @@
 from typing import List, Optional
 from collections import defaultdict
 from backtest.broker.order import OrderSide, Order
+from backtest.broker.fixed_point import MICROS_PER_TICK, from_micros, from_ticks, to_micros, to_ticks
+import numpy as np
+import copy
+import pandas as pd
+
+SAMPLE_EVERY_TICK = 0
+SAMPLE_ON_BAR_CLOSE = None # Only record when the replay loop closes a bar
+FORK_CAPACITY = 256 # Initial capacity of the columns of a forked equity history
 
 
 class Position:
+    __slots__ = ('symbol', 'side', 'quantity', 'avg_price', 'realized_profit', 'unrealized_profit')
+
     def __init__(self, symbol: str, side: OrderSide, quantity: int, price: float):
         self.symbol = symbol
         self.side = side
@@ -48,6 +58,91 @@ class Position:
     def update_realized_profit(self, delta: float) -> None:
         self.realized_profit += round(delta, 3)
 
+    def copy(self) -> 'Position':
+        cls = type(self)
+        position = cls.__new__(cls)
+        for klass in cls.__mro__:
+            for slot in getattr(klass, '__slots__', ()):
+                setattr(position, slot, getattr(self, slot))
+        return position
+
+
+class EquityHistory(object):
+    '''
+    Equity curve stored in preallocated columns that double in size when full.
+
+    Sampling interval:
+        SAMPLE_EVERY_TICK (0): one sample per marked trade
+        N > 0: at most one sample per N nanoseconds, on a grid aligned to multiples of N
+        SAMPLE_ON_BAR_CLOSE (None): only samples recorded explicitly, e.g. by bar replay
+
+    A forked history shares the rows recorded before the fork with the history it was forked
+    from and only stores the rows recorded after it.
+    '''
+    def __init__(self, interval_ns: Optional[int] = SAMPLE_EVERY_TICK, capacity: int = 4096):
+        self.interval_ns = interval_ns
+        self.timestamps = np.zeros(capacity, dtype=np.int64)
+        self.equity = np.zeros(capacity, dtype=np.float64)
+        self.balance = np.zeros(capacity, dtype=np.float64)
+        self.size = 0 # Rows stored in this history's own columns
+        self.next_sample_ns = None
+        self.base: Optional['EquityHistory'] = None # History this one was forked from
+        self.base_size = 0 # Rows of base recorded before the fork
+
+    def __len__(self) -> int:
+        return self.base_size + self.size
+
+    def sample(self, timestamp: int, equity: float, balance: float) -> None:
+        interval = self.interval_ns
+        if interval is None:
+            return
+        if interval:
+            if self.next_sample_ns is not None and timestamp < self.next_sample_ns:
+                return
+            self.next_sample_ns = timestamp - timestamp % interval + interval
+        self.record(timestamp, equity, balance)
+
+    def record(self, timestamp: int, equity: float, balance: float) -> None:
+        if self.size == len(self.timestamps):
+            for column in ('timestamps', 'equity', 'balance'):
+                array = getattr(self, column)
+                grown = np.empty(len(array) * 2, dtype=array.dtype)
+                grown[:len(array)] = array
+                setattr(self, column, grown)
+        i = self.size
+        self.timestamps[i] = timestamp
+        self.equity[i] = equity
+        self.balance[i] = balance
+        self.size += 1
+
+    def fork(self) -> 'EquityHistory':
+        '''History that continues from this one in O(1). Recorded rows are never changed, so they
+        are shared instead of copied and both histories append to their own columns from here on.
+        '''
+        history = EquityHistory(self.interval_ns, FORK_CAPACITY)
+        if self.size == 0 and self.base is not None:
+            # Nothing recorded since this history was forked, e.g. a snapshot
+            history.base, history.base_size = self.base, self.base_size
+        else:
+            history.base, history.base_size = self, len(self)
+        history.next_sample_ns = self.next_sample_ns
+        return history
+
+    def column(self, name: str) -> np.ndarray:
+        '''Every row of the timestamps, equity or balance column, including rows shared with the base.
+        '''
+        own = getattr(self, name)[:self.size]
+        if self.base is None:
+            return own
+        return np.concatenate([self.base.column(name)[:self.base_size], own])
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({
+            'timestamp': self.column('timestamps'),
+            'equity': self.column('equity'),
+            'balance': self.column('balance'),
+        })
+
 
 class Account:
     def __init__(self, initial_balance: float):
@@ -55,6 +150,84 @@ class Account:
         self.buying_power = initial_balance # Used to withold buying power when order is placed but not executed.
         self.open_positions = defaultdict() # Key is (symbol, side)
         self.closed_positions = defaultdict() # Key is (symbol, side)
+        self.last_prices = {} # Key is symbol
+        self.position_values = {} # Market value of open positions at last price. Key is symbol
+        self.market_value = 0.0 # Sum of position_values, maintained incrementally
+        self.equity_history = None
+
+    def fork(self) -> 'Account':
+        '''Independent copy of the account. Only positions are copied, one per open or closed
+        (symbol, side), so the cost doesn't depend on how many orders were filled. The equity
+        history recorded so far is shared.
+        '''
+        account = copy.copy(self)
+        account.open_positions = defaultdict(None, {key: position.copy() for key, position in self.open_positions.items()})
+        account.closed_positions = defaultdict(None, {key: position.copy() for key, position in self.closed_positions.items()})
+        account.last_prices = dict(self.last_prices)
+        account.position_values = dict(self.position_values)
+        account.equity_history = self.equity_history.fork() if self.equity_history is not None else None
+        return account
+
+    def enable_equity_history(self, interval_ns: Optional[int] = SAMPLE_EVERY_TICK, capacity: int = 4096) -> EquityHistory:
+        self.equity_history = EquityHistory(interval_ns, capacity)
+        return self.equity_history
+
+    def tracks(self, symbol: str) -> bool:
+        '''Whether trades of the symbol change the account's equity or its equity history.
+        '''
+        return symbol in self.position_values or (self.equity_history is not None and self.equity_history.interval_ns is not None)
+
+    def mark(self, symbol: str, price: float, timestamp: int = None) -> None:
+        '''Mark positions of the symbol to the given trade price in O(1), refreshing unrealized profit
+        and equity, and sample the equity history.
+        '''
+        self.last_prices[symbol] = price
+        if symbol in self.position_values:
+            value = self._value(symbol, price, True)
+            self.market_value += value - self.position_values[symbol]
+            self.position_values[symbol] = value
+        if self.equity_history is not None and timestamp is not None:
+            self.equity_history.sample(timestamp, self.get_equity(), self.get_balance())
+
+    def record_equity(self, timestamp: int) -> None:
+        if self.equity_history is not None:
+            self.equity_history.record(timestamp, self.get_equity(), self.get_balance())
+
+    def get_equity(self) -> float:
+        '''Balance plus market value of open positions at the last marked prices.
+        '''
+        return self.balance + self.market_value
+
+    def notional(self, order: Order) -> float:
+        '''Buying power an order withholds, in the unit of balance and buying_power.
+        '''
+        return order.get_quantity() * order.get_price()
+
+    def _value(self, symbol: str, price: float, mark_unrealized: bool) -> Optional[float]:
+        '''Market value of the open positions of the symbol at price, or None if there are none.
+        '''
+        value = None
+        long_position = self.open_positions.get((symbol, OrderSide.LONG))
+        if long_position:
+            if mark_unrealized:
+                long_position.unrealized_profit = long_position.quantity * (price - long_position.avg_price)
+            value = long_position.quantity * price
+        short_position = self.open_positions.get((symbol, OrderSide.SHORT))
+        if short_position:
+            if mark_unrealized:
+                short_position.unrealized_profit = short_position.quantity * (short_position.avg_price - price)
+            # Short positions debit the balance at open and credit back avg price plus profit at close
+            value = (value or 0.0) + short_position.quantity * (2 * short_position.avg_price - price)
+        return value
+
+    def _revalue(self, symbol: str, price: float) -> None:
+        self.last_prices[symbol] = price
+        value = self._value(symbol, price, False)
+        if value is None:
+            self.market_value -= self.position_values.pop(symbol, 0)
+        else:
+            self.market_value += value - self.position_values.get(symbol, 0)
+            self.position_values[symbol] = value
 
     def get_open_position(self, symbol: str, side: OrderSide) -> Optional[Position]:
         if (symbol, side) not in self.open_positions:
@@ -129,6 +302,7 @@ class Account:
                 self.update_buying_power(order.get_quantity() * order.get_price())
                 open_position.update_avg_price(price=price, quantity=quantity)
                 open_position.update_quantity(quantity)
+        self._revalue(symbol, price)
             
     def get_balance(self) -> float:
         return self.balance
@@ -138,10 +312,166 @@ class Account:
     
     def update_buying_power(self, delta) -> None:
         self.buying_power += delta
+
+    def withhold(self, amount) -> None:
+        '''Withhold amount of buying power for an accepted order, in the unit of notional. A negative
+        amount credits it back.
+        '''
+        self.buying_power -= amount
         
     def get_buying_power(self) -> float:
         return self.buying_power
      
     def __str__(self) -> str:
         # TODO: implement this function
-        pass
\ No newline at end of file
+        pass
+
+
+class FixedPointPosition(Position):
+    '''
+    Position of a FixedPointAccount. The cost basis is kept exactly in integer micro-dollars, the
+    average price in integer ticks (rounded to the nearest tick) and realized and unrealized profit
+    are integer micro-dollars too. Getters return dollars.
+    '''
+    __slots__ = ('cost',)
+
+    def __init__(self, symbol: str, side: OrderSide, quantity: int, ticks: int):
+        self.symbol = symbol
+        self.side = side
+        self.quantity = 0
+        self.cost = 0
+        self.avg_price = 0
+        self.realized_profit = 0
+        self.unrealized_profit = 0
+        self.add(quantity, ticks)
+
+    def add(self, quantity: int, ticks: int) -> None:
+        self.cost += quantity * ticks * MICROS_PER_TICK
+        self.quantity += quantity
+        self._update_avg_price()
+
+    def _update_avg_price(self) -> None:
+        unit = self.quantity * MICROS_PER_TICK
+        self.avg_price = (2 * self.cost + unit) // (2 * unit) if unit else 0
+
+    def update_realized_profit(self, delta: int) -> None:
+        '''Add delta integer micro-dollars of realized profit.
+        '''
+        self.realized_profit += delta
+
+    def reduce(self, quantity: int) -> int:
+        '''Remove quantity shares and return the cost basis they carried. Rounding is left in the
+        remaining cost, so closing the whole position releases the exact total cost.
+        '''
+        cost = self.cost * quantity // self.quantity
+        self.cost -= cost
+        self.quantity -= quantity
+        self._update_avg_price()
+        return cost
+
+    def get_avg_price(self) -> float:
+        return from_ticks(self.avg_price)
+
+    def get_realized_profit(self) -> float:
+        return from_micros(self.realized_profit)
+
+    def get_unrealized_profit(self) -> float:
+        return from_micros(self.unrealized_profit)
+
+
+class FixedPointAccount(Account):
+    '''
+    Account in fixed-point mode. Prices are converted to integer ticks of 1e-4 dollars on every
+    fill and balance, buying power, market value and P&L are integer micro-dollars, so fills cost
+    integer arithmetic only and P&L doesn't drift over long runs. Getters, update_balance and
+    update_buying_power work in dollars like those of Account, while the balance, buying_power and
+    market_value attributes, notional and withhold work in micro-dollars.
+    '''
+    def __init__(self, initial_balance: float):
+        super().__init__(to_micros(initial_balance))
+        self.market_value = 0
+
+    def notional(self, order: Order) -> int:
+        return order.get_quantity() * order.get_price_ticks() * MICROS_PER_TICK
+
+    def get_balance(self) -> float:
+        return from_micros(self.balance)
+
+    def update_balance(self, delta: float) -> None:
+        self.balance += to_micros(delta)
+
+    def update_buying_power(self, delta: float) -> None:
+        self.buying_power += to_micros(delta)
+
+    def get_buying_power(self) -> float:
+        return from_micros(self.buying_power)
+
+    def get_equity(self) -> float:
+        return from_micros(self.balance + self.market_value)
+
+    def update_position(self, price: float, order: Order):
+        symbol = order.get_symbol()
+        side = order.get_side()
+        quantity = order.get_quantity()
+        ticks = to_ticks(price)
+        open_position = self.open_positions.get((symbol, side))
+        if quantity >= 0:
+            cost = quantity * ticks * MICROS_PER_TICK
+            self.balance -= cost
+            # Credit back the witholding amount and reduce actual amount from buying power
+            self.buying_power += self.notional(order) - cost
+            if not open_position:
+                self.open_positions[(symbol, side)] = FixedPointPosition(symbol, side, quantity, ticks)
+            else:
+                open_position.add(quantity, ticks)
+        else:
+            closed_quantity = -quantity
+            cost = open_position.reduce(closed_quantity)
+            proceeds = closed_quantity * ticks * MICROS_PER_TICK
+            if side == OrderSide.SHORT:
+                realized_profit = cost - proceeds
+                net_proceeding = cost + realized_profit
+            else:
+                realized_profit = proceeds - cost
+                net_proceeding = proceeds
+            self.buying_power += net_proceeding
+            self.balance += net_proceeding
+
+            closed_position = self.closed_positions.get((symbol, side))
+            if not closed_position:
+                closed_position = FixedPointPosition(symbol, side, 0, 0)
+                self.closed_positions[(symbol, side)] = closed_position
+            closed_position.quantity += closed_quantity
+            closed_position.update_realized_profit(realized_profit)
+            if not open_position.quantity:
+                del self.open_positions[(symbol, side)]
+        self._revalue(symbol, price)
+
+    def _value(self, symbol: str, price: float, mark_unrealized: bool) -> Optional[int]:
+        ticks = to_ticks(price)
+        value = None
+        long_position = self.open_positions.get((symbol, OrderSide.LONG))
+        if long_position:
+            proceeds = long_position.quantity * ticks * MICROS_PER_TICK
+            if mark_unrealized:
+                long_position.unrealized_profit = proceeds - long_position.cost
+            value = proceeds
+        short_position = self.open_positions.get((symbol, OrderSide.SHORT))
+        if short_position:
+            proceeds = short_position.quantity * ticks * MICROS_PER_TICK
+            if mark_unrealized:
+                short_position.unrealized_profit = short_position.cost - proceeds
+            value = (value or 0) + 2 * short_position.cost - proceeds
+        return value
+
+    def to_array(self) -> np.ndarray:
+        '''Balance, buying power and market value in micro-dollars as an int64 array.
+        '''
+        return np.array([self.balance, self.buying_power, self.market_value], dtype=np.int64)
+
+
+def pack_accounts(accounts: List[FixedPointAccount]) -> np.ndarray:
+    '''Stack the state of many fixed-point accounts into an (n, 3) int64 array of balance, buying
+    power and market value in micro-dollars, e.g. to compare the accounts of a sweep at once.
+    '''
+    return np.array([(a.balance, a.buying_power, a.market_value) for a in accounts], dtype=np.int64).reshape(-1, 3)
@@ -1,8 +1,13 @@
-from backtest.broker.account import Account
+from backtest.broker.account import Account, FixedPointAccount
 from backtest.broker.order import OrderType, Order, OrderSide
+from backtest.broker.trigger_index import TriggerIndex
+from backtest.broker.reservation_ledger import ReservationLedger
+from backtest.broker.order_archive import OrderArchive
+from backtest.broker.fill_simulator import NO_FILL, simulate_fills
+from backtest.broker.journal import EventJournal, EventType
 from backtest.exceptions.broker_exception import BrokerException
-from data.fetcher.polygon_data_model import Trade
-from typing import List, Union
+from data.fetcher.polygon_data_model import Bar, Trade
+from typing import List, NamedTuple, Tuple, Union
 from loguru import logger
 from collections import defaultdict
 from enum import Enum
@@ -22,67 +27,211 @@ class OrderStatus(Enum):
     FILLED = 4
 
 
+TERMINAL_STATUSES = (OrderStatus.REJECTED, OrderStatus.CANCELED, OrderStatus.FILLED)
+
+class IntrabarPath(Enum):
+    '''Assumed price path inside a bar when filling resting orders in bar replay mode.
+
+    OHLC: open -> high -> low -> close
+    OLHC: open -> low -> high -> close
+    NEAREST: open -> extreme closest to the open -> other extreme -> close
+    PESSIMISTIC: visit first the extreme that hurts the open position of the symbol
+        (low when long, high when short). Same as NEAREST when flat.
+    '''
+    OHLC = 1
+    OLHC = 2
+    NEAREST = 3
+    PESSIMISTIC = 4
+
+
 class OrderBook(object):
     '''
     Order book lists all order sent to broker. All orders are validated before entered in book
     Valid order will have status 1, 3 or 4. Invalid order will have status 2.
+
+    Only live (ACCEPTED) orders are kept as objects. Orders that reach a terminal status are
+    moved to a columnar OrderArchive, so memory per finished order stays small however long the
+    backtest runs. get_order and list_orders return rebuilt Order objects for archived orders.
     '''
-    def __init__(self):
+    def __init__(self, archive: OrderArchive = None):
         self.logger = logger.bind(classname="OrderBook")
-        self.order_book = defaultdict()
-    
+        self.order_book = defaultdict() # Live orders. Key is order ID
+        self.seqs = {} # Submission sequence number of live orders. Key is order ID
+        # Secondary indexes of live orders so lookups cost O(matches) instead of a scan.
+        # Inner dicts are keyed by order ID to keep submission order and allow O(1) removal.
+        self.symbol_index = defaultdict(dict) # Key is symbol
+        self.status_index = defaultdict(dict) # Key is OrderStatus
+        self.symbol_status_index = defaultdict(dict) # Key is (symbol, OrderStatus)
+        self.archive = archive if archive is not None else OrderArchive()
+        self.seq = 0
+        self.shared = False # Tables are shared with a fork and must be copied before the next write
+
+    def fork(self) -> 'OrderBook':
+        '''Copy-on-write copy of the book in O(1). Both books share their tables until either one
+        is written to. Order objects are never copied since they don't change once submitted.
+        '''
+        book = OrderBook(self.archive)
+        book.order_book = self.order_book
+        book.seqs = self.seqs
+        book.symbol_index = self.symbol_index
+        book.status_index = self.status_index
+        book.symbol_status_index = self.symbol_status_index
+        book.seq = self.seq
+        book.shared = self.shared = True
+        return book
+
+    def _own(self) -> None:
+        self.order_book = self.order_book.copy()
+        self.seqs = self.seqs.copy()
+        for name in ('symbol_index', 'status_index', 'symbol_status_index'):
+            index = getattr(self, name)
+            setattr(self, name, defaultdict(dict, {key: orders.copy() for key, orders in index.items()}))
+        # Archived rows stay shared, the copy only appends to its own chunks
+        self.archive = self.archive.copy()
+        self.shared = False
+
     def add_order(self, order: Order, status: OrderStatus) -> None:
-        logger.info('Added order {} to order book. Current status is {}'.format(order.get_order_id(), status.name))
-        self.order_book[order.get_order_id()] = (order, status)
+        if self.shared:
+            self._own()
+        order_id = order.get_order_id()
+        if order_id in self.archive:
+            raise BrokerException('Order {} is already in a terminal status'.format(order_id))
+        if order_id in self.order_book:
+            self._unindex_order(order, self.order_book[order_id][1])
+            seq = self.seqs[order_id]
+        else:
+            self.seq += 1
+            seq = self.seq
+        if status in TERMINAL_STATUSES:
+            self._remove_live(order_id)
+            self.archive.append(order, seq, status.value)
+            return
+        self.order_book[order_id] = (order, status)
+        self.seqs[order_id] = seq
+        self.symbol_index[order.get_symbol()][order_id] = order
+        self._index_order(order, status)
     
     def update_order(self, order_id: str, status: OrderStatus) -> None:
+        if self.shared:
+            self._own()
+        if order_id in self.archive:
+            raise BrokerException('Invliad argument. Order {} is already in a terminal status'.format(order_id))
         order, current_status = self.order_book[order_id]
         if current_status == OrderStatus.ACCEPTED and (status is not OrderStatus.CANCELED and status is not OrderStatus.FILLED):
             raise BrokerException('Invliad argument. Order can only be transited from ACCEPTED to CANCELED or FILLED')
+        self._unindex_order(order, current_status)
+        if status in TERMINAL_STATUSES:
+            seq = self.seqs[order_id]
+            self._remove_live(order_id)
+            self.archive.append(order, seq, status.value)
+            return
         self.order_book[order_id] = (order, status)
-        logger.info('Updated order status of {} from {} to {}'.format(order_id, current_status.name, status.name))
+        self._index_order(order, status)
+
+    def _remove_live(self, order_id: str) -> None:
+        entry = self.order_book.pop(order_id, None)
+        self.seqs.pop(order_id, None)
+        if entry is not None:
+            self.symbol_index[entry[0].get_symbol()].pop(order_id, None)
 
     def get_order(self, order_id: str) -> Union[Order, OrderStatus]:
-        return self.order_book[order_id]
+        entry = self.order_book.get(order_id)
+        if entry is not None:
+            return entry
+        order, status = self.archive.get(order_id)
+        return order, OrderStatus(status)
 
     def list_orders(self, order_status: OrderStatus = None, symbol: str = None) -> List:
-        '''List orders in order book.
+        '''List orders in order book. Symbol lookups keep submission order while status lookups
+        keep the order in which orders reached that status.
 
         Args:
-            order_status (str, optional): _description_. Defaults to None.
-            symbol (str, optional): _description_. Defaults to None.
-
-        Raises:
-            BrokerException: _description_
+            order_status (OrderStatus, optional): Only return orders with this status. Defaults to None.
+            symbol (str, optional): Only return orders of this symbol. Defaults to None.
 
         Returns:
-            _type_: _description_
-        '''
-        symbol_result = set()
-        status_result = set()
-        total_result = []
-        for order, status in self.order_book.values():
-            if symbol and order.get_symbol() == symbol:
-                symbol_result.add(order)
-            if status and status == order_status:
-                status_result.add(order)
-            total_result.append(order)
+            List: List of Order objects
+        '''
+        if order_status in TERMINAL_STATUSES:
+            rows = self.archive.rows(order_status.value, symbol or None)
+            return [self.archive.get_row(row)[0] for row in rows]
         if symbol and order_status:
-            return list(symbol_result & status_result)
-        elif symbol:
-            return list(symbol_result)
-        elif order_status:
-            return list(status_result)
+            return list(self.symbol_status_index.get((symbol, order_status), {}).values())
+        if order_status:
+            return list(self.status_index.get(order_status, {}).values())
+
+        # Live and archived orders merged back into submission order
+        if symbol:
+            live_orders = list(self.symbol_index.get(symbol, {}).values())
         else:
-            return total_result
+            live_orders = [order for order, _ in self.order_book.values()]
+        rows = self.archive.rows(symbol=symbol or None)
+        if not len(rows):
+            return live_orders
+        entries = [(self.seqs[order.get_order_id()], order) for order in live_orders]
+        entries.extend((self.archive.seq(row), self.archive.get_row(row)[0]) for row in rows)
+        entries.sort(key=lambda entry: entry[0])
+        return [order for _, order in entries]
+
+    def count_orders(self, order_status: OrderStatus = None, symbol: str = None) -> int:
+        '''Number of orders list_orders would return, without rebuilding archived orders.
+        '''
+        if order_status in TERMINAL_STATUSES:
+            return self.archive.count(order_status.value, symbol or None)
+        if symbol and order_status:
+            return len(self.symbol_status_index.get((symbol, order_status), {}))
+        if order_status:
+            return len(self.status_index.get(order_status, {}))
+        live = len(self.symbol_index.get(symbol, {})) if symbol else len(self.order_book)
+        return live + self.archive.count(symbol=symbol or None)
+
+    def _index_order(self, order: Order, status: OrderStatus) -> None:
+        order_id = order.get_order_id()
+        self.status_index[status][order_id] = order
+        self.symbol_status_index[(order.get_symbol(), status)][order_id] = order
+
+    def _unindex_order(self, order: Order, status: OrderStatus) -> None:
+        order_id = order.get_order_id()
+        self.status_index[status].pop(order_id, None)
+        self.symbol_status_index[(order.get_symbol(), status)].pop(order_id, None)
+
+
+class BrokerSnapshot(NamedTuple):
+    '''Frozen broker state returned by Broker.snapshot. Restore with Broker.from_snapshot,
+    any number of times.
+    '''
+    timestamp: int # Timestamp of the last trade seen before the snapshot
+    order_count: int
+    trading_enabled: bool
+    account: Account
+    order_book: OrderBook
+    fixed_point: bool
+    archive_dir: str
 
 
 class Broker(object):
-    def __init__(self, initial_balance=30000.0) -> None:
+    def __init__(self, initial_balance=30000.0, enable_journal: bool = True, archive_dir: str = None,
+                 fixed_point: bool = False) -> None:
+        '''
+        Args:
+            initial_balance (float, optional): Defaults to 30000.0.
+            enable_journal (bool, optional): Record order events in an EventJournal. Defaults to True.
+            archive_dir (str, optional): Directory full chunks of the terminal order archive are spilled to.
+                Defaults to None (kept in memory).
+            fixed_point (bool, optional): Keep money in integer micro-dollars with a FixedPointAccount. Defaults to False.
+        '''
         self.logger = logger.bind(classname="Broker")
-        self.account = Account(initial_balance)
+        self.fixed_point = fixed_point
+        self.archive_dir = archive_dir
+        # Structured record of order events. Attach backtest.broker.journal.LoggingSink for text logs
+        self.journal = EventJournal() if enable_journal else None
+        self.last_timestamp = None # Timestamp of the current trade. Ares keeps it up to date when on_trade is skipped
+        self.account = FixedPointAccount(initial_balance) if fixed_point else Account(initial_balance)
         self.order_count = 0 # This is used to generate order ID
-        self.order_book = OrderBook()
+        self.order_book = OrderBook(OrderArchive(spill_dir=archive_dir))
+        self.trigger_index = TriggerIndex() # Resting ACCEPTED orders keyed by trigger price
+        self.ledger = ReservationLedger(fixed_point) # Reserved quantity and buying power of ACCEPTED orders
+        self.trading_enabled = True # Disabled during replay warm-up. New orders are rejected
     
     def on_trade(self, trade: Trade) -> None:
         '''
@@ -93,14 +242,144 @@ class Broker(object):
         1. Check order book and try to execute any pending order
         2. Update account position information
         '''
-        trade_symbol = trade.symbol
-        eligible_orders = self.order_book.list_orders(order_status=OrderStatus.ACCEPTED, symbol=trade_symbol)
-        for order in eligible_orders:
-            if self._can_execute(order=order, trade=trade):
-                self.logger.info("Executing order {} at price {}".format(order.get_order_id(), trade.price))
+        self._fill_triggered(trade)
+        self.account.mark(trade.symbol, trade.price, trade.timestamp)
+
+    def _fill_triggered(self, trade: Trade) -> None:
+        '''Execute the resting orders crossed by trade, without marking the account.
+        '''
+        self.last_timestamp = trade.timestamp
+        # Only orders whose trigger price was crossed by this trade are popped from the index
+        triggered_orders = self.trigger_index.pop_triggered(trade.symbol, trade.price)
+        for order in triggered_orders:
+            _, order_status = self.order_book.get_order(order.get_order_id())
+            if order_status == OrderStatus.ACCEPTED and self._can_execute(order=order, trade=trade):
                 self._exec_order(order=order, trade=trade)
-        # TODO should periodically send trade data to account so that we can have a P&L history.
-        # https://app.asana.com/0/1204114474228984/1204114397988410/f
+
+    def on_trades(self, symbol: str, timestamps, prices, sizes) -> List[Tuple[str, int, float]]:
+        '''Batch version of on_trade for a whole trade tape of one symbol.
+
+        Fill index and price of every resting order are computed at once by simulate_fills, then
+        fills are applied to the account in the same order on_trade would apply them tick by tick.
+        Orders must not be submitted in between, so this fits strategies whose orders are known up front.
+
+        The account is marked at every trade that fills an order and at the last trade, with the
+        price and timestamp of that trade. The equity history therefore holds the rows on_trade
+        would sample at those trades, but not those of the trades in between, whose marks only
+        move with the price.
+
+        Args:
+            symbol (str): Symbol of the tape
+            timestamps (np.ndarray): Trade timestamps in nanoseconds
+            prices (np.ndarray): Trade prices
+            sizes (np.ndarray): Trade sizes
+
+        Returns:
+            List[Tuple[str, int, float]]: (order ID, tape index, fill price) of every fill in execution order
+        '''
+        orders = self.order_book.list_orders(order_status=OrderStatus.ACCEPTED, symbol=symbol)
+        fill_index, fill_price = simulate_fills(prices, orders)
+        # Stable sort keeps submission order among orders filled by the same trade
+        fills = []
+        marked = None # Tape index of the fills being applied, marked once they all are
+        for i in fill_index.argsort(kind='stable'):
+            index = int(fill_index[i])
+            if index == NO_FILL:
+                continue
+            if marked is not None and index != marked:
+                self.account.mark(symbol, float(prices[marked]), int(timestamps[marked]))
+            marked = index
+            order = orders[i]
+            trade = Trade(symbol, timestamps[index], float(fill_price[i]), sizes[index])
+            self.trigger_index.remove_order(order.get_order_id())
+            self._exec_order(order=order, trade=trade)
+            fills.append((order.get_order_id(), index, trade.price))
+        last = len(prices) - 1
+        if marked is not None and marked != last:
+            self.account.mark(symbol, float(prices[marked]), int(timestamps[marked]))
+        if last >= 0:
+            self.account.mark(symbol, float(prices[last]), int(timestamps[last]))
+        return fills
+
+    def on_bar(self, bar: Bar, path: IntrabarPath = IntrabarPath.OHLC) -> None:
+        '''Bar replay counterpart of on_trade. Fills resting orders against the bar by walking the
+        assumed intrabar path with synthetic trades, so fills follow the same _can_execute rules.
+        Each leg of the path stops at every trigger price it crosses, so an order crossed inside
+        the bar fills at its own price while an order already crossed at the open fills at the open.
+        The synthetic trades only fill orders: the account is marked once, at the close, so the
+        equity history gets at most one sample per bar.
+
+        Args:
+            bar (Bar): OHLCV bar
+            path (IntrabarPath, optional): Intrabar path assumption. Defaults to IntrabarPath.OHLC.
+        '''
+        symbol = bar.symbol
+        self.last_timestamp = bar.timestamp
+        if self.trigger_index.has_orders(symbol):
+            self._walk_bar(bar, path)
+        self.account.mark(symbol, bar.close, bar.timestamp)
+
+    def _walk_bar(self, bar: Bar, path: IntrabarPath) -> None:
+        symbol = bar.symbol
+        points = self._intrabar_points(bar, path)
+        self._fill_triggered(Trade(symbol, bar.timestamp, points[0], 0))
+        for start, end in zip(points, points[1:]):
+            rising = end > start
+            if end == start:
+                continue
+            price = self.trigger_index.next_trigger(symbol, rising)
+            while price is not None and (price <= end if rising else price >= end):
+                # Orders crossed earlier in the bar are already filled, this only guards the leg start
+                price = max(price, start) if rising else min(price, start)
+                self._fill_triggered(Trade(symbol, bar.timestamp, price, 0))
+                price = self.trigger_index.next_trigger(symbol, rising)
+            self._fill_triggered(Trade(symbol, bar.timestamp, end, 0))
+
+    def _intrabar_points(self, bar: Bar, path: IntrabarPath) -> List[float]:
+        if path == IntrabarPath.PESSIMISTIC:
+            if self.account.get_open_position(bar.symbol, OrderSide.LONG):
+                path = IntrabarPath.OLHC
+            elif self.account.get_open_position(bar.symbol, OrderSide.SHORT):
+                path = IntrabarPath.OHLC
+            else:
+                path = IntrabarPath.NEAREST
+        if path == IntrabarPath.NEAREST:
+            path = IntrabarPath.OHLC if bar.high - bar.open <= bar.open - bar.low else IntrabarPath.OLHC
+        if path == IntrabarPath.OHLC:
+            return [bar.open, bar.high, bar.low, bar.close]
+        return [bar.open, bar.low, bar.high, bar.close]
+
+    def snapshot(self) -> BrokerSnapshot:
+        '''Capture account, order book and order ID counter so a replay can be forked from here.
+        Positions are copied while the order book is shared copy-on-write, so a snapshot stays
+        cheap however many orders were submitted before it. The journal is not part of the snapshot.
+        '''
+        return BrokerSnapshot(self.last_timestamp, self.order_count, self.trading_enabled,
+                              self.account.fork(), self.order_book.fork(), self.fixed_point, self.archive_dir)
+
+    @classmethod
+    def from_snapshot(cls, snapshot: BrokerSnapshot, enable_journal: bool = True) -> 'Broker':
+        '''Build a broker that continues from snapshot. The snapshot is left untouched, so many
+        brokers can be forked from it. Their journals start empty at the fork point. Money mode and
+        archive directory are those of the snapshotted broker.
+        '''
+        broker = cls(snapshot.account.get_balance(), enable_journal, snapshot.archive_dir, snapshot.fixed_point)
+        broker.last_timestamp = snapshot.timestamp
+        broker.order_count = snapshot.order_count
+        broker.trading_enabled = snapshot.trading_enabled
+        broker.account = snapshot.account.fork()
+        broker.order_book = snapshot.order_book.fork()
+        # Accepted orders are listed in acceptance order, which keeps fill priority
+        for order in broker.order_book.list_orders(order_status=OrderStatus.ACCEPTED):
+            broker.trigger_index.add_order(order)
+            broker.ledger.add_order(order)
+        return broker
+
+    def wants_trade(self, symbol: str) -> bool:
+        '''Whether on_trade has any work for a trade of the symbol: resting orders to check or
+        positions and equity history to mark to market.
+        '''
+        return self.trigger_index.has_orders(symbol) or self.account.tracks(symbol)
 
     def submit_order(self, order: Order) -> str:
         '''Submit an order. Order will be put in order book for execution.
@@ -113,23 +392,61 @@ class Broker(object):
         '''
         order_id = self._generate_order_id()
         order.set_order_id(order_id)
-        valid_order, trading_amount = self._valid_order(order)
+        if self.trading_enabled:
+            valid_order, trading_amount = self._valid_order(order)
+        else:
+            valid_order, trading_amount = False, 0
+        self._enter_order(order, valid_order, trading_amount)
+        return order_id
+
+    def submit_orders(self, orders: List[Order]) -> Tuple[List[str], List[str]]:
+        '''Submit a batch of orders, e.g. an entry ladder or a basket rebalance. The outcome is the
+        same as calling submit_order on each order in list order, with the whole batch validated in
+        one pass.
+
+        Args:
+            orders (List[Order]): Orders in submission order
+
+        Returns:
+            Tuple[List[str], List[str]]: IDs of accepted orders and IDs of rejected orders, in submission order
+        '''
+        if self.trading_enabled:
+            verdicts = self._valid_orders(orders)
+        else:
+            verdicts = [(False, 0)] * len(orders)
+        accepted, rejected = [], []
+        for order, (valid_order, trading_amount) in zip(orders, verdicts):
+            order_id = self._generate_order_id()
+            order.set_order_id(order_id)
+            self._enter_order(order, valid_order, trading_amount)
+            (accepted if valid_order else rejected).append(order_id)
+        return accepted, rejected
+
+    def _enter_order(self, order: Order, valid_order: bool, trading_amount: float) -> None:
+        journal = self.journal
         if not valid_order:
             self.order_book.add_order(order, OrderStatus.REJECTED)
-            self.logger.info("Rejected {} because account has insufficient balance".format(str(order)))
+            if journal is not None:
+                journal.record(EventType.REJECTED, self.last_timestamp, order, order.price)
         else:
             self.order_book.add_order(order, OrderStatus.ACCEPTED)
-            self.account.update_buying_power(-1 * trading_amount) # Witholding account balance for trade
-            self.logger.info('Received {} with order ID {}'.format(str(order), order.get_order_id()))
-        return order_id
+            self.trigger_index.add_order(order)
+            self.ledger.add_order(order)
+            self.account.withhold(trading_amount) # Witholding account balance for trade
+            if journal is not None:
+                journal.record(EventType.ACCEPTED, self.last_timestamp, order, order.price)
     
     def cancel_order(self, order_id: str) -> None:
         order, order_status = self.order_book.get_order(order_id)
         if order_status != OrderStatus.ACCEPTED:
             raise BrokerException('Invalid Status. Current order stauts must be ACCPETED before it can be canceld')
-        trading_amount = order.get_quantity() * order.get_price()
-        self.account.update_buying_power(trading_amount) # Credit witholding back to account
+        trading_amount = self.account.notional(order)
+        self.account.withhold(-trading_amount) # Credit witholding back to account
         self.order_book.update_order(order_id, OrderStatus.CANCELED)
+        self.trigger_index.remove_order(order_id)
+        self.ledger.remove_order(order)
+        if self.journal is not None:
+            self.journal.record(EventType.CANCELED, self.last_timestamp, order, order.price)
     
     def _can_execute(self, order: Order, trade: Trade) -> bool:
         executed = False
@@ -202,6 +519,9 @@ class Broker(object):
         self.account.update_position(price=trade_price, order=order)
         # Change order book status
         self.order_book.update_order(order.get_order_id(), OrderStatus.FILLED)
+        self.ledger.remove_order(order)
+        if self.journal is not None:
+            self.journal.record(EventType.FILLED, trade.timestamp, order, trade_price)
 
     def list_orders(self, order_status: OrderStatus = None, symbol: str = None) -> List:
         return self.order_book.list_orders(order_status, symbol)
@@ -213,11 +533,10 @@ class Broker(object):
         Args:
             order (Order): an order object
         '''
-        buying_power = self.account.get_buying_power()
+        buying_power = self.account.buying_power
         symbol = order.get_symbol()
         quantity = order.get_quantity()
-        price = order.get_price()
-        amount = quantity * price
+        amount = self.account.notional(order) # In account units, micro-dollars in fixed-point mode
         side = order.get_side()
         if side == OrderSide.LONG:
             opposite_side = OrderSide.SHORT
@@ -227,13 +546,7 @@ class Broker(object):
         if quantity < 0:
             # We are closing position. No need to reserve buying power
             open_position = self.account.get_open_position(symbol=symbol, side=side)
-            open_orders = self.order_book.list_orders(order_status=OrderStatus.ACCEPTED, symbol=symbol)
-            current_quantity = 0
-            for open_order in open_orders:
-                if open_order and side == open_order.get_side() and open_order.get_quantity() < 0:
-                    current_quantity += abs(open_order.get_quantity())
-            if not open_position or open_position.get_quantity() - current_quantity < abs(quantity):
-                self.logger.info("Invalid order. We don't have enough open position to sell for {}".format(symbol))
+            if not open_position or open_position.get_quantity() - self.ledger.reserved_close(symbol, side) < abs(quantity):
                 return False, 0
             
             return True, 0
@@ -242,12 +555,47 @@ class Broker(object):
             opposite_open_position = self.account.get_open_position(symbol=symbol, side=opposite_side)
             if opposite_open_position: # We don't allow open position in a opposite direction
                 return False, 0
-            unfilled_order = self.order_book.list_orders(order_status=OrderStatus.ACCEPTED, symbol=symbol)
-            for o in unfilled_order:
-                if o.get_side() == opposite_side:
-                    return False, 0
+            if self.ledger.has_pending(symbol, opposite_side):
+                return False, 0
             return amount <= buying_power, amount
-    
+
+    def _valid_orders(self, orders: List[Order]) -> List[Tuple[bool, float]]:
+        '''Batch version of _valid_order. Validates every order as if the orders before it in the
+        list had already been submitted, carrying running buying power, reserved closing quantity and
+        pending sides per symbol through the batch, starting from the ledger.
+        '''
+        buying_power = self.account.buying_power
+        symbol_states = {} # Key is symbol. Value is (reserved closing quantity per side, sides with resting orders)
+        verdicts = []
+        for order in orders:
+            symbol = order.get_symbol()
+            side = order.get_side()
+            quantity = order.get_quantity()
+            state = symbol_states.get(symbol)
+            if state is None:
+                reserved = {s: self.ledger.reserved_close(symbol, s) for s in OrderSide}
+                pending_sides = {s for s in OrderSide if self.ledger.has_pending(symbol, s)}
+                state = symbol_states[symbol] = (reserved, pending_sides)
+            reserved, pending_sides = state
+
+            amount = 0
+            if quantity < 0:
+                open_position = self.account.get_open_position(symbol=symbol, side=side)
+                valid_order = open_position is not None and open_position.get_quantity() - reserved[side] >= -quantity
+                if valid_order:
+                    reserved[side] -= quantity
+            else:
+                opposite_side = OrderSide.SHORT if side == OrderSide.LONG else OrderSide.LONG
+                amount = self.account.notional(order)
+                valid_order = (opposite_side not in pending_sides and amount <= buying_power
+                               and self.account.get_open_position(symbol=symbol, side=opposite_side) is None)
+                if valid_order:
+                    buying_power -= amount
+            if valid_order:
+                pending_sides.add(side)
+            verdicts.append((valid_order, amount))
+        return verdicts
+
     def _generate_order_id(self) -> str:
         self.order_count += 1
         return 'X{}'.format(str(100000+self.order_count))
\ No newline at end of file
@@ -0,0 +1,57 @@
+from typing import List, Tuple
+from backtest.broker.order import Order, OrderType
+from backtest.broker.trigger_index import FILL_AT_OR_BELOW, trigger_direction
+import numpy as np
+
+NO_FILL = -1
+
+
+def simulate_fills(prices: np.ndarray, orders: List[Order]) -> Tuple[np.ndarray, np.ndarray]:
+    '''Compute where every resting order fills on a trade tape without a per tick loop.
+
+    All orders are assumed to be resting before the first trade of the tape. Fill rules follow
+    Broker._can_execute: a market order fills on the first trade, an order that fills at or below
+    its price fills on the first trade where the running minimum reaches it and an order that fills
+    at or above its price fills on the first trade where the running maximum reaches it.
+
+    Args:
+        prices (np.ndarray): Trade prices of one symbol in time order
+        orders (List[Order]): Resting orders of the same symbol
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Fill index into the tape (NO_FILL if the order never fills)
+        and fill price (NaN if the order never fills) of every order
+    '''
+    prices = np.asarray(prices, dtype=np.float64)
+    fill_index = np.full(len(orders), NO_FILL, dtype=np.int64)
+    fill_price = np.full(len(orders), np.nan)
+    if not len(prices) or not orders:
+        return fill_index, fill_price
+
+    below_orders, below_prices, above_orders, above_prices = [], [], [], []
+    for i, order in enumerate(orders):
+        if order.get_order_type() == OrderType.MARKET:
+            fill_index[i] = 0
+            continue
+        direction = trigger_direction(order)
+        if direction is None:
+            continue
+        if direction == FILL_AT_OR_BELOW:
+            below_orders.append(i)
+            below_prices.append(order.get_price())
+        else:
+            above_orders.append(i)
+            above_prices.append(order.get_price())
+
+    if below_orders:
+        # Negated running minimum is non-decreasing, so the first crossing is a binary search
+        running_min = np.minimum.accumulate(prices)
+        fill_index[below_orders] = np.searchsorted(-running_min, -np.asarray(below_prices, dtype=np.float64), side='left')
+    if above_orders:
+        running_max = np.maximum.accumulate(prices)
+        fill_index[above_orders] = np.searchsorted(running_max, np.asarray(above_prices, dtype=np.float64), side='left')
+
+    fill_index[fill_index >= len(prices)] = NO_FILL
+    filled = fill_index != NO_FILL
+    fill_price[filled] = prices[fill_index[filled]]
+    return fill_index, fill_price
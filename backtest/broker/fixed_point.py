@@ -0,0 +1,24 @@
+'''
+Integer money units of the optional fixed-point mode. Prices are integer ticks of 1e-4 dollars
+and cash is integer micro-dollars, so the notional of an order is exact integer arithmetic:
+quantity * ticks * MICROS_PER_TICK.
+'''
+TICKS_PER_DOLLAR = 10_000
+MICROS_PER_DOLLAR = 1_000_000
+MICROS_PER_TICK = MICROS_PER_DOLLAR // TICKS_PER_DOLLAR
+
+
+def to_ticks(price: float) -> int:
+    return round(price * TICKS_PER_DOLLAR)
+
+
+def from_ticks(ticks: int) -> float:
+    return ticks / TICKS_PER_DOLLAR
+
+
+def to_micros(amount: float) -> int:
+    return round(amount * MICROS_PER_DOLLAR)
+
+
+def from_micros(micros: int) -> float:
+    return micros / MICROS_PER_DOLLAR
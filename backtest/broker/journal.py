@@ -0,0 +1,134 @@
+from backtest.broker.order import Order, OrderSide, OrderType
+from typing import Callable, List, NamedTuple, Optional
+from loguru import logger
+from enum import Enum
+import numpy as np
+import pandas as pd
+
+DEFAULT_CAPACITY = 1 << 16
+
+
+class EventType(Enum):
+    ACCEPTED = 1
+    REJECTED = 2
+    FILLED = 3
+    CANCELED = 4
+
+
+class JournalEvent(NamedTuple):
+    timestamp: int # Timestamp of the trade being replayed when the event happened
+    event: EventType
+    order_id: str
+    symbol: str
+    side: OrderSide
+    order_type: OrderType
+    quantity: int
+    price: float # Order price, or execution price for FILLED
+
+
+class EventJournal(object):
+    '''
+    Structured audit trail of broker events stored in preallocated columns. With a capacity the
+    journal is a ring buffer that keeps the most recent events; without one it grows as needed.
+    Nothing is formatted as text unless a sink is attached, e.g. LoggingSink for loguru output.
+    A broker whose journal is None records nothing.
+    '''
+    def __init__(self, capacity: Optional[int] = DEFAULT_CAPACITY, sinks: List[Callable[[JournalEvent], None]] = None):
+        '''
+        Args:
+            capacity (Optional[int], optional): Number of events kept. None keeps every event. Defaults to DEFAULT_CAPACITY.
+            sinks (List[Callable[[JournalEvent], None]], optional): Called with every recorded event. Defaults to None.
+        '''
+        self.capacity = capacity
+        self.growable = capacity is None
+        size = capacity if capacity else 1024
+        self.timestamps = np.zeros(size, dtype=np.int64)
+        self.events = np.zeros(size, dtype=np.int8)
+        self.sides = np.zeros(size, dtype=np.int8)
+        self.order_types = np.zeros(size, dtype=np.int8)
+        self.quantities = np.zeros(size, dtype=np.int64)
+        self.prices = np.zeros(size, dtype=np.float64)
+        # Object columns only hold references to strings that already exist on the orders
+        self.order_ids = np.empty(size, dtype=object)
+        self.symbols = np.empty(size, dtype=object)
+        self.count = 0 # Total number of events ever recorded
+        self.sinks = list(sinks or [])
+
+    def __len__(self) -> int:
+        return min(self.count, len(self.timestamps))
+
+    @property
+    def dropped(self) -> int:
+        '''Number of events overwritten by the ring buffer.
+        '''
+        return self.count - len(self)
+
+    def add_sink(self, sink: Callable[[JournalEvent], None]) -> None:
+        self.sinks.append(sink)
+
+    def record(self, event: EventType, timestamp: int, order: Order, price: float) -> None:
+        size = len(self.timestamps)
+        if self.count == size and self.growable:
+            self._grow()
+            size = len(self.timestamps)
+        i = self.count % size
+        self.timestamps[i] = timestamp or 0
+        self.events[i] = event.value
+        self.sides[i] = order.side.value
+        self.order_types[i] = order.order_type.value
+        self.quantities[i] = order.quantity
+        self.prices[i] = price
+        self.order_ids[i] = order.id
+        self.symbols[i] = order.symbol
+        self.count += 1
+        if self.sinks:
+            journal_event = JournalEvent(timestamp, event, order.id, order.symbol, order.side, order.order_type, order.quantity, price)
+            for sink in self.sinks:
+                sink(journal_event)
+
+    def _grow(self) -> None:
+        for column in ('timestamps', 'events', 'sides', 'order_types', 'quantities', 'prices', 'order_ids', 'symbols'):
+            array = getattr(self, column)
+            grown = np.empty(len(array) * 2, dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, column, grown)
+
+    def _order(self) -> np.ndarray:
+        '''Row positions of the kept events from oldest to newest.
+        '''
+        size = len(self.timestamps)
+        if self.count <= size:
+            return np.arange(self.count)
+        start = self.count % size
+        return np.concatenate([np.arange(start, size), np.arange(start)])
+
+    def list_events(self) -> List[JournalEvent]:
+        return [JournalEvent(int(self.timestamps[i]), EventType(int(self.events[i])), self.order_ids[i], self.symbols[i],
+                             OrderSide(int(self.sides[i])), OrderType(int(self.order_types[i])), int(self.quantities[i]),
+                             float(self.prices[i]))
+                for i in self._order()]
+
+    def to_frame(self) -> pd.DataFrame:
+        rows = self._order()
+        return pd.DataFrame({
+            'timestamp': self.timestamps[rows],
+            'event': [EventType(e).name for e in self.events[rows]],
+            'order_id': self.order_ids[rows],
+            'symbol': self.symbols[rows],
+            'side': [OrderSide(s).name for s in self.sides[rows]],
+            'order_type': [OrderType(t).name for t in self.order_types[rows]],
+            'quantity': self.quantities[rows],
+            'price': self.prices[rows],
+        })
+
+
+class LoggingSink(object):
+    '''Human readable journal output through loguru.
+    '''
+    def __init__(self, level: str = 'INFO'):
+        self.level = level
+        self.logger = logger.bind(classname="Broker")
+
+    def __call__(self, event: JournalEvent) -> None:
+        self.logger.log(self.level, '{} {}: {} {} {} order of {} at {}', event.event.name, event.order_id,
+                        event.quantity, event.side.name, event.order_type.name, event.symbol, event.price)
@@ -1,5 +1,6 @@
 from enum import Enum
 from backtest.exceptions.broker_exception import BrokerException
+from backtest.broker.fixed_point import to_ticks
 
 
 class OrderType(Enum):
@@ -14,6 +15,8 @@ class OrderSide(Enum):
 
 
 class Order:
+    __slots__ = ('symbol', 'quantity', 'order_type', 'time_in_force', 'side', 'id', 'price', 'price_ticks')
+
     def __init__(self, symbol: str, quantity: int, order_type: OrderType, side: OrderSide, 
                  time_in_force: str = "GTC", stop_price: float = None, limit_price: float = None, market_price: float = None):
         self.symbol = symbol
@@ -35,6 +38,7 @@ class Order:
             self.price = limit_price
         else:
             self.price = market_price
+        self.price_ticks = to_ticks(self.price) # Price in integer ticks of the fixed-point mode
     
     def __str__(self):
         if self.order_type == OrderType.MARKET:
@@ -54,6 +58,11 @@ class Order:
     def get_price(self) -> float:
         return self.price
 
+    def get_price_ticks(self) -> int:
+        '''Price in integer ticks of the fixed-point mode.
+        '''
+        return self.price_ticks
+
     def get_side(self) -> OrderSide:
         return self.side
 
@@ -0,0 +1,361 @@
+from backtest.broker.fixed_point import to_ticks
+from backtest.broker.order import Order, OrderSide, OrderType
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import bisect
+import shutil
+import tempfile
+import weakref
+import os
+
+DEFAULT_CHUNK_SIZE = 1 << 16
+INITIAL_CAPACITY = 1024 # Rows of a new active chunk. Doubled up to chunk_size when full
+COLUMNS = {
+    'seqs': np.int64, # Submission sequence number in the order book
+    'statuses': np.int8,
+    'symbol_codes': np.int32,
+    'tif_codes': np.int32,
+    'sides': np.int8,
+    'order_types': np.int8,
+    'quantities': np.int64,
+    'prices': np.float64,
+}
+
+
+class SpillDirectory(object):
+    '''
+    Temporary directory holding the files of spilled chunks. Archives and chunks keep a reference
+    to it, and it is removed once none of them is left, so copies of an archive can keep reading
+    chunks spilled before the copy.
+    '''
+    def __init__(self, parent_dir: str):
+        os.makedirs(parent_dir, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix='orders-', dir=parent_dir)
+        self.files = 0 # Number of chunks written, used to name their files
+        weakref.finalize(self, shutil.rmtree, self.path, True)
+
+    def save(self, arrays: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        '''Write arrays one after the other, 8-byte aligned, to a single new file and return them as
+        views of one memory map of it, so a spilled chunk holds one file descriptor.
+        '''
+        path = os.path.join(self.path, '{}.bin'.format(self.files))
+        self.files += 1
+        offsets = {}
+        with open(path, 'wb') as f:
+            for name, array in arrays.items():
+                f.write(bytes(-f.tell() % 8))
+                offsets[name] = f.tell()
+                f.write(np.ascontiguousarray(array).tobytes())
+        data = np.memmap(path, dtype=np.uint8, mode='r')
+        return {name: data[offsets[name]:offsets[name] + array.nbytes].view(array.dtype) for name, array in arrays.items()}
+
+
+class ActiveChunk(object):
+    '''
+    Rows of the archive not sealed yet. Appends only ever add rows, so an archive and its copies
+    share the active chunk: each one knows how many of its rows it sees, and only the archive whose
+    rows end where the chunk's written rows end may append in place. Any other archive copies its
+    rows out before its first append.
+    '''
+    __slots__ = ('columns', 'ids', 'index', 'groups', 'used')
+
+    def __init__(self, capacity: int):
+        self.columns = {column: np.zeros(capacity, dtype=dtype) for column, dtype in COLUMNS.items()}
+        self.ids: List[str] = []
+        self.index: Dict[str, int] = {} # Key is order ID. Value is row in the chunk
+        self.groups: Dict[Tuple[int, int], List[int]] = {} # Key is (status, symbol code). Value is increasing rows
+        self.used = 0 # Rows written by any archive
+
+    def copy(self, size: int) -> 'ActiveChunk':
+        '''Private copy of the first size rows.
+        '''
+        chunk = ActiveChunk.__new__(ActiveChunk)
+        chunk.columns = {column: array.copy() for column, array in self.columns.items()}
+        chunk.ids = self.ids[:size]
+        chunk.index = {order_id: row for row, order_id in enumerate(chunk.ids)}
+        chunk.groups = {}
+        for key, rows in self.groups.items():
+            end = bisect.bisect_left(rows, size)
+            if end:
+                chunk.groups[key] = rows[:end]
+        chunk.used = size
+        return chunk
+
+
+class Chunk(object):
+    '''
+    Sealed rows of the archive. A chunk is never written to again, so it is shared by an archive
+    and all its copies. Besides the order columns it keeps its rows sorted by order ID, for lookups
+    by binary search, and sorted by (status, symbol code), for row lists of a status and symbol.
+    '''
+    __slots__ = ('start', 'size', 'columns', 'ids', 'id_order', 'min_id', 'max_id', 'group_rows', 'groups', 'spill')
+
+    def __init__(self, start: int, columns: Dict[str, np.ndarray], ids: List[str], spill: Optional[SpillDirectory]):
+        self.start = start # Row number of the first row in the archive
+        self.size = len(ids)
+        self.ids = np.array([order_id.encode() for order_id in ids]) # Fixed width bytes
+        self.id_order = np.argsort(self.ids, kind='stable').astype(np.int32)
+        self.min_id = bytes(self.ids[self.id_order[0]])
+        self.max_id = bytes(self.ids[self.id_order[-1]])
+        statuses, symbol_codes = columns['statuses'], columns['symbol_codes']
+        self.group_rows = np.lexsort((np.arange(self.size), symbol_codes, statuses)).astype(np.int32)
+        # Key is (status, symbol code). Value is the (start, end) slice of group_rows
+        self.groups: Dict[Tuple[int, int], Tuple[int, int]] = {}
+        sorted_statuses, sorted_symbols = statuses[self.group_rows], symbol_codes[self.group_rows]
+        changes = (sorted_statuses[1:] != sorted_statuses[:-1]) | (sorted_symbols[1:] != sorted_symbols[:-1])
+        boundaries = [0] + (np.flatnonzero(changes) + 1).tolist() + [self.size]
+        for begin, end in zip(boundaries, boundaries[1:]):
+            self.groups[(int(sorted_statuses[begin]), int(sorted_symbols[begin]))] = (begin, end)
+        self.columns = columns
+        self.spill = spill
+        if spill is not None:
+            spilled = spill.save(dict(columns, ids=self.ids, id_order=self.id_order, group_rows=self.group_rows))
+            self.ids = spilled.pop('ids')
+            self.id_order = spilled.pop('id_order')
+            self.group_rows = spilled.pop('group_rows')
+            self.columns = spilled
+
+    def find(self, key: bytes) -> int:
+        '''Row of the order ID in the chunk, or -1.
+        '''
+        i = int(np.searchsorted(self.ids, key, sorter=self.id_order))
+        if i < self.size:
+            row = int(self.id_order[i])
+            if self.ids[row] == key:
+                return row
+        return -1
+
+    def _slices(self, status: Optional[int], symbol_code: Optional[int]) -> List[Tuple[int, int]]:
+        if status is not None and symbol_code is not None:
+            group = self.groups.get((status, symbol_code))
+            return [group] if group else []
+        return [group for (group_status, group_symbol), group in self.groups.items()
+                if (status is None or group_status == status) and (symbol_code is None or group_symbol == symbol_code)]
+
+    def rows(self, status: Optional[int], symbol_code: Optional[int]) -> np.ndarray:
+        if status is None and symbol_code is None:
+            return np.arange(self.size, dtype=np.int64)
+        slices = self._slices(status, symbol_code)
+        rows = np.concatenate([self.group_rows[begin:end] for begin, end in slices]) if slices else np.zeros(0, dtype=np.int32)
+        if len(slices) > 1:
+            rows.sort()
+        return rows.astype(np.int64)
+
+    def count(self, status: Optional[int], symbol_code: Optional[int]) -> int:
+        if status is None and symbol_code is None:
+            return self.size
+        return sum(end - begin for begin, end in self._slices(status, symbol_code))
+
+
+class OrderArchive(object):
+    '''
+    Append-only columnar store of orders in a terminal status. Rows are appended to an active
+    chunk of numpy columns; a full chunk is sealed into an immutable Chunk and, with a spill
+    directory, written to one file and memory mapped back, IDs and lookup tables included, so
+    only the active chunk and a few values per chunk stay in memory.
+
+    Orders are found by ID with a dict over the active chunk and a binary search in the sealed
+    chunks whose ID range contains the ID. rows() reads per chunk row lists of every (status,
+    symbol), so its cost is proportional to the number of chunks and matching rows.
+
+    Statuses are stored as OrderStatus values, so the archive doesn't depend on the broker.
+    '''
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE, spill_dir: str = None):
+        '''
+        Args:
+            chunk_size (int, optional): Rows per chunk. Defaults to DEFAULT_CHUNK_SIZE.
+            spill_dir (str, optional): Directory sealed chunks are written to. Defaults to None (kept in memory).
+        '''
+        self.chunk_size = chunk_size
+        self.spill_dir = spill_dir
+        self.spill: Optional[SpillDirectory] = None # Created on first spill, shared with copies
+        self.chunks: List[Chunk] = []
+        self.starts: List[int] = [] # First row of every chunk
+        self.min_ids = np.zeros(0, dtype='S1') # ID range of every chunk
+        self.max_ids = np.zeros(0, dtype='S1')
+        self.active_start = 0 # First row of the active chunk
+        self._reset_active()
+        self.symbols = [] # Symbol of every symbol code
+        self.symbol_codes = {}
+        self.time_in_forces = []
+        self.tif_codes = {}
+
+    def _reset_active(self) -> None:
+        self.active = ActiveChunk(min(INITIAL_CAPACITY, self.chunk_size))
+        self.active_size = 0 # Rows of the active chunk that belong to this archive
+
+    def __len__(self) -> int:
+        return self.active_start + self.active_size
+
+    def __contains__(self, order_id: str) -> bool:
+        return self._active_row(order_id) >= 0 or self._find(order_id) >= 0
+
+    def _active_row(self, order_id: str) -> int:
+        '''Row of an order ID in the active chunk, or -1. Rows past active_size were appended by a copy.
+        '''
+        row = self.active.index.get(order_id, -1)
+        return row if row < self.active_size else -1
+
+    def _active_groups(self, status: Optional[int], symbol_code: Optional[int]) -> List[List[int]]:
+        '''Active chunk row lists of the groups matching status and symbol code, cut to this archive's rows.
+        '''
+        return [rows[:bisect.bisect_left(rows, self.active_size)] for (group_status, group_symbol), rows in self.active.groups.items()
+                if (status is None or group_status == status) and (symbol_code is None or group_symbol == symbol_code)]
+
+    @staticmethod
+    def _code(value, values: List, codes: Dict) -> int:
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    def append(self, order: Order, seq: int, status: int) -> None:
+        i = self.active_size
+        if self.active.used != i:
+            # A copy appended to the shared active chunk since the copy was made
+            self.active = self.active.copy(i)
+        active = self.active
+        chunk = active.columns
+        if i == len(chunk['seqs']):
+            for column, array in chunk.items():
+                grown = np.zeros(min(2 * len(array), self.chunk_size), dtype=array.dtype)
+                grown[:i] = array[:i]
+                chunk[column] = grown
+        symbol_code = self._code(order.symbol, self.symbols, self.symbol_codes)
+        chunk['seqs'][i] = seq
+        chunk['statuses'][i] = status
+        chunk['symbol_codes'][i] = symbol_code
+        chunk['tif_codes'][i] = self._code(order.time_in_force, self.time_in_forces, self.tif_codes)
+        chunk['sides'][i] = order.side.value
+        chunk['order_types'][i] = order.order_type.value
+        chunk['quantities'][i] = order.quantity
+        chunk['prices'][i] = order.price
+        active.ids.append(order.id)
+        active.index[order.id] = i
+        active.groups.setdefault((status, symbol_code), []).append(i)
+        active.used = self.active_size = i + 1
+        if i + 1 == self.chunk_size:
+            self._seal()
+
+    def _seal(self) -> None:
+        if not self.active_size:
+            return
+        if self.spill_dir is not None and self.spill is None:
+            self.spill = SpillDirectory(self.spill_dir)
+        # The full active chunk is never written again, copies that share it copy out before appending
+        chunk = Chunk(self.active_start, dict(self.active.columns), self.active.ids, self.spill)
+        self.chunks.append(chunk)
+        self.starts.append(chunk.start)
+        self.min_ids = np.append(self.min_ids, chunk.min_id)
+        self.max_ids = np.append(self.max_ids, chunk.max_id)
+        self.active_start += self.active_size
+        self._reset_active()
+
+    def _find(self, order_id: str) -> int:
+        '''Row of an order ID in the sealed chunks, or -1.
+        '''
+        if not self.chunks:
+            return -1
+        key = order_id.encode()
+        for number in np.flatnonzero((self.min_ids <= key) & (self.max_ids >= key)):
+            chunk = self.chunks[number]
+            row = chunk.find(key)
+            if row >= 0:
+                return chunk.start + row
+        return -1
+
+    def _symbol_code(self, symbol: Optional[str]) -> Optional[int]:
+        return None if symbol is None else self.symbol_codes.get(symbol, -1)
+
+    def rows(self, status: int = None, symbol: str = None) -> np.ndarray:
+        '''Row numbers of orders with the given status and symbol, in the order they were archived.
+        '''
+        symbol_code = self._symbol_code(symbol)
+        if symbol_code == -1:
+            return np.zeros(0, dtype=np.int64)
+        matches = [chunk.rows(status, symbol_code) + chunk.start for chunk in self.chunks]
+        if status is None and symbol_code is None:
+            active = np.arange(self.active_size, dtype=np.int64)
+        else:
+            active = np.array(sorted(row for rows in self._active_groups(status, symbol_code) for row in rows), dtype=np.int64)
+        matches.append(active + self.active_start)
+        return np.concatenate(matches)
+
+    def count(self, status: int = None, symbol: str = None) -> int:
+        '''Number of rows rows() would return, without building them.
+        '''
+        symbol_code = self._symbol_code(symbol)
+        if symbol_code == -1:
+            return 0
+        total = sum(chunk.count(status, symbol_code) for chunk in self.chunks)
+        if status is None and symbol_code is None:
+            return total + self.active_size
+        return total + sum(bisect.bisect_left(rows, self.active_size) for (group_status, group_symbol), rows in self.active.groups.items()
+                           if (status is None or group_status == status) and (symbol_code is None or group_symbol == symbol_code))
+
+    def _locate(self, row: int) -> Tuple[Dict[str, np.ndarray], List, int]:
+        if row >= self.active_start:
+            offset = row - self.active_start
+            return self.active.columns, self.active.ids, offset
+        chunk = self.chunks[bisect.bisect_right(self.starts, row) - 1]
+        return chunk.columns, chunk.ids, row - chunk.start
+
+    def get(self, order_id: str) -> Tuple[Order, int]:
+        '''Rebuild an archived order and return it with its status. Raises KeyError if the ID isn't archived.
+        '''
+        row = self._active_row(order_id)
+        if row >= 0:
+            return self.get_row(self.active_start + row)
+        row = self._find(order_id)
+        if row < 0:
+            raise KeyError(order_id)
+        return self.get_row(row)
+
+    def get_row(self, row: int) -> Tuple[Order, int]:
+        columns, ids, i = self._locate(row)
+        order = Order.__new__(Order)
+        order.symbol = self.symbols[columns['symbol_codes'][i]]
+        order.quantity = int(columns['quantities'][i])
+        order.order_type = OrderType(int(columns['order_types'][i]))
+        order.time_in_force = self.time_in_forces[columns['tif_codes'][i]]
+        order.side = OrderSide(int(columns['sides'][i]))
+        order_id = ids[i]
+        order.id = order_id.decode() if isinstance(order_id, bytes) else order_id
+        order.price = float(columns['prices'][i])
+        order.price_ticks = to_ticks(order.price)
+        return order, int(columns['statuses'][i])
+
+    def seq(self, row: int) -> int:
+        columns, _, i = self._locate(row)
+        return int(columns['seqs'][i])
+
+    def copy(self) -> 'OrderArchive':
+        '''Independent archive sharing every row archived so far, the active chunk included (see
+        ActiveChunk). The cost is proportional to the number of chunks, not of orders.
+        '''
+        archive = OrderArchive(self.chunk_size, self.spill_dir)
+        archive.spill = self.spill
+        archive.chunks = list(self.chunks)
+        archive.starts = list(self.starts)
+        archive.min_ids = self.min_ids
+        archive.max_ids = self.max_ids
+        archive.active_start = self.active_start
+        archive.active = self.active
+        archive.active_size = self.active_size
+        archive.symbols = list(self.symbols)
+        archive.symbol_codes = dict(self.symbol_codes)
+        archive.time_in_forces = list(self.time_in_forces)
+        archive.tif_codes = dict(self.tif_codes)
+        return archive
+
+    def close(self) -> None:
+        '''Drop every row. Spilled files are deleted once no copy of the archive still uses them.
+        '''
+        self.chunks = []
+        self.starts = []
+        self.min_ids = np.zeros(0, dtype='S1')
+        self.max_ids = np.zeros(0, dtype='S1')
+        self.active_start = 0
+        self._reset_active()
+        self.spill = None
@@ -0,0 +1,62 @@
+from collections import defaultdict
+from backtest.broker.order import Order, OrderSide
+from backtest.broker.fixed_point import MICROS_PER_TICK
+
+RESERVED_CLOSE = 0 # Shares committed to resting closing orders
+RESERVED_BUYING_POWER = 1 # Buying power withheld by resting opening orders, in account units
+PENDING_OPENS = 2 # Number of resting opening orders
+PENDING_CLOSES = 3 # Number of resting closing orders
+
+
+class ReservationLedger(object):
+    '''
+    Running aggregates of ACCEPTED orders per (symbol, side), kept in step with the order book by
+    the broker on submit, fill and cancel. Pre-trade checks read them in O(1) instead of scanning
+    resting orders.
+
+    In fixed-point mode reserved buying power is kept in integer micro-dollars, like the balance
+    and buying power of a FixedPointAccount.
+    '''
+    def __init__(self, fixed_point: bool = False):
+        self.fixed_point = fixed_point
+        empty_buying_power = 0 if fixed_point else 0.0
+        self.entries = defaultdict(lambda: [0, empty_buying_power, 0, 0]) # Key is (symbol, side)
+
+    def add_order(self, order: Order) -> None:
+        self._apply(order, 1)
+
+    def remove_order(self, order: Order) -> None:
+        '''Release the reservation of an order that was filled or canceled.
+        '''
+        self._apply(order, -1)
+
+    def _apply(self, order: Order, sign: int) -> None:
+        entry = self.entries[(order.get_symbol(), order.get_side())]
+        quantity = order.get_quantity()
+        if quantity < 0:
+            entry[RESERVED_CLOSE] -= sign * quantity
+            entry[PENDING_CLOSES] += sign
+        else:
+            if self.fixed_point:
+                entry[RESERVED_BUYING_POWER] += sign * quantity * order.get_price_ticks() * MICROS_PER_TICK
+            else:
+                entry[RESERVED_BUYING_POWER] += sign * quantity * order.get_price()
+            entry[PENDING_OPENS] += sign
+
+    def reserved_close(self, symbol: str, side: OrderSide) -> int:
+        entry = self.entries.get((symbol, side))
+        return entry[RESERVED_CLOSE] if entry else 0
+
+    def reserved_buying_power(self, symbol: str, side: OrderSide) -> float:
+        entry = self.entries.get((symbol, side))
+        return entry[RESERVED_BUYING_POWER] if entry else (0 if self.fixed_point else 0.0)
+
+    def pending_opens(self, symbol: str, side: OrderSide) -> int:
+        entry = self.entries.get((symbol, side))
+        return entry[PENDING_OPENS] if entry else 0
+
+    def has_pending(self, symbol: str, side: OrderSide) -> bool:
+        '''Whether any opening or closing order of the symbol and side is resting.
+        '''
+        entry = self.entries.get((symbol, side))
+        return bool(entry) and (entry[PENDING_OPENS] > 0 or entry[PENDING_CLOSES] > 0)
@@ -0,0 +1,167 @@
+import heapq
+from collections import defaultdict
+from typing import Dict, List, Tuple
+from backtest.broker.order import Order, OrderSide, OrderType
+
+
+# Direction in which the trade price has to cross the order price before the order fills.
+# Mirrors the decision tree in Broker._can_execute. Key is (side, is_opening, order_type)
+FILL_AT_OR_BELOW = 1 # order fills when trade.price <= order price
+FILL_AT_OR_ABOVE = 2 # order fills when trade.price >= order price
+TRIGGER_DIRECTION = {
+    (OrderSide.LONG, True, OrderType.LIMIT): FILL_AT_OR_BELOW,
+    (OrderSide.LONG, True, OrderType.STOP): FILL_AT_OR_ABOVE,
+    (OrderSide.LONG, False, OrderType.LIMIT): FILL_AT_OR_ABOVE,
+    (OrderSide.LONG, False, OrderType.STOP): FILL_AT_OR_BELOW,
+    (OrderSide.SHORT, True, OrderType.LIMIT): FILL_AT_OR_ABOVE,
+    (OrderSide.SHORT, True, OrderType.STOP): FILL_AT_OR_BELOW,
+    (OrderSide.SHORT, False, OrderType.LIMIT): FILL_AT_OR_BELOW,
+    (OrderSide.SHORT, False, OrderType.STOP): FILL_AT_OR_ABOVE,
+}
+
+
+def trigger_direction(order: Order) -> int:
+    '''Return the fill direction of a LIMIT or STOP order, or None if the order can never
+    be triggered by price (zero quantity).
+    '''
+    quantity = order.get_quantity()
+    if not quantity:
+        return None
+    return TRIGGER_DIRECTION[(order.get_side(), quantity > 0, order.get_order_type())]
+
+
+class TriggerIndex(object):
+    '''
+    Per symbol index of resting orders keyed by trigger price.
+
+    Orders that fill when price drops to their level live in a max-heap, orders that fill when
+    price rises to their level live in a min-heap, so each trade only pops the orders whose
+    threshold was crossed. Market orders fill on the next trade of the symbol regardless of price.
+    Removed orders are dropped lazily when they reach the top of a heap, and the heaps of a
+    symbol are compacted once its dead entries outnumber its live ones, so cancel churn can't
+    grow the heaps without bound.
+    '''
+    def __init__(self):
+        self.market_orders = defaultdict(dict) # Key is symbol
+        self.at_or_below = defaultdict(list) # Key is symbol. Heap of (-price, seq, order_id)
+        self.at_or_above = defaultdict(list) # Key is symbol. Heap of (price, seq, order_id)
+        self.live_orders: Dict[str, Tuple[int, Order]] = {} # Key is order ID
+        self.symbol_count = defaultdict(int) # Number of live orders per symbol
+        self.dead_count = defaultdict(int) # Number of heap entries of removed orders per symbol
+        self.seq = 0
+
+    def __len__(self) -> int:
+        return len(self.live_orders)
+
+    def __contains__(self, order_id: str) -> bool:
+        return order_id in self.live_orders
+
+    def add_order(self, order: Order) -> None:
+        order_id = order.get_order_id()
+        symbol = order.get_symbol()
+        self.seq += 1
+        if order.get_order_type() == OrderType.MARKET:
+            self.market_orders[symbol][order_id] = (self.seq, order)
+        else:
+            direction = trigger_direction(order)
+            if direction is None:
+                return
+            price = order.get_price()
+            if direction == FILL_AT_OR_BELOW:
+                heapq.heappush(self.at_or_below[symbol], (-price, self.seq, order_id))
+            else:
+                heapq.heappush(self.at_or_above[symbol], (price, self.seq, order_id))
+        self.live_orders[order_id] = (self.seq, order)
+        self.symbol_count[symbol] += 1
+
+    def remove_order(self, order_id: str) -> None:
+        entry = self.live_orders.pop(order_id, None)
+        if entry is not None:
+            order = entry[1]
+            symbol = order.get_symbol()
+            self.symbol_count[symbol] -= 1
+            if order.get_order_type() == OrderType.MARKET:
+                self.market_orders[symbol].pop(order_id, None)
+            else:
+                self.dead_count[symbol] += 1
+                if self.dead_count[symbol] > self.symbol_count[symbol]:
+                    self._compact(symbol)
+
+    def _is_live(self, entry: Tuple[float, int, str]) -> bool:
+        live = self.live_orders.get(entry[2])
+        return live is not None and live[0] == entry[1]
+
+    def _compact(self, symbol: str) -> None:
+        '''Rebuild the heaps of a symbol without the entries of removed orders.
+        '''
+        for heaps in (self.at_or_below, self.at_or_above):
+            heap = heaps.get(symbol)
+            if heap:
+                heap[:] = [entry for entry in heap if self._is_live(entry)]
+                heapq.heapify(heap)
+        self.dead_count[symbol] = 0
+
+    def _drop_dead_top(self, symbol: str, heap: list) -> None:
+        while heap and not self._is_live(heap[0]):
+            heapq.heappop(heap)
+            self.dead_count[symbol] -= 1
+
+    def has_orders(self, symbol: str) -> bool:
+        return self.symbol_count.get(symbol, 0) > 0
+
+    def next_trigger(self, symbol: str, rising: bool) -> float:
+        '''Peek the nearest trigger price a move in the given direction would reach first,
+        or None if no order of the symbol waits in that direction.
+        '''
+        if not self.symbol_count.get(symbol):
+            return None
+        if rising:
+            heap = self.at_or_above.get(symbol)
+            self._drop_dead_top(symbol, heap)
+            return heap[0][0] if heap else None
+        heap = self.at_or_below.get(symbol)
+        self._drop_dead_top(symbol, heap)
+        return -heap[0][0] if heap else None
+
+    def pop_triggered(self, symbol: str, price: float) -> List[Order]:
+        '''Remove and return every order of the symbol that a trade at the given price fills.
+
+        Args:
+            symbol (str): Trade symbol
+            price (float): Trade price
+
+        Returns:
+            List[Order]: Triggered orders in submission order
+        '''
+        triggered = []
+        if not self.symbol_count.get(symbol):
+            return triggered
+        market_orders = self.market_orders.get(symbol)
+        if market_orders:
+            triggered.extend(market_orders.values())
+            market_orders.clear()
+
+        heap = self.at_or_below.get(symbol)
+        while heap and -heap[0][0] >= price:
+            _, seq, order_id = heapq.heappop(heap)
+            entry = self.live_orders.get(order_id)
+            if entry is not None and entry[0] == seq:
+                triggered.append(entry)
+            else:
+                self.dead_count[symbol] -= 1
+        heap = self.at_or_above.get(symbol)
+        while heap and heap[0][0] <= price:
+            _, seq, order_id = heapq.heappop(heap)
+            entry = self.live_orders.get(order_id)
+            if entry is not None and entry[0] == seq:
+                triggered.append(entry)
+            else:
+                self.dead_count[symbol] -= 1
+
+        if not triggered:
+            return []
+        triggered.sort(key=lambda entry: entry[0])
+        for _, order in triggered:
+            del self.live_orders[order.get_order_id()]
+        self.symbol_count[symbol] -= len(triggered)
+        return [order for _, order in triggered]
@@ -1,8 +1,26 @@
-from typing import Callable, List, Type
-from data.fetcher.polygon_data_model import Trade
-from backtest.broker.broker import Broker
-from backtest.strategy.strategy import BaseStrategy
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Tuple, Type, Union
+from data.fetcher.polygon_data_model import Bar, Trade, TradeBatch
+from data.feed.trade_feed import DEFAULT_CHUNK_SIZE, TradeFeed, bars_from_frame, merge_feeds
+from data.feed.bar_aggregator import BarAggregator
+from backtest.analytics.profiler import BacktestProfiler
+from backtest.broker.broker import Broker, BrokerSnapshot, IntrabarPath
+from backtest.strategy.strategy import BaseStrategy, VectorizedStrategy
+from backtest.exceptions.ares_exception import AresException
 from loguru import logger
+from time import perf_counter_ns
+import heapq
+import numpy as np
+import pandas as pd
+
+class Participant(NamedTuple):
+    '''A strategy and its own broker replayed by Ares, with the callbacks the replay loop calls.
+    '''
+    strategy: BaseStrategy
+    broker: Broker
+    broker_on_trade: Callable[[Trade], None]
+    strategy_on_trade: Callable[[Trade], None]
+    strategy_on_bar: Callable[[Bar], None]
+
 
 class Ares(object):
     '''
@@ -11,21 +29,82 @@ class Ares(object):
     def __init__(self):
         self.broker_on_trade = None
         self.strategy_on_trade = None
+        self.strategy_on_bar = None
+        self.strategy = None
         self.data = None
+        self.batch = None # Materialized trade columns, built on demand for the timestamp index
+        self.signals_ready = False
+        self.bars = None
+        self.profiler = None
         self.symbol = None
         self.broker = None
+        self.participants: List[Participant] = [] # The configured strategy first, then strategies added with add_strategy
+        self.bar_aggregators: List[BarAggregator] = [] # Fed every replayed trade before brokers and strategies
         self.ending_cash = None
         
         self.logger = logger.bind(classname="Ares")
         
     def configure_backtest(self, broker_on_trade: Callable[[Trade], None],
                            strategy: Type[BaseStrategy],
-                           symbol: str, starting_cash: float = 30000) -> None:
-        self._register_broker_callback(broker_on_trade)
-        self._register_strategy_callback(strategy.on_trade)
+                           symbol: Union[str, List[str]], starting_cash: float = 30000, broker: Broker = None) -> None:
+        '''
+        Args:
+            broker_on_trade (Callable[[Trade], None]): Broker callback. Defaults to on_trade of the broker created here when None.
+            strategy (Type[BaseStrategy]): Strategy to backtest
+            symbol (Union[str, List[str]]): Symbol or basket of symbols to replay
+            starting_cash (float, optional): Defaults to 30000.
+            broker (Broker, optional): Broker to use instead of a new one with starting_cash, e.g. one
+                restored by Broker.from_snapshot. Defaults to None.
+        '''
         self.symbol = symbol
-        self.broker = Broker(starting_cash)
+        self.broker = broker if broker is not None else Broker(starting_cash)
+        self._register_broker_callback(broker_on_trade or self.broker.on_trade)
+        self.strategy = strategy
+        strategy_on_trade, self.strategy_on_bar = self._strategy_callbacks(strategy)
+        self._register_strategy_callback(strategy_on_trade)
         strategy.register_broker(self.broker)
+        self.participants = [Participant(strategy, self.broker, self.broker_on_trade, strategy_on_trade, self.strategy_on_bar)]
+
+    def add_strategy(self, strategy: BaseStrategy, starting_cash: float = 30000, broker: Broker = None) -> Broker:
+        '''Replay another strategy in the same pass as the configured one. It gets its own broker,
+        so accounts and order books stay isolated, while every trade is read once and handed to
+        every strategy. Call after configure_backtest.
+
+        Args:
+            strategy (BaseStrategy): Strategy to backtest alongside the others
+            starting_cash (float, optional): Defaults to 30000.
+            broker (Broker, optional): Broker to use instead of a new one with starting_cash. Defaults to None.
+
+        Returns:
+            Broker: The strategy's broker
+        '''
+        if not self.participants:
+            raise AresException('configure_backtest must be called before add_strategy')
+        broker = broker if broker is not None else Broker(starting_cash)
+        strategy.register_broker(broker)
+        strategy_on_trade, strategy_on_bar = self._strategy_callbacks(strategy)
+        self.participants.append(Participant(strategy, broker, broker.on_trade, strategy_on_trade, strategy_on_bar))
+        self.signals_ready = False
+        return broker
+
+    def add_bar_aggregator(self, aggregator: BarAggregator) -> BarAggregator:
+        '''Feed every replayed trade, warm-up included, to aggregator before brokers and strategies
+        see it, so a bar is delivered to its subscribers before the first trade of the next bar.
+        bark flushes the last bars at the end of the data; after replay call aggregator.flush()
+        once the last window is done.
+        '''
+        self.bar_aggregators.append(aggregator)
+        return aggregator
+
+    @staticmethod
+    def _strategy_callbacks(strategy: BaseStrategy) -> Tuple[Callable[[Trade], None], Callable[[Bar], None]]:
+        if isinstance(strategy, VectorizedStrategy):
+            # Vectorized strategies track the row index of the current event
+            return strategy.step_trade, strategy.step_bar
+        return strategy.on_trade, strategy.on_bar
+
+    def _vectorized_strategies(self) -> List[VectorizedStrategy]:
+        return [p.strategy for p in self.participants if isinstance(p.strategy, VectorizedStrategy)]
         
     def _register_broker_callback(self, on_trade: Callable[[Trade], None]) -> None:
         self.broker_on_trade = on_trade
@@ -33,17 +112,281 @@ class Ares(object):
     def _register_strategy_callback(self, on_trade: Callable[[Trade], None]) -> None:
         self.strategy_on_trade = on_trade
         
-    def load_data(self, data: List[Trade]) -> None:
-        self.data = data
+    def load_data(self, data: Union[Iterable[Trade], Dict[str, Iterable[Trade]]],
+                  chunk_size: int = DEFAULT_CHUNK_SIZE, prefetch: int = 0) -> None:
+        '''Load trade data for replay. Data is consumed lazily chunk by chunk, so memory stays
+        bounded by chunk size no matter how long the backtest runs.
+
+        Args:
+            data (Union[Iterable[Trade], Dict[str, Iterable[Trade]]]): A TradeFeed, a TradeBatch, a list of trades
+                or any iterator of trades, e.g. TradeFeed.from_polygon(fetcher.fetch_trades(...), symbol).
+                For a basket, a dict from symbol to such a source. Every source must be sorted by timestamp and
+                sources are merged lazily in global time order.
+            chunk_size (int, optional): Number of trades per chunk when data is not a TradeFeed. Defaults to DEFAULT_CHUNK_SIZE.
+            prefetch (int, optional): Number of chunks to read ahead in a background thread when data is not a TradeFeed. Defaults to 0.
+        '''
+        self.batch = None
+        self.signals_ready = False
+        if isinstance(data, dict):
+            self.data = {symbol: self._to_feed(source, chunk_size, prefetch) for symbol, source in data.items()}
+        else:
+            self.data = self._to_feed(data, chunk_size, prefetch)
+
+    @staticmethod
+    def _to_feed(data: Iterable[Trade], chunk_size: int, prefetch: int) -> TradeFeed:
+        if isinstance(data, TradeFeed):
+            return data
+        return TradeFeed.from_iterable(data, chunk_size=chunk_size, prefetch=prefetch)
+
+    def _trades(self) -> Iterator[Trade]:
+        if isinstance(self.data, dict):
+            return merge_feeds(self.data.values())
+        return self.data.trades()
     
     def bark(self):
         '''Main function to run the backtest
         '''
         logger.info("Starting replaying trade for {}".format(self.symbol))
-        for trade in self.data:
-            self.broker_on_trade(trade)
-            self.strategy_on_trade(trade)
-        
+        if self._vectorized_strategies():
+            self._init_trade_signals()
+            self._dispatch(self.batch)
+        else:
+            self._dispatch(self._trades())
+        for aggregator in self.bar_aggregators:
+            aggregator.flush()
+
+    def replay(self, start_ns: int = None, end_ns: int = None, warmup_ns: int = 0) -> None:
+        '''Replay only the trades in [start_ns, end_ns). The window is located by binary search on
+        the timestamp index, so the cost is proportional to the window, not to the loaded data.
+        Trades in the warm-up window [start_ns - warmup_ns, start_ns) are fed to the strategy only:
+        the broker doesn't fill orders and rejects orders submitted during warm-up.
+
+        Args:
+            start_ns (int, optional): First timestamp to replay, in nanoseconds. Defaults to the first trade.
+            end_ns (int, optional): Timestamp to stop at (exclusive), in nanoseconds. Defaults to after the last trade.
+            warmup_ns (int, optional): Length of the warm-up window in nanoseconds. Defaults to 0.
+        '''
+        timestamps = self.build_index()
+        start = 0 if start_ns is None else int(np.searchsorted(timestamps, start_ns, side='left'))
+        end = len(timestamps) if end_ns is None else int(np.searchsorted(timestamps, end_ns, side='left'))
+        warmup_start = start
+        if warmup_ns and start_ns is not None:
+            warmup_start = int(np.searchsorted(timestamps, start_ns - warmup_ns, side='left'))
+        logger.info("Starting replaying trade for {} from row {} to {}".format(self.symbol, start, end))
+        if self._vectorized_strategies():
+            self._init_trade_signals()
+            # Signals are indexed by row of the full data
+            for strategy in self._vectorized_strategies():
+                strategy.i = warmup_start - 1
+
+        if warmup_start < start:
+            for participant in self.participants:
+                participant.broker.trading_enabled = False
+                participant.strategy.warming_up = True
+            try:
+                callbacks = [aggregator.on_trade for aggregator in self.bar_aggregators]
+                callbacks += [participant.strategy_on_trade for participant in self.participants]
+                brokers = [participant.broker for participant in self.participants]
+                for trade in self.batch[warmup_start:start]:
+                    for broker in brokers:
+                        broker.last_timestamp = trade.timestamp
+                    for strategy_on_trade in callbacks:
+                        strategy_on_trade(trade)
+            finally:
+                for participant in self.participants:
+                    participant.broker.trading_enabled = True
+                    participant.strategy.warming_up = False
+        self._dispatch(self.batch[start:end])
+
+    def fork(self, snapshot: BrokerSnapshot, strategy: BaseStrategy) -> 'Ares':
+        '''New orchestrator over the same loaded data whose broker continues from snapshot, so
+        variants sharing a prefix only replay it once:
+
+            ares.replay(end_ns=fork_ns)
+            snapshot = ares.broker.snapshot()
+            for strategy in variants:
+                ares.fork(snapshot, strategy).replay(start_ns=fork_ns, warmup_ns=warmup_ns)
+
+        Trade data and the timestamp index are shared, not copied. Profiling is enabled on the fork
+        when it is enabled here. Strategies added with add_strategy and bar aggregators hold state
+        of this run that can't be carried over, so forking raises AresException when any is present;
+        fork each broker with Broker.from_snapshot and set the new run up instead.
+        '''
+        if len(self.participants) > 1 or self.bar_aggregators:
+            raise AresException('fork only supports a single strategy without bar aggregators')
+        self.build_index()
+        ares = Ares()
+        ares.configure_backtest(None, strategy, self.symbol, broker=Broker.from_snapshot(snapshot, self.broker.journal is not None))
+        ares.data = self.data
+        ares.batch = self.batch
+        ares.bars = self.bars
+        if self.profiler is not None:
+            ares.enable_profiling()
+        return ares
+
+    def build_index(self) -> np.ndarray:
+        '''Materialize the loaded trades into columns once and return the sorted timestamp index.
+        '''
+        if self.batch is None:
+            self.batch = self._materialize_trades()
+            self.data = TradeFeed.from_iterable(self.batch)
+        return self.batch.timestamps
+
+    def _lanes(self) -> List[Tuple[Callable[[str], bool], Callable[[Trade], None], Callable[[Trade], None], Broker]]:
+        '''(wants_trade, broker_on_trade, strategy_on_trade, broker) of every participant. wants_trade
+        is None for custom broker callbacks, which receive every trade.
+        '''
+        lanes = []
+        for participant in self.participants:
+            broker = getattr(participant.broker_on_trade, '__self__', None)
+            wants_trade = broker.wants_trade if isinstance(broker, Broker) else None
+            lanes.append((wants_trade, participant.broker_on_trade, participant.strategy_on_trade, participant.broker))
+        return lanes
+
+    def _dispatch(self, trades: Iterable[Trade]) -> None:
+        lanes = self._lanes()
+        if self.bar_aggregators:
+            trades = self._aggregated(trades)
+        if self.profiler is not None:
+            self._dispatch_profiled(trades, lanes)
+            return
+        # The broker clock follows the replay even when on_trade is skipped, so orders the strategy
+        # submits are journaled at the current trade
+        if len(lanes) == 1:
+            # Fast path: skip the broker for symbols without resting orders or positions
+            wants_trade, broker_on_trade, strategy_on_trade, broker = lanes[0]
+            for trade in trades:
+                if wants_trade is None or wants_trade(trade.symbol):
+                    broker_on_trade(trade)
+                broker.last_timestamp = trade.timestamp
+                strategy_on_trade(trade)
+            return
+        for trade in trades:
+            symbol = trade.symbol
+            timestamp = trade.timestamp
+            for wants_trade, broker_on_trade, strategy_on_trade, broker in lanes:
+                if wants_trade is None or wants_trade(symbol):
+                    broker_on_trade(trade)
+                broker.last_timestamp = timestamp
+                strategy_on_trade(trade)
+
+    def _aggregated(self, trades: Iterable[Trade]) -> Iterator[Trade]:
+        '''Pass trades through after feeding them to every bar aggregator.
+        '''
+        callbacks = [aggregator.on_trade for aggregator in self.bar_aggregators]
+        for trade in trades:
+            for on_trade in callbacks:
+                on_trade(trade)
+            yield trade
+
+    def _dispatch_profiled(self, trades: Iterable[Trade], lanes: List[Tuple[Callable[[str], bool], Callable[[Trade], None],
+                                                                             Callable[[Trade], None], Broker]]) -> None:
+        profiler = self.profiler
+        lanes = [(wants_trade, profiler.wrap('broker.on_trade', broker_on_trade), profiler.wrap('strategy.on_trade', strategy_on_trade), broker)
+                 for wants_trade, broker_on_trade, strategy_on_trade, broker in lanes]
+        ticks = 0
+        start = perf_counter_ns()
+        try:
+            for trade in trades:
+                profiler.tick_start_ns = perf_counter_ns()
+                for wants_trade, broker_on_trade, strategy_on_trade, broker in lanes:
+                    if wants_trade is None or wants_trade(trade.symbol):
+                        broker_on_trade(trade)
+                    broker.last_timestamp = trade.timestamp
+                    strategy_on_trade(trade)
+                ticks += 1
+        finally:
+            profiler.tick_start_ns = None
+            profiler.ticks += ticks
+            profiler.elapsed_ns += perf_counter_ns() - start
+
+    def enable_profiling(self, profiler: BacktestProfiler = None) -> BacktestProfiler:
+        '''Instrument the replay loop and the broker. Call after configure_backtest. The report is
+        available from profile_report once the replay is done.
+        '''
+        self.profiler = profiler or BacktestProfiler()
+        for participant in self.participants:
+            self.profiler.instrument_broker(participant.broker)
+        return self.profiler
+
+    def disable_profiling(self) -> None:
+        if self.profiler is not None:
+            self.profiler.detach()
+            self.profiler = None
+
+    def profile_report(self) -> Dict:
+        return self.profiler.report() if self.profiler is not None else {}
+
+    def _materialize_trades(self) -> TradeBatch:
+        chunks = list(self.data) if isinstance(self.data, TradeFeed) else None
+        if chunks is not None and all(isinstance(chunk, TradeBatch) and chunk.symbols == chunks[0].symbols for chunk in chunks):
+            if not chunks:
+                return TradeBatch([], [], [], [], [])
+            return TradeBatch(np.concatenate([c.timestamps for c in chunks]), np.concatenate([c.prices for c in chunks]),
+                              np.concatenate([c.sizes for c in chunks]), np.concatenate([c.symbol_ids for c in chunks]),
+                              chunks[0].symbols)
+        trades = self._trades() if chunks is None else (trade for chunk in chunks for trade in chunk)
+        return TradeBatch.from_trades(trades)
+
+    def _init_trade_signals(self) -> None:
+        '''Hand the materialized trade columns to the init of every vectorized strategy. Replays then
+        read from the materialized columns, so single pass sources are read only once.
+        '''
+        self.build_index()
+        if self.signals_ready:
+            return
+        batch = self.batch
+        data = pd.DataFrame({
+            'symbol': np.asarray(batch.symbols, dtype=object)[batch.symbol_ids],
+            'timestamp': batch.timestamps,
+            'price': batch.prices,
+            'quantity': batch.sizes,
+        })
+        for strategy in self._vectorized_strategies():
+            strategy.init_signals(data)
+        self.signals_ready = True
+
+    def load_bars(self, bars: Union[pd.DataFrame, List[Bar], Dict[str, Union[pd.DataFrame, List[Bar]]]]) -> None:
+        '''Load OHLCV bars for bar replay mode.
+
+        Args:
+            bars (Union[pd.DataFrame, List[Bar], Dict[str, Union[pd.DataFrame, List[Bar]]]]): Bars of the configured
+                symbol, e.g. from DataUtils.resample_xmin_bars, or a dict from symbol to bars for a basket.
+                Bars of every symbol must be sorted by timestamp.
+        '''
+        if not isinstance(bars, dict):
+            bars = {self.symbol: bars}
+        self.bars = {symbol: bars_from_frame(data, symbol) if isinstance(data, pd.DataFrame) else data
+                     for symbol, data in bars.items()}
+
+    def bark_bars(self, path: IntrabarPath = IntrabarPath.OHLC) -> None:
+        '''Run the backtest on bars instead of ticks. Resting orders are filled against each bar with
+        the given intrabar path assumption, then the strategy receives the bar through on_bar.
+
+        Args:
+            path (IntrabarPath, optional): Intrabar path assumption. Defaults to IntrabarPath.OHLC.
+        '''
+        logger.info("Starting replaying bars for {}".format(self.symbol))
+        bars = list(heapq.merge(*self.bars.values(), key=lambda bar: bar.timestamp))
+        vectorized_strategies = self._vectorized_strategies()
+        if vectorized_strategies:
+            data = pd.DataFrame.from_records([bar.to_dict() for bar in bars],
+                                             columns=['symbol', 'timestamp', 'open', 'high', 'low', 'close', 'v', 'vw'])
+            for strategy in vectorized_strategies:
+                strategy.init_signals(data)
+        lanes = []
+        for participant in self.participants:
+            account = participant.broker.account
+            # Equity history with SAMPLE_ON_BAR_CLOSE records once per bar after the strategy has seen it
+            on_bar_close = account.equity_history is not None and account.equity_history.interval_ns is None
+            lanes.append((participant.broker.on_bar, participant.strategy_on_bar, account if on_bar_close else None))
+        for bar in bars:
+            for broker_on_bar, strategy_on_bar, account in lanes:
+                broker_on_bar(bar, path)
+                strategy_on_bar(bar)
+                if account is not None:
+                    account.record_equity(bar.timestamp)
+
     def plot(self) -> None:
         pass
     
@@ -1,23 +1,85 @@
 from abc import ABC, abstractmethod
 from backtest.broker.broker import Broker
+from backtest.exceptions.ares_exception import AresException
+import numpy as np
+import pandas as pd
 
 class BaseStrategy(ABC):
     def __init__(self):
         self.broker = None
+        self.warming_up = False # True while Ares feeds the warm-up window, orders are rejected
         
     @abstractmethod
     def on_trade(self):
         """
-        Main strategy runtime method, called as each new
-        `backtesting.backtesting.Strategy.data`
-        instance (row; full candlestick bar) becomes available.
-        This is the main method where strategy decisions
-        upon data precomputed in `backtesting.backtesting.Strategy.init`
-        take place.
-        If you extend composable strategies from `backtesting.lib`,
-        make sure to call:
-            super().next()
+        Main strategy runtime method, called by `Ares.bark` with each
+        trade after the broker had a chance to fill resting orders.
+        This is the main method where strategy decisions take place.
+        Strategies that derive from `VectorizedStrategy` can read signals
+        precomputed in `VectorizedStrategy.init` here.
         """
     
+    def on_bar(self, bar) -> None:
+        """
+        Called with each completed bar in bar replay mode, after the broker
+        has filled resting orders against the bar. Orders submitted here
+        rest until the next bar. No-op by default.
+        """
+
     def register_broker(self, broker: Broker) -> None:
-        self.broker = broker
\ No newline at end of file
+        self.broker = broker
+
+
+class VectorizedStrategy(BaseStrategy):
+    """
+    Strategy whose indicators are computed once over the whole dataset
+    before the replay starts. Override `init` to compute signal columns
+    with NumPy/pandas and register them with `add_signal`. During the
+    replay `self.i` is the row of the current event, so `on_trade` or
+    `on_bar` reads precomputed values with `self.signals[name][self.i]`
+    or `self.signal(name)` instead of recomputing rolling windows per tick.
+
+    In tick mode `data` has columns symbol, timestamp, price and quantity
+    with one row per trade. In bar mode it has columns symbol, timestamp,
+    open, high, low, close, v and vw with one row per bar. Rows are in
+    replay order.
+    """
+    def __init__(self):
+        super().__init__()
+        self.data = None
+        self.signals = {}
+        self.i = -1
+
+    def init(self, data: pd.DataFrame) -> None:
+        """
+        Precompute signals over the whole dataset. No-op by default.
+        """
+
+    def on_trade(self, trade) -> None:
+        pass
+
+    def add_signal(self, name: str, values) -> np.ndarray:
+        values = np.asarray(values)
+        if len(values) != len(self.data):
+            raise AresException('Signal {} has {} rows but data has {}'.format(name, len(values), len(self.data)))
+        self.signals[name] = values
+        return values
+
+    def signal(self, name: str):
+        return self.signals[name][self.i]
+
+    def init_signals(self, data: pd.DataFrame) -> None:
+        '''Called by Ares before the replay starts.
+        '''
+        self.data = data
+        self.signals = {}
+        self.i = -1
+        self.init(data)
+
+    def step_trade(self, trade) -> None:
+        self.i += 1
+        self.on_trade(trade)
+
+    def step_bar(self, bar) -> None:
+        self.i += 1
+        self.on_bar(bar)
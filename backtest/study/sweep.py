@@ -0,0 +1,159 @@
+from backtest.broker.broker import Broker, OrderStatus
+from backtest.orchestrator.orchestrator import Ares
+from backtest.strategy.strategy import BaseStrategy
+from data.fetcher.polygon_data_model import TradeBatch
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from itertools import product
+import numpy as np
+
+COLUMNS = ('timestamps', 'prices', 'sizes', 'symbol_ids')
+_attached_segments = [] # Keeps shared memory mapped for the lifetime of a worker process
+
+
+class SharedTradeData(object):
+    '''
+    Tick columns of a TradeBatch copied once into shared memory so that sweep workers can map
+    them without re-reading or unpickling the data. The owner must call close() (or use the
+    object as a context manager) to release the memory.
+    '''
+    def __init__(self, batch: TradeBatch):
+        self.symbols = list(batch.symbols)
+        self.length = len(batch)
+        self.segments = {}
+        self.descriptor = {'symbols': self.symbols, 'length': self.length, 'columns': {}}
+        for column in COLUMNS:
+            array = getattr(batch, column)
+            segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[:] = array
+            self.segments[column] = segment
+            self.descriptor['columns'][column] = (segment.name, array.dtype.str)
+
+    def __enter__(self) -> 'SharedTradeData':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        for segment in self.segments.values():
+            segment.close()
+            segment.unlink()
+        self.segments = {}
+
+    @staticmethod
+    def attach(descriptor: Dict) -> TradeBatch:
+        '''Map the shared columns described by descriptor into a TradeBatch without copying.
+        Segments stay mapped for the lifetime of the process.
+        '''
+        columns = {}
+        segments = []
+        for column, (name, dtype) in descriptor['columns'].items():
+            segment = shared_memory.SharedMemory(name=name)
+            segments.append(segment)
+            columns[column] = np.ndarray((descriptor['length'],), dtype=np.dtype(dtype), buffer=segment.buf)
+        batch = TradeBatch(columns['timestamps'], columns['prices'], columns['sizes'], columns['symbol_ids'], descriptor['symbols'])
+        _attached_segments.extend(segments)
+        return batch
+
+
+def expand_grid(param_grid: Dict[str, Iterable]) -> List[Dict[str, Any]]:
+    '''Expand {name: values} into the list of every parameter combination.
+    '''
+    names = list(param_grid)
+    return [dict(zip(names, values)) for values in product(*(param_grid[name] for name in names))]
+
+
+def summarize(broker: Broker, last_prices: Dict[str, float]) -> Dict[str, Any]:
+    '''Collect final balances, fills and an equity summary of a finished backtest.
+    '''
+    account = broker.account
+    for symbol, price in last_prices.items():
+        account.mark(symbol, price)
+    return {
+        'balance': account.get_balance(),
+        'buying_power': account.get_buying_power(),
+        'fills': broker.order_book.count_orders(OrderStatus.FILLED),
+        'rejected': broker.order_book.count_orders(OrderStatus.REJECTED),
+        'realized_profit': sum(p.get_realized_profit() for p in account.list_closed_positions()),
+        'open_positions': len(account.list_open_positions()),
+        'equity': account.get_equity(),
+    }
+
+
+def run_backtest(batch: TradeBatch, strategy_factory: Callable[..., BaseStrategy], params: Dict[str, Any],
+                 starting_cash: float) -> Dict[str, Any]:
+    '''Run a single backtest of strategy_factory(**params) over batch and summarize it.
+    '''
+    strategy = strategy_factory(**params)
+    ares = Ares()
+    ares.configure_backtest(None, strategy, batch.symbols, starting_cash)
+    ares.load_data(batch)
+    ares.bark()
+    last_prices = {}
+    for symbol_id, symbol in enumerate(batch.symbols):
+        rows = np.flatnonzero(batch.symbol_ids == symbol_id)
+        if len(rows):
+            last_prices[symbol] = float(batch.prices[rows[-1]])
+    result = summarize(ares.broker, last_prices)
+    result['params'] = params
+    return result
+
+
+_worker_batch: Optional[TradeBatch] = None
+
+
+def _init_worker(descriptor: Dict) -> None:
+    global _worker_batch
+    _worker_batch = SharedTradeData.attach(descriptor)
+
+
+def _run_in_worker(strategy_factory: Callable[..., BaseStrategy], params: Dict[str, Any], starting_cash: float) -> Dict[str, Any]:
+    return run_backtest(_worker_batch, strategy_factory, params, starting_cash)
+
+
+class ParameterSweep(object):
+    '''
+    Run one backtest per parameter combination across a process pool. Tick data is placed in
+    shared memory once and every worker builds its own Broker and strategy.
+
+    Example:
+        sweep = ParameterSweep(ConsolidationBreakoutStrategy, batch, starting_cash=100000)
+        results = sweep.run({'period': [3, 5], 'risk_reward_ratio': [1.3, 2.0]})
+    '''
+    def __init__(self, strategy_factory: Callable[..., BaseStrategy], data: TradeBatch,
+                 starting_cash: float = 30000, processes: int = None):
+        '''
+        Args:
+            strategy_factory (Callable[..., BaseStrategy]): Picklable callable, usually the strategy class,
+                that builds a strategy from one parameter combination
+            data (TradeBatch): Tick data shared by every backtest, sorted by timestamp
+            starting_cash (float, optional): Defaults to 30000.
+            processes (int, optional): Pool size. Defaults to the number of CPUs. 1 runs in process.
+        '''
+        self.strategy_factory = strategy_factory
+        self.data = data
+        self.starting_cash = starting_cash
+        self.processes = processes
+
+    def run(self, param_grid: Dict[str, Iterable] = None, combinations: List[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        '''Run the sweep.
+
+        Args:
+            param_grid (Dict[str, Iterable], optional): Values to try per parameter. Every combination is run.
+            combinations (List[Dict[str, Any]], optional): Explicit list of parameter combinations.
+
+        Returns:
+            List[Dict[str, Any]]: One summary per combination, in the same order
+        '''
+        if combinations is None:
+            combinations = expand_grid(param_grid or {})
+        if self.processes == 1:
+            return [run_backtest(self.data, self.strategy_factory, params, self.starting_cash) for params in combinations]
+        with SharedTradeData(self.data) as shared:
+            with ProcessPoolExecutor(max_workers=self.processes, initializer=_init_worker,
+                                     initargs=(shared.descriptor,)) as pool:
+                futures = [pool.submit(_run_in_worker, self.strategy_factory, params, self.starting_cash)
+                           for params in combinations]
+                return [future.result() for future in futures]
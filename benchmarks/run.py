@@ -0,0 +1,228 @@
+'''Benchmark suite for the broker, the replay loop and the data utilities.
+
+Everything runs on synthetic data without network access. Results are written as JSON so two
+runs on the same machine can be compared:
+
+    python -m benchmarks.run --output before.json
+    python -m benchmarks.run --output after.json --compare before.json
+'''
+from benchmarks import synthetic
+from backtest.broker.broker import Broker
+from backtest.broker.order import Order, OrderSide, OrderType
+from backtest.orchestrator.orchestrator import Ares
+from backtest.strategy.strategy import BaseStrategy
+from data.feed.bar_aggregator import BarAggregator
+from utils.time_utils import Utility
+from typing import Any, Callable, Dict, List
+from time import perf_counter
+from loguru import logger
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+
+
+class IdleStrategy(BaseStrategy):
+    def on_trade(self, trade):
+        pass
+
+
+def timeit(fn: Callable[[], Any], repeat: int, setup: Callable[[], Any] = None) -> List[float]:
+    '''Run fn repeat times and return the wall time of each run. setup runs untimed before each run
+    and its result is passed to fn.
+    '''
+    timings = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = perf_counter()
+        fn(arg) if setup else fn()
+        timings.append(perf_counter() - start)
+    return timings
+
+
+def result(name: str, params: Dict[str, Any], timings: List[float], ops: int) -> Dict[str, Any]:
+    best = min(timings)
+    return {
+        'name': name,
+        'params': params,
+        'repeat': len(timings),
+        'best_s': best,
+        'mean_s': sum(timings) / len(timings),
+        'ops': ops,
+        'ops_per_sec': ops / best if best else None,
+    }
+
+
+def resting_broker(resting: int) -> Broker:
+    broker = Broker(initial_balance=1e12)
+    for i in range(resting):
+        # Grid of buy limits below the market that the benchmark tape never reaches
+        broker.submit_order(Order(symbol='AMD', side=OrderSide.LONG, order_type=OrderType.LIMIT, quantity=1,
+                                  limit_price=round(50.0 - (i % 1000) * 0.01, 2)))
+    return broker
+
+
+def bench_broker(resting_counts: List[int], ticks: int, repeat: int) -> List[Dict[str, Any]]:
+    results = []
+    trades = synthetic.trade_list(ticks)
+    for resting in resting_counts:
+        order = lambda: Order(symbol='AMD', side=OrderSide.LONG, order_type=OrderType.LIMIT, quantity=1, limit_price=40.0)
+        timings = timeit(lambda broker: [broker.submit_order(order()) for _ in range(1000)], repeat,
+                         setup=lambda: resting_broker(resting))
+        results.append(result('broker.submit_order', {'resting_orders': resting}, timings, 1000))
+
+        def on_trades(broker):
+            for trade in trades:
+                broker.on_trade(trade)
+        timings = timeit(on_trades, repeat, setup=lambda: resting_broker(resting))
+        results.append(result('broker.on_trade', {'resting_orders': resting, 'ticks': ticks}, timings, ticks))
+    return results
+
+
+def bench_bark(ticks: int, repeat: int) -> List[Dict[str, Any]]:
+    batch = synthetic.trade_batch(ticks)
+
+    def setup():
+        ares = Ares()
+        ares.configure_backtest(None, IdleStrategy(), 'AMD')
+        ares.load_data(batch)
+        return ares
+    timings = timeit(lambda ares: ares.bark(), repeat, setup=setup)
+    results = [result('ares.bark', {'ticks': ticks}, timings, ticks)]
+
+    # Same tape as a list of Trade objects, the reference the batch path must keep up with
+    trades = synthetic.trade_list(ticks)
+
+    def setup_from_list():
+        ares = Ares()
+        ares.configure_backtest(None, IdleStrategy(), 'AMD')
+        ares.load_data(trades)
+        return ares
+    timings = timeit(lambda ares: ares.bark(), repeat, setup=setup_from_list)
+    results.append(result('ares.bark', {'ticks': ticks, 'source': 'list'}, timings, ticks))
+
+    def setup_indexed():
+        ares = setup()
+        ares.build_index()
+        return ares
+    timings = timeit(lambda ares: ares.replay(), repeat, setup=setup_indexed)
+    results.append(result('ares.replay', {'ticks': ticks}, timings, ticks))
+
+    def setup_with_bars():
+        ares = setup()
+        aggregator = ares.add_bar_aggregator(BarAggregator())
+        for multiplier in (1, 5, 15, 30):
+            aggregator.subscribe(multiplier, ares.strategy.on_bar)
+        return ares
+    timings = timeit(lambda ares: ares.bark(), repeat, setup=setup_with_bars)
+    results.append(result('ares.bark', {'ticks': ticks, 'bar_sizes': 4}, timings, ticks))
+    return results
+
+
+def bench_data_utils(ticks: int, repeat: int) -> List[Dict[str, Any]]:
+    from utils.data_utils import DataUtils
+    trades = synthetic.polygon_trades(ticks)
+    timings = timeit(lambda: DataUtils.import_data_from_iter(iter(trades), 'AMD'), repeat)
+    results = [result('data_utils.import_data_from_iter', {'ticks': ticks}, timings, ticks)]
+    frame = synthetic.trade_frame(ticks)
+    for multiplier in (1, 5):
+        timings = timeit(lambda: DataUtils.resample_xmin_bars(frame, multiplier), repeat)
+        results.append(result('data_utils.resample_xmin_bars', {'ticks': ticks, 'multiplier': multiplier}, timings, ticks))
+    timings = timeit(lambda: DataUtils.resample_bars(frame), repeat)
+    results.append(result('data_utils.resample_bars', {'ticks': ticks, 'multipliers': 4}, timings, ticks))
+    return results
+
+
+def bench_time_utils(calls: int, repeat: int) -> List[Dict[str, Any]]:
+    timings = timeit(lambda: [Utility.datetime_str_to_nanoseconds('2023-03-20T09:30:00') for _ in range(calls)], repeat)
+    return [result('utility.datetime_str_to_nanoseconds', {'calls': calls}, timings, calls)]
+
+
+def bench_segment_images(images: int, repeat: int) -> List[Dict[str, Any]]:
+    from train.pattern_recognition.segementation_generation import SegmentImageGenerator
+    segment_size = 30
+    generator = SegmentImageGenerator(synthetic.bar_frame(segment_size + images))
+    with tempfile.TemporaryDirectory() as output_dir:
+        timings = timeit(lambda: [generator._generate_candlestick_image(start, segment_size, output_dir)
+                                  for start in range(images)], repeat)
+    return [result('segment_image_generator', {'images': images, 'segment_size': segment_size}, timings, images)]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(quick: bool = False, repeat: int = 3) -> Dict[str, Any]:
+    ticks = 20000 if quick else 1000000
+    suites = [
+        ('broker', lambda: bench_broker([10, 100, 10000], 2000 if quick else 100000, repeat)),
+        ('bark', lambda: bench_bark(ticks, repeat)),
+        ('data_utils', lambda: bench_data_utils(ticks, repeat)),
+        ('time_utils', lambda: bench_time_utils(1000 if quick else 10000, repeat)),
+        ('segment_images', lambda: bench_segment_images(2 if quick else 20, 1)),
+    ]
+    benchmarks, skipped = [], {}
+    for suite, fn in suites:
+        try:
+            benchmarks.extend(fn())
+        except ImportError as e:
+            # Optional dependencies (e.g. plotly image export) may be missing on a benchmark machine
+            skipped[suite] = str(e)
+    return {
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'commit': git_commit(),
+        'machine': {'platform': platform.platform(), 'python': sys.version.split()[0], 'processor': platform.processor()},
+        'quick': quick,
+        'benchmarks': benchmarks,
+        'skipped': skipped,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    '''One line per benchmark present in both runs with the speedup of current over baseline.
+    '''
+    key = lambda b: (b['name'], json.dumps(b['params'], sort_keys=True))
+    previous = {key(b): b for b in baseline['benchmarks']}
+    lines = []
+    for bench in current['benchmarks']:
+        before = previous.get(key(bench))
+        if before:
+            lines.append('{:<40} {:<45} {:>10.4f}s -> {:>10.4f}s  x{:.2f}'.format(
+                bench['name'], json.dumps(bench['params'], sort_keys=True), before['best_s'], bench['best_s'],
+                before['best_s'] / bench['best_s'] if bench['best_s'] else float('inf')))
+    return lines
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default='benchmark_results.json', help='Where to write the JSON results')
+    parser.add_argument('--compare', help='JSON results of a previous run to compare against')
+    parser.add_argument('--quick', action='store_true', help='Small inputs, for smoke testing the suite')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--with-logging', action='store_true', help='Keep loguru sinks enabled while timing')
+    args = parser.parse_args(argv)
+
+    if not args.with_logging:
+        logger.remove()
+    results = run(quick=args.quick, repeat=args.repeat)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    for bench in results['benchmarks']:
+        print('{:<40} {:<45} {:>10.4f}s  {:>14,.0f} ops/s'.format(
+            bench['name'], json.dumps(bench['params'], sort_keys=True), bench['best_s'], bench['ops_per_sec'] or 0))
+    for suite, reason in results['skipped'].items():
+        print('skipped {}: {}'.format(suite, reason))
+    if args.compare:
+        with open(args.compare) as f:
+            for line in compare(results, json.load(f)):
+                print(line)
+
+
+if __name__ == '__main__':
+    main()
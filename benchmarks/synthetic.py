@@ -0,0 +1,63 @@
+from data.fetcher.polygon_data_model import Trade, TradeBatch
+from typing import List
+import numpy as np
+import pandas as pd
+
+SESSION_START_NS = 1679578200000000000 # 2023-03-23T09:30:00-04:00
+SESSION_LENGTH_NS = 6 * 3600 * 10**9 + 30 * 60 * 10**9
+
+
+class PolygonTrade(object):
+    '''Stand-in for polygon.rest.models.Trade with the fields DataUtils reads.
+    '''
+    __slots__ = ('sip_timestamp', 'price', 'size')
+
+    def __init__(self, sip_timestamp, price, size):
+        self.sip_timestamp = sip_timestamp
+        self.price = price
+        self.size = size
+
+
+def tick_arrays(n: int, seed: int = 0, start_price: float = 80.0):
+    '''Random walk tick tape spread over one regular session. Returns timestamps, prices, sizes.
+    '''
+    rng = np.random.default_rng(seed)
+    timestamps = SESSION_START_NS + np.sort(rng.integers(0, SESSION_LENGTH_NS, n))
+    prices = np.round(start_price + np.cumsum(rng.normal(0, 0.01, n)), 2)
+    sizes = rng.integers(1, 500, n).astype(np.int32)
+    return timestamps, prices, sizes
+
+
+def trade_batch(n: int, symbol: str = 'AMD', seed: int = 0) -> TradeBatch:
+    return TradeBatch.from_arrays(symbol, *tick_arrays(n, seed))
+
+
+def trade_list(n: int, symbol: str = 'AMD', seed: int = 0) -> List[Trade]:
+    timestamps, prices, sizes = tick_arrays(n, seed)
+    return [Trade(symbol, ts, price, size) for ts, price, size in zip(timestamps.tolist(), prices.tolist(), sizes.tolist())]
+
+
+def polygon_trades(n: int, seed: int = 0) -> List[PolygonTrade]:
+    timestamps, prices, sizes = tick_arrays(n, seed)
+    return [PolygonTrade(ts, price, size) for ts, price, size in zip(timestamps.tolist(), prices.tolist(), sizes.tolist())]
+
+
+def trade_frame(n: int, symbol: str = 'AMD', seed: int = 0) -> pd.DataFrame:
+    timestamps, prices, sizes = tick_arrays(n, seed)
+    return pd.DataFrame({'symbol': symbol, 'timestamp': timestamps, 'price': prices, 'quantity': sizes})
+
+
+def bar_frame(n: int, seed: int = 0) -> pd.DataFrame:
+    '''1-minute OHLC bars indexed like the CSVs SegmentImageGenerator reads.
+    '''
+    rng = np.random.default_rng(seed)
+    close = 80 + np.cumsum(rng.normal(0, 0.05, n))
+    open_ = np.concatenate([[80.0], close[:-1]])
+    spread = np.abs(rng.normal(0, 0.05, n))
+    return pd.DataFrame({
+        'timestamp': pd.date_range('2023-03-23 09:30', periods=n, freq='1min', tz='America/New_York'),
+        'open': open_,
+        'close': close,
+        'high': np.maximum(open_, close) + spread,
+        'low': np.minimum(open_, close) - spread,
+    })
@@ -0,0 +1,95 @@
+from data.fetcher.polygon_data_model import Bar, Trade
+from typing import Callable, Dict, List
+import pandas as pd
+
+MARKET_TZ = 'America/New_York'
+NANOSECONDS_PER_MINUTE = 60 * 10**9
+
+# Fields of the running state of one bar, kept in a list per (symbol, bar size)
+BUCKET, OPEN, HIGH, LOW, CLOSE, VOLUME, PRICE_VOLUME = range(7)
+
+
+class BarAggregator(object):
+    '''
+    Incremental bar builder for tick replay. Trades are fed one at a time through on_trade and
+    every subscriber of a bar size receives each bar of that size once it is complete, i.e. when
+    the first trade of a later bar arrives or on flush. State is O(1) per symbol and bar size, so
+    any number of strategies can share one aggregator:
+
+        aggregator = BarAggregator()
+        aggregator.subscribe(1, strategy.on_bar)
+        aggregator.subscribe(5, other_strategy.on_bar)
+        ares.add_bar_aggregator(aggregator)
+
+    Bars are the same as DataUtils.resample_xmin_bars on the trades of the symbol: they are
+    anchored at midnight New York time of the symbol's first trade and the timestamp is the bar
+    open time in nanoseconds. Bars without trades are skipped unless emit_empty is set, then they
+    are emitted with NaN prices and zero volume, as resample_xmin_bars returns them.
+    '''
+    def __init__(self, emit_empty: bool = False):
+        self.emit_empty = emit_empty
+        self.bar_sizes: List[int] = [] # Bar sizes in nanoseconds
+        self.subscribers: List[List[Callable[[Bar], None]]] = [] # Callbacks of every bar size
+        self.states: Dict[str, List[list]] = {} # Key is symbol. Value is the bar state of every bar size
+        self.origins: Dict[str, int] = {} # Key is symbol. Value is the anchor of its bars in nanoseconds
+
+    def subscribe(self, multiplier: int, callback: Callable[[Bar], None]) -> None:
+        '''Call callback with every completed bar of multiplier minutes.
+        '''
+        bar_size = multiplier * NANOSECONDS_PER_MINUTE
+        if bar_size not in self.bar_sizes:
+            self.bar_sizes.append(bar_size)
+            self.subscribers.append([])
+            for states in self.states.values():
+                states.append(None)
+        self.subscribers[self.bar_sizes.index(bar_size)].append(callback)
+
+    def on_trade(self, trade: Trade) -> None:
+        symbol = trade.symbol
+        timestamp = trade.timestamp
+        price = trade.price
+        quantity = trade.quantity
+        states = self.states.get(symbol)
+        if states is None:
+            states = self.states[symbol] = [None] * len(self.bar_sizes)
+            self.origins[symbol] = pd.Timestamp(timestamp, tz='UTC').tz_convert(MARKET_TZ).normalize().value
+        elapsed = timestamp - self.origins[symbol]
+        for i, bar_size in enumerate(self.bar_sizes):
+            bucket = elapsed // bar_size
+            state = states[i]
+            if state is not None and state[BUCKET] == bucket:
+                if price > state[HIGH]:
+                    state[HIGH] = price
+                elif price < state[LOW]:
+                    state[LOW] = price
+                state[CLOSE] = price
+                state[VOLUME] += quantity
+                state[PRICE_VOLUME] += price * quantity
+                continue
+            if state is not None:
+                self._emit(symbol, i, state)
+                if self.emit_empty:
+                    for empty in range(state[BUCKET] + 1, bucket):
+                        self._emit_empty(symbol, i, empty)
+            states[i] = [bucket, price, price, price, price, quantity, price * quantity]
+
+    def flush(self) -> None:
+        '''Emit the bars still in progress, e.g. at the end of the replay.
+        '''
+        for symbol, states in self.states.items():
+            for i, state in enumerate(states):
+                if state is not None:
+                    self._emit(symbol, i, state)
+                    states[i] = None
+
+    def _emit(self, symbol: str, i: int, state: list) -> None:
+        bar = Bar(symbol, self.origins[symbol] + state[BUCKET] * self.bar_sizes[i], state[OPEN], state[HIGH],
+                  state[LOW], state[CLOSE], state[VOLUME], state[PRICE_VOLUME] / state[VOLUME] if state[VOLUME] else float('nan'))
+        for callback in self.subscribers[i]:
+            callback(bar)
+
+    def _emit_empty(self, symbol: str, i: int, bucket: int) -> None:
+        nan = float('nan')
+        bar = Bar(symbol, self.origins[symbol] + bucket * self.bar_sizes[i], nan, nan, nan, nan, 0, nan)
+        for callback in self.subscribers[i]:
+            callback(bar)
@@ -0,0 +1,176 @@
+from data.fetcher.polygon_data_model import Bar, TradeBatch
+from typing import Callable, Iterable, Iterator, List, Sequence
+from itertools import chain, islice
+import heapq
+from queue import Queue, Empty, Full
+import threading
+import numpy as np
+import pandas as pd
+
+DEFAULT_CHUNK_SIZE = 100000
+
+
+class TradeFeed(object):
+    '''
+    Chunked source of trades for replay. Iterating the feed yields chunks (TradeBatch or list of
+    Trade) so only a bounded number of ticks is held in memory at a time, no matter how long the
+    replay is. Feeds built from files or sequences can be iterated more than once, feeds built
+    from generators can only be consumed once.
+    '''
+    def __init__(self, chunk_factory: Callable[[], Iterator], prefetch: int = 0):
+        '''
+        Args:
+            chunk_factory (Callable[[], Iterator]): Returns a fresh iterator over chunks
+            prefetch (int, optional): Number of chunks to read ahead in a background thread. Defaults to 0 (no prefetch).
+        '''
+        self.chunk_factory = chunk_factory
+        self.prefetch = prefetch
+
+    def __iter__(self) -> Iterator:
+        chunks = self.chunk_factory()
+        if self.prefetch > 0:
+            chunks = prefetch_chunks(chunks, self.prefetch)
+        return chunks
+
+    def trades(self) -> Iterator:
+        '''Iterate trades one by one across chunks.
+        '''
+        return chain.from_iterable(self)
+
+    @classmethod
+    def from_iterable(cls, data: Iterable, chunk_size: int = DEFAULT_CHUNK_SIZE, prefetch: int = 0) -> 'TradeFeed':
+        '''Build a feed from a TradeBatch, a list of trades or any iterator of trades.
+        '''
+        if isinstance(data, (TradeBatch, Sequence)):
+            def chunk_factory():
+                for start in range(0, len(data), chunk_size):
+                    yield data[start:start + chunk_size]
+        else:
+            iterator = iter(data)
+            def chunk_factory():
+                while True:
+                    chunk = list(islice(iterator, chunk_size))
+                    if not chunk:
+                        return
+                    yield chunk
+        return cls(chunk_factory, prefetch)
+
+    @classmethod
+    def from_polygon(cls, trades: Iterable, symbol: str, chunk_size: int = DEFAULT_CHUNK_SIZE, prefetch: int = 0) -> 'TradeFeed':
+        '''Build a feed from the paginated iterator returned by PolygonDataFetcher.fetch_trades.
+        Pages are pulled lazily, so prefetch overlaps network time with the replay.
+        '''
+        iterator = iter(trades)
+        def chunk_factory():
+            while True:
+                chunk = list(islice(iterator, chunk_size))
+                if not chunk:
+                    return
+                yield TradeBatch.from_arrays(symbol,
+                                             [t.sip_timestamp for t in chunk],
+                                             [t.price for t in chunk],
+                                             [t.size for t in chunk])
+        return cls(chunk_factory, prefetch)
+
+    @classmethod
+    def from_csv(cls, path: str, symbol: str = None, chunk_size: int = DEFAULT_CHUNK_SIZE, prefetch: int = 0) -> 'TradeFeed':
+        '''Build a feed from a trade CSV with timestamp, price and quantity columns, as written
+        from DataUtils.import_data_from_iter. Symbol is read from the symbol column unless given.
+        '''
+        def chunk_factory():
+            for frame in pd.read_csv(path, chunksize=chunk_size):
+                yield frame_to_batch(frame, symbol)
+        return cls(chunk_factory, prefetch)
+
+    @classmethod
+    def from_parquet(cls, path: str, symbol: str = None, chunk_size: int = DEFAULT_CHUNK_SIZE, prefetch: int = 0) -> 'TradeFeed':
+        '''Build a feed from a trade Parquet file with the same columns as from_csv. Requires pyarrow.
+        '''
+        import pyarrow.parquet as pq
+
+        def chunk_factory():
+            for record_batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+                yield frame_to_batch(record_batch.to_pandas(), symbol)
+        return cls(chunk_factory, prefetch)
+
+
+def merge_feeds(feeds: Iterable[TradeFeed]) -> Iterator:
+    '''Lazily merge timestamp-sorted feeds into one stream in global time order with a k-way
+    heap merge. Trades with equal timestamps keep the order in which feeds are given.
+    '''
+    return heapq.merge(*(feed.trades() for feed in feeds), key=_timestamp)
+
+
+def _timestamp(trade) -> int:
+    return trade.timestamp
+
+
+def bars_from_frame(frame: pd.DataFrame, symbol: str) -> List[Bar]:
+    '''Convert a bar DataFrame, as returned by DataUtils.resample_xmin_bars, into a list of Bar.
+    Timestamp may be datetimes or nanoseconds since the epoch.
+    '''
+    timestamps = frame['timestamp']
+    if not pd.api.types.is_integer_dtype(timestamps):
+        timestamps = [pd.Timestamp(t).value for t in timestamps]
+    volumes = frame['v'] if 'v' in frame else [0] * len(frame)
+    vwaps = frame['vw'] if 'vw' in frame else [None] * len(frame)
+    return [Bar(symbol, int(ts), o, h, l, c, v, vw) for ts, o, h, l, c, v, vw in
+            zip(timestamps, frame['open'], frame['high'], frame['low'], frame['close'], volumes, vwaps)]
+
+
+def frame_to_batch(frame: pd.DataFrame, symbol: str = None) -> TradeBatch:
+    '''Convert a trade DataFrame chunk into a TradeBatch.
+    '''
+    if symbol is not None:
+        return TradeBatch.from_arrays(symbol, frame['timestamp'].to_numpy(), frame['price'].to_numpy(), frame['quantity'].to_numpy())
+    symbols, symbol_ids = np.unique(frame['symbol'].to_numpy(), return_inverse=True)
+    return TradeBatch(frame['timestamp'].to_numpy(), frame['price'].to_numpy(), frame['quantity'].to_numpy(),
+                      symbol_ids, [str(s) for s in symbols])
+
+
+_END = object()
+
+
+def prefetch_chunks(chunks: Iterator, depth: int) -> Iterator:
+    '''Read chunks ahead in a background thread. At most `depth` chunks are buffered, so memory
+    stays bounded. Exceptions raised by the source are re-raised in the consumer.
+    '''
+    buffer = Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for chunk in chunks:
+                if not put(chunk):
+                    return
+        except BaseException as e:
+            put(e)
+            return
+        put(_END)
+
+    worker = threading.Thread(target=produce, daemon=True)
+    worker.start()
+    try:
+        while True:
+            try:
+                item = buffer.get(timeout=0.1)
+            except Empty:
+                if not worker.is_alive() and buffer.empty():
+                    return
+                continue
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
@@ -0,0 +1,96 @@
+from typing import Callable, Iterable, Iterator, TypeVar
+from loguru import logger
+from urllib3.exceptions import MaxRetryError, ProtocolError, TimeoutError as RequestTimeoutError
+import threading
+import time
+
+T = TypeVar('T')
+
+
+class RateLimiter(object):
+    '''
+    Token bucket shared by every worker thread. acquire() blocks until a request may be sent, so
+    requests never exceed requests_per_second on average, with bursts of at most burst requests.
+    '''
+    def __init__(self, requests_per_second: float, burst: int = 1, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.rate = float(requests_per_second)
+        self.burst = burst
+        self.tokens = float(burst)
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+
+class RateLimitedClient(object):
+    '''
+    Proxy of a Polygon client whose list_trades and list_aggs take a token from the limiter for
+    every page. Pages are requested lazily by the returned iterators, so a token is taken before
+    the first record of each page of page_size records.
+    '''
+    def __init__(self, client, limiter: RateLimiter, page_size: int):
+        self.client = client
+        self.limiter = limiter
+        self.page_size = page_size
+
+    def list_trades(self, *args, **kwargs) -> Iterator:
+        return self._throttled(lambda: self.client.list_trades(*args, **kwargs))
+
+    def list_aggs(self, *args, **kwargs) -> Iterator:
+        return self._throttled(lambda: self.client.list_aggs(*args, **kwargs))
+
+    def _throttled(self, request: Callable[[], Iterable]) -> Iterator:
+        self.limiter.acquire()
+        count = 0
+        for record in request():
+            count += 1
+            if count % self.page_size == 0:
+                self.limiter.acquire()
+            yield record
+
+
+def is_transient(error: BaseException) -> bool:
+    '''Whether a failed request is worth retrying: connection drops, timeouts, MaxRetryError once
+    the client's own retries of 429 and 5xx responses are used up, and any error carrying an
+    HTTP status of 429 or 5xx. Auth errors, bad tickers and
+    programming errors are not.
+    '''
+    if isinstance(error, (ConnectionError, TimeoutError, MaxRetryError, ProtocolError, RequestTimeoutError)):
+        return True
+    status = getattr(error, 'status', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return isinstance(status, int) and (status == 429 or 500 <= status < 600)
+
+
+def with_retries(job: Callable[[], T], retries: int = 3, backoff: float = 1.0,
+                 sleep: Callable[[float], None] = time.sleep,
+                 retry_on: Callable[[BaseException], bool] = is_transient) -> T:
+    '''Run job, retrying up to retries times with exponential backoff (backoff, 2 * backoff, ...)
+    when it raises an error accepted by retry_on. Other errors are raised at once and the last
+    error is raised once retries are exhausted.
+    '''
+    attempt = 0
+    while True:
+        try:
+            return job()
+        except Exception as error:
+            if attempt >= retries or not retry_on(error):
+                raise
+            delay = backoff * (2 ** attempt)
+            logger.warning('Fetch failed ({}), retrying in {:.1f}s'.format(error, delay))
+            sleep(delay)
+            attempt += 1
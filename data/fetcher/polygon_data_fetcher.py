@@ -1,14 +1,41 @@
 from polygon import RESTClient
 from dotenv import load_dotenv
+from data.fetcher.tick_cache import MARKET_TZ, TickCache, record_pages
+from data.fetcher.bulk_fetch import RateLimitedClient, RateLimiter, with_retries
+from data.fetcher.polygon_data_model import TradeBatch
+from data.feed.trade_feed import prefetch_chunks
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Tuple
+import numpy as np
+import pandas as pd
+import datetime
+import copy
 import os
 
 class PolygonDataFetcher:
-    def __init__(self):
+    def __init__(self, client=None, cache_dir: str = None):
+        '''
+        Args:
+            client (optional): Polygon REST client, or any stand-in with the same list_trades and list_aggs
+                methods. Defaults to a RESTClient using POLYGON_API_KEY.
+            cache_dir (str, optional): Directory of a local TickCache. Fetched data is then reused across
+                runs and only missing time ranges are downloaded. Defaults to None (no cache).
+        '''
         load_dotenv()
         self.api_key = os.getenv('POLYGON_API_KEY')
-        self.client = RESTClient(self.api_key)
-    
+        self.client = client if client is not None else RESTClient(self.api_key)
+        self.cache = TickCache(cache_dir) if cache_dir else None
+
     def fetch_bars(self, ticker, from_timestamp, to_timestamp, limit=50000, timespan='minute', multiplier=1):
+        if self.cache is not None:
+            def fetch(start_ns, end_ns):
+                # Aggregates are requested in milliseconds
+                return self._list_aggs(ticker, -(-start_ns // 1_000_000), end_ns // 1_000_000, limit, timespan, multiplier)
+            return self.cache.bars(ticker, 'bars_{}_{}'.format(multiplier, timespan),
+                                   _bound_ns(from_timestamp, False, 1_000_000), _bound_ns(to_timestamp, True, 1_000_000), fetch)
+        return self._list_aggs(ticker, from_timestamp, to_timestamp, limit, timespan, multiplier)
+
+    def _list_aggs(self, ticker, from_timestamp, to_timestamp, limit, timespan, multiplier):
         return self.client.list_aggs(
             ticker=ticker,
             multiplier=multiplier,
@@ -19,11 +46,104 @@ class PolygonDataFetcher:
             sort='asc',
             limit=limit,
         )
-    
+
     def fetch_trades(self, ticker, from_timestamp, to_timestamp, limit=50000):
+        if self.cache is not None:
+            def fetch(start_ns, end_ns):
+                return self._list_trades(ticker, start_ns, end_ns, limit)
+            return self.cache.trades(ticker, _bound_ns(from_timestamp, False, 1), _bound_ns(to_timestamp, True, 1), fetch)
+        return self._list_trades(ticker, from_timestamp, to_timestamp, limit)
+
+    def fetch_trades_bulk(self, symbols: List[str], days: List[str], start_time: str = '09:30', end_time: str = '16:00',
+                          max_workers: int = 8, requests_per_second: float = None, retries: int = 3, backoff: float = 1.0,
+                          prefetch: int = 2, limit: int = 50000,
+                          callback: Callable[[str, str, TradeBatch], None] = None) -> Dict[Tuple[str, str], TradeBatch]:
+        '''Fetch trades of many (symbol, day) jobs concurrently, e.g. to backfill a quarter for a basket.
+
+        Args:
+            symbols (List[str]): Tickers
+            days (List[str]): Days as YYYY-MM-DD, e.g. from Utility.list_trading_days
+            start_time (str, optional): Session start in New York time. Defaults to '09:30'.
+            end_time (str, optional): Session end in New York time, inclusive. Defaults to '16:00'.
+            max_workers (int, optional): Number of jobs running at once. Defaults to 8.
+            requests_per_second (float, optional): Page requests per second across all jobs. Defaults to None (unlimited).
+            retries (int, optional): Retries of a failed job, restarted from scratch. Defaults to 3.
+            backoff (float, optional): Seconds before the first retry, doubled on every further retry. Defaults to 1.0.
+            prefetch (int, optional): Pages each job downloads ahead in a background thread while the job
+                parses the pages already received. 0 downloads and parses in turn. Defaults to 2.
+            limit (int, optional): Page size. Defaults to 50000.
+            callback (Callable[[str, str, TradeBatch], None], optional): Called with (symbol, day, trades) as
+                each job finishes, from the worker thread. Results are then not kept in memory. Defaults to None.
+
+        Returns:
+            Dict[Tuple[str, str], TradeBatch]: Trades of every (symbol, day), empty when callback is given
+
+        Raises:
+            Exception: Error of the first job that still fails after its retries. Jobs not started yet
+                are cancelled and the error is raised once the running ones are done.
+        '''
+        fetcher = self
+        if requests_per_second:
+            fetcher = copy.copy(self)
+            fetcher.client = RateLimitedClient(self.client, RateLimiter(requests_per_second), limit)
+
+        def run(symbol, day):
+            start_ns = pd.Timestamp('{} {}'.format(day, start_time), tz=MARKET_TZ).value
+            end_ns = pd.Timestamp('{} {}'.format(day, end_time), tz=MARKET_TZ).value
+
+            def job():
+                pages = record_pages(fetcher.fetch_trades(symbol, start_ns, end_ns, limit), limit)
+                if prefetch:
+                    pages = prefetch_chunks(pages, prefetch)
+                timestamps, prices, sizes = [], [], []
+                for page in pages:
+                    timestamps.append(np.array([t.sip_timestamp for t in page], dtype=np.int64))
+                    prices.append(np.array([t.price for t in page], dtype=np.float64))
+                    # Sizes keep their own type, so fractional sizes are not truncated
+                    sizes.append(np.array([t.size for t in page]))
+                if not timestamps:
+                    return TradeBatch.from_arrays(symbol, [], [], [])
+                return TradeBatch.from_arrays(symbol, np.concatenate(timestamps), np.concatenate(prices), np.concatenate(sizes))
+            trades = with_retries(job, retries, backoff)
+            if callback is not None:
+                callback(symbol, day, trades)
+                return None
+            return trades
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {(symbol, day): pool.submit(run, symbol, day) for symbol in symbols for day in days}
+            for future in as_completed(futures.values()):
+                error = future.exception()
+                if error is not None:
+                    for pending in futures.values():
+                        pending.cancel()
+                    raise error
+        return {key: future.result() for key, future in futures.items() if future.result() is not None}
+
+    def _list_trades(self, ticker, from_timestamp, to_timestamp, limit):
         return self.client.list_trades(
             ticker=ticker,
             timestamp_gte=from_timestamp,
             timestamp_lte= to_timestamp,
             limit=limit,
-        )
\ No newline at end of file
+            sort='timestamp',
+            order='asc',
+        )
+
+
+def _bound_ns(value, end: bool, unit_ns: int) -> int:
+    '''Nanosecond bound of a list_trades or list_aggs time argument. Integers are in units of
+    unit_ns nanoseconds (1 for trades, 1_000_000 for aggregates) and dates cover the whole
+    New York calendar day.
+    '''
+    if isinstance(value, (int, np.integer)):
+        return int(value) * unit_ns
+    if isinstance(value, str) and len(value) == 10:
+        value = datetime.date.fromisoformat(value)
+    if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        day = pd.Timestamp(value).tz_localize(MARKET_TZ)
+        return (day + pd.DateOffset(days=1)).value - 1 if end else day.value
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize('UTC')
+    return timestamp.value
@@ -1,4 +1,14 @@
+from typing import Dict, Iterable, Iterator, List
+from itertools import repeat
+from operator import itemgetter
+import numpy as np
+
+ITER_CHUNK_SIZE = 1 << 14 # Rows converted to Python values at a time when iterating a TradeBatch
+
+
 class Trade(object):
+    __slots__ = ('_symbol', '_timestamp', '_price', '_quantity')
+
     def __init__(self, symbol, timestamp, price, quantity):
         self._symbol = symbol
         self._timestamp = timestamp
@@ -28,4 +38,119 @@ class Trade(object):
     @property
     def quantity(self):
         return self._quantity
-    
\ No newline at end of file
+
+
+class Bar(object):
+    '''OHLCV bar. Timestamp is the bar open time in nanoseconds.
+    '''
+    __slots__ = ('symbol', 'timestamp', 'open', 'high', 'low', 'close', 'volume', 'vwap')
+
+    def __init__(self, symbol, timestamp, open, high, low, close, volume=0, vwap=None):
+        self.symbol = symbol
+        self.timestamp = timestamp
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+        self.vwap = vwap
+
+    def to_dict(self):
+        return {
+            'symbol': self.symbol,
+            'timestamp': self.timestamp,
+            'open': self.open,
+            'high': self.high,
+            'low': self.low,
+            'close': self.close,
+            'v': self.volume,
+            'vw': self.vwap
+        }
+
+
+class TradeRow(tuple):
+    '''(symbol, timestamp, price, quantity) tuple with the same properties as Trade. Rows are
+    built from zipped columns by the tuple constructor, without running Python code per row.
+    '''
+    __slots__ = ()
+
+    symbol = property(itemgetter(0))
+    timestamp = property(itemgetter(1))
+    price = property(itemgetter(2))
+    quantity = property(itemgetter(3))
+
+    def to_dict(self):
+        return {
+            'symbol': self[0],
+            'timestamp': self[1],
+            'price': self[2],
+            'quantity': self[3]
+        }
+
+
+class TradeBatch(object):
+    '''
+    Columnar container of trades. Timestamps are int64 nanoseconds, prices float64, sizes int32
+    (float64 when given as floats, so fractional sizes are kept) and symbols are interned into an
+    int32 id that indexes `symbols`. Iterating the batch converts
+    ITER_CHUNK_SIZE rows at a time to Python values with tolist() and yields a TradeRow per row,
+    which is much cheaper than boxing a numpy scalar on every property read.
+    '''
+    __slots__ = ('timestamps', 'prices', 'sizes', 'symbol_ids', 'symbols')
+
+    def __init__(self, timestamps, prices, sizes, symbol_ids, symbols: List[str]):
+        self.timestamps = np.asarray(timestamps, dtype=np.int64)
+        self.prices = np.asarray(prices, dtype=np.float64)
+        sizes = np.asarray(sizes)
+        self.sizes = sizes.astype(np.float64 if sizes.dtype.kind == 'f' and sizes.size else np.int32, copy=False)
+        self.symbol_ids = np.asarray(symbol_ids, dtype=np.int32)
+        self.symbols = list(symbols)
+        if not (len(self.timestamps) == len(self.prices) == len(self.sizes) == len(self.symbol_ids)):
+            raise ValueError('All columns of a TradeBatch must have the same length')
+
+    @classmethod
+    def from_arrays(cls, symbol: str, timestamps, prices, sizes) -> 'TradeBatch':
+        '''Build a batch of a single symbol from column arrays.
+        '''
+        return cls(timestamps, prices, sizes, np.zeros(len(timestamps), dtype=np.int32), [symbol])
+
+    @classmethod
+    def from_trades(cls, trades: Iterable[Trade]) -> 'TradeBatch':
+        '''Build a batch from any iterable of objects exposing the Trade properties.
+        '''
+        symbol_table: Dict[str, int] = {}
+        timestamps, prices, sizes, symbol_ids = [], [], [], []
+        for trade in trades:
+            symbol_id = symbol_table.setdefault(trade.symbol, len(symbol_table))
+            timestamps.append(trade.timestamp)
+            prices.append(trade.price)
+            sizes.append(trade.quantity)
+            symbol_ids.append(symbol_id)
+        return cls(timestamps, prices, sizes, symbol_ids, list(symbol_table))
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return TradeBatch(self.timestamps[index], self.prices[index], self.sizes[index],
+                              self.symbol_ids[index], self.symbols)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('TradeBatch index out of range')
+        return TradeRow((self.symbols[self.symbol_ids[index]], self.timestamps[index].item(), self.prices[index].item(),
+                         self.sizes[index].item()))
+
+    def __iter__(self) -> Iterator[TradeRow]:
+        for start in range(0, len(self.timestamps), ITER_CHUNK_SIZE):
+            end = start + ITER_CHUNK_SIZE
+            if len(self.symbols) == 1:
+                symbols = repeat(self.symbols[0])
+            else:
+                symbols = map(self.symbols.__getitem__, self.symbol_ids[start:end].tolist())
+            yield from map(TradeRow, zip(symbols, self.timestamps[start:end].tolist(), self.prices[start:end].tolist(),
+                                         self.sizes[start:end].tolist()))
+
+    def symbol_id(self, symbol: str) -> int:
+        return self.symbols.index(symbol)
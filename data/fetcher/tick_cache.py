@@ -0,0 +1,223 @@
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Tuple
+from itertools import islice
+import numpy as np
+import pandas as pd
+import time
+import os
+
+MARKET_TZ = 'America/New_York'
+TRADES = 'trades'
+# Polygon publishes trades with a delay (15 minutes on delayed plans) and may still correct them,
+# so ranges closer to now than this are fetched but never marked as covered
+DEFAULT_PUBLISH_LAG_NS = 3600 * 1_000_000_000
+PAGE_SIZE = 50000 # Fetched records converted and passed on at a time
+
+
+class CachedTrade(NamedTuple):
+    '''Trade read from the cache. Field names follow the Polygon trade model.
+    '''
+    sip_timestamp: int
+    price: float
+    size: float
+    exchange: int
+
+
+class CachedAgg(NamedTuple):
+    '''Aggregate bar read from the cache. Field names follow the Polygon Agg model, timestamp in milliseconds.
+    '''
+    timestamp: int
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float
+    vwap: float
+    transactions: int
+
+
+TRADE_COLUMNS = {'sip_timestamp': np.int64, 'price': np.float64, 'size': np.float64, 'exchange': np.int16}
+BAR_COLUMNS = {'timestamp': np.int64, 'open': np.float64, 'high': np.float64, 'low': np.float64,
+               'close': np.float64, 'volume': np.float64, 'vwap': np.float64, 'transactions': np.int64}
+
+
+class TickCache(object):
+    '''
+    Local cache of Polygon trades and bars. Data is stored per (ticker, endpoint, trading day in
+    New York time) as an .npz file of numpy columns, together with the nanosecond ranges of that
+    day already fetched. A read only asks the client for the ranges that aren't covered yet, so
+    widening a window or rerunning a script downloads nothing that is already on disk.
+    Ranges later than now minus publish_lag_ns are never marked as covered, since trades in
+    them may not be published yet.
+
+    Fetched records are passed on PAGE_SIZE at a time as they arrive, so the caller can work on
+    a page while the next one downloads. fetch must return records sorted by time, and a day is
+    only written to the cache once all of its rows have been read.
+
+    Layout: <cache_dir>/<ticker>/<endpoint>/<YYYY-MM-DD>.npz
+    '''
+    def __init__(self, cache_dir: str, publish_lag_ns: int = DEFAULT_PUBLISH_LAG_NS):
+        self.cache_dir = cache_dir
+        self.publish_lag_ns = publish_lag_ns
+
+    def trades(self, ticker: str, start_ns: int, end_ns: int,
+               fetch: Callable[[int, int], Iterable]) -> Iterator[CachedTrade]:
+        '''Trades of ticker in [start_ns, end_ns], sorted by sip_timestamp.
+
+        Args:
+            fetch (Callable[[int, int], Iterable]): Fetches Polygon trades in an inclusive nanosecond range
+        '''
+        return self._read(ticker, TRADES, start_ns, end_ns, fetch, TRADE_COLUMNS, 1, CachedTrade)
+
+    def bars(self, ticker: str, endpoint: str, start_ns: int, end_ns: int,
+             fetch: Callable[[int, int], Iterable]) -> Iterator[CachedAgg]:
+        '''Bars of ticker starting in [start_ns, end_ns], sorted by timestamp.
+
+        Args:
+            endpoint (str): Cache key of the bar size, e.g. bars_1_minute
+            fetch (Callable[[int, int], Iterable]): Fetches Polygon aggregates in an inclusive nanosecond range
+        '''
+        return self._read(ticker, endpoint, start_ns, end_ns, fetch, BAR_COLUMNS, 1_000_000, CachedAgg)
+
+    def coverage(self, ticker: str, endpoint: str, day: str) -> np.ndarray:
+        '''Covered inclusive nanosecond ranges of a day as an (n, 2) array.
+        '''
+        return self._load(ticker, endpoint, day, TRADE_COLUMNS if endpoint == TRADES else BAR_COLUMNS)[1]
+
+    def _read(self, ticker: str, endpoint: str, start_ns: int, end_ns: int, fetch: Callable[[int, int], Iterable],
+              spec: Dict[str, type], time_scale: int, record: type) -> Iterator:
+        time_column = next(iter(spec))
+        for day, day_start, day_end in split_days(start_ns, end_ns):
+            columns, coverage = self._load(ticker, endpoint, day, spec)
+            times = columns[time_column] * time_scale
+            gaps = missing_ranges(coverage, day_start, day_end)
+            settled_ns = time.time_ns() - self.publish_lag_ns
+            in_gaps = np.zeros(len(times), dtype=bool)
+            fetched = []
+            cursor = day_start
+            for gap_start, gap_end in gaps:
+                yield from to_records(select(columns, (times >= cursor) & (times < gap_start)), record)
+                in_gaps |= (times >= gap_start) & (times <= gap_end)
+                for page in record_pages(fetch(gap_start, gap_end), PAGE_SIZE):
+                    part = to_columns(page, spec)
+                    part_times = part[time_column] * time_scale
+                    part = select(part, (part_times >= gap_start) & (part_times <= gap_end))
+                    fetched.append(part)
+                    yield from to_records(part, record)
+                cursor = gap_end + 1
+            yield from to_records(select(columns, (times >= cursor) & (times <= day_end)), record)
+
+            covered = [(gap_start, min(gap_end, settled_ns)) for gap_start, gap_end in gaps if gap_start <= settled_ns]
+            if covered:
+                coverage = add_ranges(coverage, covered)
+                columns = sort_columns(concat_columns([select(columns, ~in_gaps)] + fetched, spec), time_column)
+                # Rows after the covered ranges would be fetched again, so they aren't stored
+                stored = select(columns, columns[time_column] * time_scale <= max(coverage[:, 1]))
+                self._store(ticker, endpoint, day, stored, coverage)
+
+    def _path(self, ticker: str, endpoint: str, day: str) -> str:
+        return os.path.join(self.cache_dir, ticker, endpoint, '{}.npz'.format(day))
+
+    def _load(self, ticker: str, endpoint: str, day: str, spec: Dict[str, type]) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+        path = self._path(ticker, endpoint, day)
+        if not os.path.exists(path):
+            return empty_columns(spec), np.zeros((0, 2), dtype=np.int64)
+        with np.load(path) as data:
+            return {name: data[name] for name in spec}, data['__coverage__']
+
+    def _store(self, ticker: str, endpoint: str, day: str, columns: Dict[str, np.ndarray], coverage: np.ndarray) -> None:
+        path = self._path(ticker, endpoint, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so an interrupted run never leaves a truncated file behind
+        temp_path = path + '.tmp.npz'
+        np.savez(temp_path, __coverage__=coverage, **columns)
+        os.replace(temp_path, path)
+
+
+def split_days(start_ns: int, end_ns: int) -> List[Tuple[str, int, int]]:
+    '''Split an inclusive nanosecond range into (YYYY-MM-DD, start, end) pieces, one per New York calendar day.
+    '''
+    days = []
+    day = pd.Timestamp(start_ns, tz='UTC').tz_convert(MARKET_TZ).normalize()
+    while day.value <= end_ns:
+        next_day = (day + pd.DateOffset(days=1)).normalize()
+        days.append((day.strftime('%Y-%m-%d'), max(start_ns, day.value), min(end_ns, next_day.value - 1)))
+        day = next_day
+    return days
+
+
+def missing_ranges(coverage: np.ndarray, start: int, end: int) -> List[Tuple[int, int]]:
+    '''Inclusive sub-ranges of [start, end] not covered by the sorted, disjoint coverage ranges.
+    '''
+    gaps = []
+    cursor = start
+    for covered_start, covered_end in coverage.tolist():
+        if covered_end < cursor:
+            continue
+        if covered_start > end:
+            break
+        if covered_start > cursor:
+            gaps.append((cursor, covered_start - 1))
+        cursor = covered_end + 1
+        if cursor > end:
+            return gaps
+    if cursor <= end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+def add_ranges(coverage: np.ndarray, ranges: List[Tuple[int, int]]) -> np.ndarray:
+    '''Union of coverage and ranges as sorted, disjoint inclusive ranges. Adjacent ranges are merged.
+    '''
+    merged = []
+    for range_start, range_end in sorted(coverage.tolist() + [list(r) for r in ranges]):
+        if merged and range_start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], range_end)
+        else:
+            merged.append([range_start, range_end])
+    return np.array(merged, dtype=np.int64).reshape(-1, 2)
+
+
+def to_columns(records: Iterable, spec: Dict[str, type]) -> Dict[str, np.ndarray]:
+    '''Convert Polygon records into numpy columns. Missing values become NaN, or 0 for integer columns.
+    '''
+    values = {name: [] for name in spec}
+    for record in records:
+        for name, column in values.items():
+            column.append(getattr(record, name, None))
+    columns = {}
+    for name, dtype in spec.items():
+        missing = 0 if np.issubdtype(dtype, np.integer) else np.nan
+        columns[name] = np.array([missing if v is None else v for v in values[name]], dtype=dtype)
+    return columns
+
+
+def record_pages(records: Iterable, page_size: int) -> Iterator[list]:
+    '''Group records into lists of page_size, pulling them from the iterator only as needed.
+    '''
+    iterator = iter(records)
+    while True:
+        page = list(islice(iterator, page_size))
+        if not page:
+            return
+        yield page
+
+
+def to_records(columns: Dict[str, np.ndarray], record: type) -> Iterator:
+    return map(record._make, zip(*(column.tolist() for column in columns.values())))
+
+
+def empty_columns(spec: Dict[str, type]) -> Dict[str, np.ndarray]:
+    return {name: np.zeros(0, dtype=dtype) for name, dtype in spec.items()}
+
+
+def concat_columns(parts: List[Dict[str, np.ndarray]], spec: Dict[str, type]) -> Dict[str, np.ndarray]:
+    return {name: np.concatenate([part[name] for part in parts]).astype(dtype, copy=False) for name, dtype in spec.items()}
+
+
+def sort_columns(columns: Dict[str, np.ndarray], key: str) -> Dict[str, np.ndarray]:
+    order = np.argsort(columns[key], kind='stable')
+    return {name: column[order] for name, column in columns.items()}
+
+
+def select(columns: Dict[str, np.ndarray], mask: np.ndarray) -> Dict[str, np.ndarray]:
+    return {name: column[mask] for name, column in columns.items()}
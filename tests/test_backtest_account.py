@@ -1,5 +1,7 @@
 import unittest
-from backtest.broker.account import Account, Position
+from backtest.broker.account import Account, FixedPointAccount, Position, SAMPLE_ON_BAR_CLOSE, pack_accounts
+from backtest.broker.broker import Broker
+from data.fetcher.polygon_data_model import Trade
 from backtest.broker.order import OrderSide, Order, OrderType
 
 
@@ -231,5 +233,110 @@ class TestAccount(unittest.TestCase):
         self.assertEqual(self.account.get_balance(), 105018)
         self.assertEqual(self.account.get_buying_power(), 105018)
 
+    def test_mark_to_market(self):
+        self.account.update_position(price=100, order=Order(symbol='AAPL', quantity=100, order_type=OrderType.MARKET, side=OrderSide.LONG, market_price=100))
+        self.account.update_position(price=50, order=Order(symbol='AMZN', quantity=200, order_type=OrderType.MARKET, side=OrderSide.SHORT, market_price=50))
+        self.assertEqual(self.account.get_equity(), 100000.0)
+        self.assertTrue(self.account.tracks('AAPL'))
+        self.assertFalse(self.account.tracks('MSFT'))
+
+        self.account.mark('AAPL', 103, 1)
+        self.account.mark('AMZN', 48, 2)
+        self.assertEqual(self.account.get_open_position('AAPL', OrderSide.LONG).get_unrealized_profit(), 300)
+        self.assertEqual(self.account.get_open_position('AMZN', OrderSide.SHORT).get_unrealized_profit(), 400)
+        self.assertEqual(self.account.get_equity(), 100700.0)
+
+        # Closing at the marked price realizes the same equity
+        self.account.update_position(price=48, order=Order(symbol='AMZN', quantity=-200, order_type=OrderType.MARKET, side=OrderSide.SHORT, market_price=48))
+        self.assertFalse(self.account.tracks('AMZN'))
+        self.assertEqual(self.account.get_equity(), 100700.0)
+
+    def test_equity_history(self):
+        history = self.account.enable_equity_history(interval_ns=10, capacity=2)
+        self.account.update_position(price=100, order=Order(symbol='AAPL', quantity=10, order_type=OrderType.MARKET, side=OrderSide.LONG, market_price=100))
+        for timestamp, price in [(1, 100), (5, 101), (10, 102), (15, 103), (31, 99)]:
+            self.account.mark('AAPL', price, timestamp)
+        frame = history.to_frame()
+        self.assertEqual(list(frame['timestamp']), [1, 10, 31])
+        self.assertEqual(list(frame['equity']), [100000.0, 100020.0, 99990.0])
+        self.assertEqual(list(frame['balance']), [99000.0] * 3)
+
+        history = self.account.enable_equity_history(interval_ns=SAMPLE_ON_BAR_CLOSE)
+        self.account.mark('AAPL', 104, 40)
+        self.assertEqual(len(history), 0)
+        self.account.record_equity(40)
+        self.assertEqual(list(history.to_frame()['equity']), [100040.0])
+
+    def test_equity_history_fork(self):
+        history = self.account.enable_equity_history()
+        for timestamp in range(3):
+            self.account.mark('AAPL', 100, timestamp)
+        snapshot = self.account.fork()
+        forks = [snapshot.fork(), snapshot.fork()]
+        # Rows recorded before the fork are shared, not copied
+        self.assertIs(forks[0].equity_history.base, history)
+        self.assertEqual(forks[0].equity_history.size, 0)
+        self.account.mark('AAPL', 100, 3)
+        for i, account in enumerate(forks):
+            account.mark('AAPL', 100, 10 + i)
+        self.assertEqual(list(history.to_frame()['timestamp']), [0, 1, 2, 3])
+        self.assertEqual(list(forks[0].equity_history.to_frame()['timestamp']), [0, 1, 2, 10])
+        self.assertEqual(list(forks[1].equity_history.to_frame()['timestamp']), [0, 1, 2, 11])
+        self.assertEqual(len(forks[1].equity_history), 4)
+
+    def test_fixed_point_matches_float(self):
+        fixed = FixedPointAccount(100000.0)
+        fills = [('AAPL', OrderSide.LONG, 100, 102.25), ('AAPL', OrderSide.LONG, 50, 101.5), ('AAPL', OrderSide.LONG, -150, 103.0),
+                 ('AMZN', OrderSide.SHORT, 200, 92.5), ('AMZN', OrderSide.SHORT, -120, 90.0)]
+        for account in (self.account, fixed):
+            for symbol, side, quantity, price in fills:
+                account.update_position(price=price, order=Order(symbol=symbol, quantity=quantity, order_type=OrderType.LIMIT, side=side, limit_price=price))
+            account.mark('AMZN', 91.0)
+        self.assertEqual(fixed.balance, 93050000000)
+        self.assertAlmostEqual(fixed.get_balance(), self.account.get_balance())
+        self.assertAlmostEqual(fixed.get_buying_power(), self.account.get_buying_power())
+        self.assertAlmostEqual(fixed.get_equity(), self.account.get_equity())
+        for key in [('AAPL', OrderSide.LONG), ('AMZN', OrderSide.SHORT)]:
+            self.assertAlmostEqual(fixed.closed_positions[key].get_realized_profit(), self.account.closed_positions[key].get_realized_profit())
+        position = fixed.get_open_position('AMZN', OrderSide.SHORT)
+        self.assertEqual((position.get_quantity(), position.get_avg_price(), position.get_unrealized_profit()), (80, 92.5, 120.0))
+        self.assertEqual(position.avg_price, 925000)
+
+        forked = fixed.fork()
+        self.assertIsInstance(forked, FixedPointAccount)
+        self.assertEqual(pack_accounts([fixed, forked]).tolist(), [list(fixed.to_array())] * 2)
+
+    def test_fixed_point_is_exact(self):
+        fixed = FixedPointAccount(1000.0)
+        for _ in range(1000):
+            fixed.update_position(price=0.1, order=Order(symbol='F', quantity=3, order_type=OrderType.LIMIT, side=OrderSide.LONG, limit_price=0.1))
+            fixed.update_position(price=0.2, order=Order(symbol='F', quantity=-3, order_type=OrderType.LIMIT, side=OrderSide.LONG, limit_price=0.2))
+        self.assertEqual(fixed.balance, 1300 * 1000000)
+        self.assertEqual(fixed.get_closed_position('F', OrderSide.LONG).realized_profit, 300 * 1000000)
+        self.assertIsInstance(fixed.get_closed_position('F', OrderSide.LONG).realized_profit, int)
+        self.assertEqual(fixed.market_value, 0)
+
+        # update_balance and update_buying_power take dollars, as on Account
+        buying_power = fixed.buying_power
+        fixed.update_balance(-0.5)
+        fixed.update_buying_power(1.25)
+        self.assertEqual((fixed.balance, fixed.get_balance()), (1299500000, 1299.5))
+        self.assertEqual(fixed.buying_power - buying_power, 1250000)
+
+    def test_fixed_point_broker(self):
+        broker = Broker(initial_balance=1000.0, fixed_point=True)
+        order_id = broker.submit_order(Order(symbol='F', side=OrderSide.LONG, order_type=OrderType.LIMIT, quantity=3, limit_price=0.1))
+        self.assertEqual(broker.account.buying_power, 999700000)
+        # Reservations are integer micro-dollars too
+        reserved = broker.ledger.reserved_buying_power('F', OrderSide.LONG)
+        self.assertEqual((type(reserved), reserved), (int, 300000))
+        broker.cancel_order(order_id)
+        self.assertEqual(broker.ledger.reserved_buying_power('F', OrderSide.LONG), 0)
+        self.assertEqual(broker.account.buying_power, 1000000000)
+        broker.submit_order(Order(symbol='F', side=OrderSide.LONG, order_type=OrderType.LIMIT, quantity=10000, limit_price=0.1))
+        broker.on_trade(Trade('F', 1, 0.09, 100))
+        self.assertEqual(broker.account.get_balance(), 100.0)
+        self.assertEqual(broker.account.get_equity(), 1000.0)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,8 +1,10 @@
+import tempfile
 import unittest
-from backtest.broker.broker import Broker, OrderStatus
+from backtest.broker.account import FixedPointAccount
+from backtest.broker.broker import Broker, IntrabarPath, OrderStatus
 from backtest.broker.order import Order, OrderType, OrderSide
 from backtest.exceptions.broker_exception import BrokerException
-from data.fetcher.polygon_data_model import Trade
+from data.fetcher.polygon_data_model import Bar, Trade
 
 
 class TestBroker(unittest.TestCase):
@@ -459,4 +461,192 @@ class TestBroker(unittest.TestCase):
         trade3 = Trade('AAPL', 123, 11.6, 1000)
         self.broker.on_trade(trade3)
         _, order_status = self.broker.order_book.get_order(order_id2)
-        self.assertEqual(order_status, OrderStatus.FILLED)
\ No newline at end of file
+        self.assertEqual(order_status, OrderStatus.FILLED)
+
+    def test_order_book_index(self):
+        order1 = Order(symbol='AAPL', side=OrderSide.LONG, order_type=OrderType.LIMIT, quantity=10, limit_price=12.3)
+        order2 = Order(symbol='AMZN', side=OrderSide.LONG, order_type=OrderType.LIMIT, quantity=10, limit_price=12.3)
+        order3 = Order(symbol='AAPL', side=OrderSide.LONG, order_type=OrderType.LIMIT, quantity=10, limit_price=12.3)
+        order_id1 = self.broker.submit_order(order1)
+        order_id2 = self.broker.submit_order(order2)
+        order_id3 = self.broker.submit_order(order3)
+        # Orders should be listed in submission order
+        self.assertEqual([order_id1, order_id3], [o.get_order_id() for o in self.broker.list_orders(OrderStatus.ACCEPTED, 'AAPL')])
+
+        self.broker.on_trade(Trade('AAPL', 123, 12.3, 100))
+        self.assertEqual([], self.broker.list_orders(OrderStatus.ACCEPTED, 'AAPL'))
+        self.assertEqual([order_id1, order_id3], [o.get_order_id() for o in self.broker.list_orders(OrderStatus.FILLED, 'AAPL')])
+        self.assertEqual([order_id2], [o.get_order_id() for o in self.broker.list_orders(OrderStatus.ACCEPTED)])
+
+        self.broker.cancel_order(order_id2)
+        self.assertEqual([], self.broker.list_orders(OrderStatus.ACCEPTED))
+        self.assertEqual([order_id2], [o.get_order_id() for o in self.broker.list_orders(OrderStatus.CANCELED, 'AMZN')])
+        self.assertEqual([order_id1, order_id3], [o.get_order_id() for o in self.broker.list_orders(symbol='AAPL')])
+        self.assertEqual(3, len(self.broker.list_orders()))
+
+    def test_trigger_index_matches_can_execute(self):
+        broker = Broker(initial_balance=10000000.0)
+        orders = []
+        for i in range(40):
+            price = 10 + (i % 10) * 0.5
+            order_type = OrderType.LIMIT if i % 2 else OrderType.STOP
+            kwargs = {'limit_price': price} if order_type == OrderType.LIMIT else {'stop_price': price}
+            side = OrderSide.LONG if i % 4 < 2 else OrderSide.SHORT
+            symbol = 'AAPL' if side == OrderSide.LONG else 'AMZN'
+            order = Order(symbol=symbol, side=side, order_type=order_type, quantity=10, **kwargs)
+            broker.submit_order(order)
+            orders.append(order)
+        for price in [12.0, 9.0, 14.5, 11.2, 15.0]:
+            for symbol in ['AAPL', 'AMZN']:
+                trade = Trade(symbol, 123, price, 100)
+                expected = [o.get_order_id() for o in broker.list_orders(OrderStatus.ACCEPTED, symbol) if broker._can_execute(o, trade)]
+                broker.on_trade(trade)
+                self.assertEqual(expected, [o.get_order_id() for o in broker.list_orders(OrderStatus.FILLED, symbol)][-len(expected):] if expected else [])
+                for o in broker.list_orders(OrderStatus.ACCEPTED, symbol):
+                    self.assertFalse(broker._can_execute(o, trade))
+        self.assertFalse(broker.trigger_index.has_orders('AAPL'))
+
+    def test_trigger_index_cancel_churn(self):
+        broker = Broker(initial_balance=10000000.0)
+        resting_id = broker.submit_order(Order(symbol='AAPL', side=OrderSide.LONG, order_type=OrderType.LIMIT, quantity=10, limit_price=9.0))
+        for i in range(1000):
+            order_id = broker.submit_order(Order(symbol='AAPL', side=OrderSide.LONG, order_type=OrderType.LIMIT, quantity=10, limit_price=10.0 + i * 0.001))
+            broker.cancel_order(order_id)
+        # Entries of canceled orders are compacted away instead of piling up in the heap
+        self.assertLessEqual(len(broker.trigger_index.at_or_below['AAPL']), 2)
+        # The nearest trigger is the resting order, not a canceled one
+        self.assertEqual(broker.trigger_index.next_trigger('AAPL', False), 9.0)
+        broker.on_bar(Bar('AAPL', 60, 11.0, 11.2, 8.9, 9.5))
+        _, order_status = broker.order_book.get_order(resting_id)
+        self.assertEqual(order_status, OrderStatus.FILLED)
+        self.assertEqual(broker.account.get_open_position('AAPL', OrderSide.LONG).get_avg_price(), 9.0)
+
+    def test_on_bar_fills_at_crossed_price(self):
+        order_id1 = self.broker.submit_order(Order(symbol='AAPL', side=OrderSide.LONG, order_type=OrderType.LIMIT, quantity=100, limit_price=10.0))
+        self.broker.on_bar(Bar('AAPL', 60, 10.5, 10.8, 9.8, 10.2))
+        _, order_status = self.broker.order_book.get_order(order_id1)
+        self.assertEqual(order_status, OrderStatus.FILLED)
+        self.assertEqual(self.broker.account.get_open_position('AAPL', OrderSide.LONG).get_avg_price(), 10.0)
+
+        # An order already crossed at the open fills at the open
+        order_id2 = self.broker.submit_order(Order(symbol='AAPL', side=OrderSide.LONG, order_type=OrderType.LIMIT, quantity=100, limit_price=10.0))
+        self.broker.on_bar(Bar('AAPL', 120, 9.5, 9.9, 9.4, 9.6))
+        _, order_status = self.broker.order_book.get_order(order_id2)
+        self.assertEqual(order_status, OrderStatus.FILLED)
+        self.assertEqual(self.broker.account.get_open_position('AAPL', OrderSide.LONG).get_avg_price(), 9.75)
+
+        # Bars of other symbols or bars that never reach the price don't fill
+        order_id3 = self.broker.submit_order(Order(symbol='AAPL', side=OrderSide.LONG, order_type=OrderType.STOP, quantity=10, stop_price=11.0))
+        self.broker.on_bar(Bar('AMZN', 180, 12.0, 12.0, 12.0, 12.0))
+        self.broker.on_bar(Bar('AAPL', 180, 10.0, 10.9, 9.9, 10.5))
+        _, order_status = self.broker.order_book.get_order(order_id3)
+        self.assertEqual(order_status, OrderStatus.ACCEPTED)
+
+    def test_on_bar_intrabar_path(self):
+        for path, expected in [(IntrabarPath.OHLC, ['X100001', 'X100003', 'X100002']),
+                               (IntrabarPath.OLHC, ['X100001', 'X100002', 'X100003']),
+                               (IntrabarPath.PESSIMISTIC, ['X100001', 'X100002', 'X100003'])]:
+            broker = Broker(initial_balance=10000.0)
+            broker.submit_order(Order(symbol='AAPL', side=OrderSide.LONG, order_type=OrderType.MARKET, quantity=100, market_price=10.2))
+            broker.on_trade(Trade('AAPL', 1, 10.2, 100))
+            broker.submit_order(Order(symbol='AAPL', side=OrderSide.LONG, order_type=OrderType.STOP, quantity=-50, stop_price=9.9))
+            broker.submit_order(Order(symbol='AAPL', side=OrderSide.LONG, order_type=OrderType.LIMIT, quantity=-50, limit_price=10.7))
+            broker.on_bar(Bar('AAPL', 60, 10.2, 10.8, 9.8, 10.2), path)
+            self.assertEqual(expected, [o.get_order_id() for o in broker.list_orders(OrderStatus.FILLED)])
+            closed = broker.account.get_closed_position('AAPL', OrderSide.LONG)
+            self.assertEqual(closed.get_realized_profit(), 10)
+
+    def test_on_bar_samples_equity_once(self):
+        broker = Broker(initial_balance=10000.0)
+        history = broker.account.enable_equity_history()
+        broker.submit_order(Order(symbol='AAPL', side=OrderSide.LONG, order_type=OrderType.LIMIT, quantity=100, limit_price=10.0))
+        broker.on_bar(Bar('AAPL', 60, 10.2, 10.8, 9.8, 10.2))
+        broker.on_bar(Bar('AAPL', 120, 10.2, 10.4, 10.1, 10.3))
+        # One sample per bar, marked at the close
+        self.assertEqual(history.column('timestamps').tolist(), [60, 120])
+        self.assertEqual(history.column('equity').tolist(), [10020.0, 10030.0])
+
+    def test_snapshot_fork(self):
+        self.broker.submit_order(Order(symbol='AAPL', side=OrderSide.LONG, order_type=OrderType.MARKET, quantity=100, market_price=10.0))
+        self.broker.on_trade(Trade('AAPL', 1, 10.0, 100))
+        limit_id = self.broker.submit_order(Order(symbol='AAPL', side=OrderSide.LONG, order_type=OrderType.LIMIT, quantity=-100, limit_price=11.0))
+        snapshot = self.broker.snapshot()
+
+        # The original broker keeps trading after the snapshot
+        self.broker.on_trade(Trade('AAPL', 2, 11.0, 100))
+        self.assertEqual(self.broker.order_book.get_order(limit_id)[1], OrderStatus.FILLED)
+        self.assertIsNone(self.broker.account.get_open_position('AAPL', OrderSide.LONG))
+
+        for _ in range(2):
+            fork = Broker.from_snapshot(snapshot)
+            self.assertEqual(fork.order_book.get_order(limit_id)[1], OrderStatus.ACCEPTED)
+            self.assertEqual(fork.account.get_open_position('AAPL', OrderSide.LONG).get_quantity(), 100)
+            self.assertEqual(fork.account.get_balance(), 9000.0)
+            self.assertEqual(fork.submit_order(Order(symbol='AAPL', side=OrderSide.LONG, order_type=OrderType.LIMIT, quantity=10, limit_price=9.0)), 'X100003')
+            fork.on_trade(Trade('AAPL', 3, 9.0, 100))
+            self.assertEqual(fork.account.get_open_position('AAPL', OrderSide.LONG).get_quantity(), 110)
+            self.assertEqual(fork.order_book.get_order(limit_id)[1], OrderStatus.ACCEPTED)
+            self.assertEqual(len(fork.list_orders()), 3)
+        self.assertEqual(len(self.broker.list_orders()), 2)
+
+    def test_snapshot_keeps_settings(self):
+        with tempfile.TemporaryDirectory() as archive_dir:
+            broker = Broker(initial_balance=10000.0, archive_dir=archive_dir, fixed_point=True)
+            broker.submit_order(Order(symbol='AAPL', side=OrderSide.LONG, order_type=OrderType.LIMIT, quantity=10, limit_price=10.01))
+            fork = Broker.from_snapshot(broker.snapshot())
+            self.assertTrue(fork.fixed_point)
+            self.assertEqual(fork.archive_dir, archive_dir)
+            self.assertIsInstance(fork.account, FixedPointAccount)
+            fork.on_trade(Trade('AAPL', 1, 10.0, 100))
+            self.assertEqual(fork.account.get_balance(), 9900.0)
+
+    def test_submit_orders_matches_sequential(self):
+        def make_orders():
+            orders = []
+            for i in range(60):
+                symbol = ['AAPL', 'AMZN', 'TSLA'][i % 3]
+                side = OrderSide.LONG if i % 7 < 4 else OrderSide.SHORT
+                quantity = [30, -20, 50, -40, 10][i % 5]
+                orders.append(Order(symbol=symbol, side=side, order_type=OrderType.LIMIT, quantity=quantity, limit_price=10 + i % 4))
+            return orders
+
+        sequential = Broker(initial_balance=5000.0)
+        batched = Broker(initial_balance=5000.0)
+        for broker in (sequential, batched):
+            broker.submit_order(Order(symbol='AAPL', side=OrderSide.LONG, order_type=OrderType.MARKET, quantity=100, market_price=10.0))
+            broker.submit_order(Order(symbol='AMZN', side=OrderSide.SHORT, order_type=OrderType.MARKET, quantity=100, market_price=10.0))
+            broker.on_trade(Trade('AAPL', 1, 10.0, 100))
+            broker.on_trade(Trade('AMZN', 1, 10.0, 100))
+
+        expected = [sequential.submit_order(order) for order in make_orders()]
+        accepted, rejected = batched.submit_orders(make_orders())
+        self.assertEqual(sorted(accepted + rejected), sorted(expected))
+        self.assertEqual(accepted, [o.get_order_id() for o in sequential.list_orders(OrderStatus.ACCEPTED)])
+        self.assertEqual(rejected, [o.get_order_id() for o in sequential.list_orders(OrderStatus.REJECTED)])
+        self.assertTrue(accepted and rejected)
+        self.assertEqual(batched.account.get_buying_power(), sequential.account.get_buying_power())
+
+    def test_reservation_ledger(self):
+        broker = Broker(initial_balance=100000.0)
+        broker.submit_order(Order(symbol='AAPL', side=OrderSide.LONG, order_type=OrderType.MARKET, quantity=100, market_price=10.0))
+        broker.on_trade(Trade('AAPL', 1, 10.0, 100))
+        close_id1 = broker.submit_order(Order(symbol='AAPL', side=OrderSide.LONG, order_type=OrderType.LIMIT, quantity=-60, limit_price=11.0))
+        close_id2 = broker.submit_order(Order(symbol='AAPL', side=OrderSide.LONG, order_type=OrderType.STOP, quantity=-40, stop_price=9.0))
+        broker.submit_order(Order(symbol='AAPL', side=OrderSide.LONG, order_type=OrderType.LIMIT, quantity=10, limit_price=9.5))
+        self.assertEqual(broker.ledger.reserved_close('AAPL', OrderSide.LONG), 100)
+        self.assertEqual(broker.ledger.reserved_buying_power('AAPL', OrderSide.LONG), 95.0)
+        self.assertEqual(broker.ledger.pending_opens('AAPL', OrderSide.LONG), 1)
+        self.assertFalse(broker.ledger.has_pending('AAPL', OrderSide.SHORT))
+        # Every share is already reserved, and no short can be opened against resting long orders
+        _, status = broker.order_book.get_order(broker.submit_order(Order(symbol='AAPL', side=OrderSide.LONG, order_type=OrderType.LIMIT, quantity=-1, limit_price=12.0)))
+        self.assertEqual(status, OrderStatus.REJECTED)
+        _, status = broker.order_book.get_order(broker.submit_order(Order(symbol='AAPL', side=OrderSide.SHORT, order_type=OrderType.LIMIT, quantity=1, limit_price=12.0)))
+        self.assertEqual(status, OrderStatus.REJECTED)
+
+        broker.cancel_order(close_id2)
+        broker.on_trade(Trade('AAPL', 2, 11.0, 100))
+        self.assertEqual(broker.order_book.get_order(close_id1)[1], OrderStatus.FILLED)
+        self.assertEqual(broker.ledger.reserved_close('AAPL', OrderSide.LONG), 0)
+        broker.on_trade(Trade('AAPL', 3, 9.5, 100))
+        self.assertFalse(broker.ledger.has_pending('AAPL', OrderSide.LONG))
+        self.assertEqual(broker.ledger.reserved_buying_power('AAPL', OrderSide.LONG), 0)
@@ -0,0 +1,62 @@
+import unittest
+import numpy as np
+from backtest.broker.broker import Broker, OrderStatus
+from backtest.broker.fill_simulator import NO_FILL, simulate_fills
+from backtest.broker.order import Order, OrderType, OrderSide
+from data.fetcher.polygon_data_model import Trade
+
+
+class TestFillSimulator(unittest.TestCase):
+
+    def _orders(self):
+        return [
+            Order(symbol='AAPL', side=OrderSide.LONG, order_type=OrderType.LIMIT, quantity=10, limit_price=11.5),
+            Order(symbol='AAPL', side=OrderSide.LONG, order_type=OrderType.STOP, quantity=10, stop_price=12.6),
+            Order(symbol='AAPL', side=OrderSide.LONG, order_type=OrderType.LIMIT, quantity=10, limit_price=10.0),
+            Order(symbol='AAPL', side=OrderSide.LONG, order_type=OrderType.MARKET, quantity=5, market_price=12.0),
+            Order(symbol='AMZN', side=OrderSide.SHORT, order_type=OrderType.LIMIT, quantity=10, limit_price=12.4),
+            Order(symbol='AMZN', side=OrderSide.SHORT, order_type=OrderType.STOP, quantity=10, stop_price=11.4),
+        ]
+
+    def test_simulate_fills(self):
+        prices = np.array([12.0, 12.2, 11.5, 12.6, 11.4])
+        fill_index, fill_price = simulate_fills(prices, self._orders())
+        self.assertEqual([2, 3, NO_FILL, 0, 3, 4], fill_index.tolist())
+        self.assertEqual(11.5, fill_price[0])
+        self.assertEqual(12.6, fill_price[1])
+        self.assertTrue(np.isnan(fill_price[2]))
+
+    def test_on_trades_matches_on_trade(self):
+        rng = np.random.default_rng(7)
+        prices = np.round(12 + np.cumsum(rng.normal(0, 0.05, 2000)), 2)
+        timestamps = np.arange(len(prices), dtype=np.int64) * 1000
+        sizes = np.full(len(prices), 100)
+        event_broker = Broker(initial_balance=100000.0)
+        batch_broker = Broker(initial_balance=100000.0)
+        for broker in (event_broker, batch_broker):
+            broker.account.enable_equity_history()
+            for order in self._orders():
+                broker.submit_order(order)
+        expected_rows = []
+        for k, symbol in enumerate(('AAPL', 'AMZN')):
+            for i in range(len(prices)):
+                event_broker.on_trade(Trade(symbol, timestamps[i], float(prices[i]), sizes[i]))
+            fills = batch_broker.on_trades(symbol, timestamps, prices, sizes)
+            # on_trades samples the trades that fill and the last one
+            expected_rows += [k * len(prices) + i for i in sorted({index for _, index, _ in fills} | {len(prices) - 1})]
+        for column in ('timestamps', 'equity', 'balance'):
+            self.assertEqual(event_broker.account.equity_history.column(column)[expected_rows].tolist(),
+                             batch_broker.account.equity_history.column(column).tolist())
+
+        self.assertEqual(event_broker.account.get_balance(), batch_broker.account.get_balance())
+        self.assertEqual(event_broker.account.get_buying_power(), batch_broker.account.get_buying_power())
+        for status in OrderStatus:
+            self.assertEqual([o.get_order_id() for o in event_broker.list_orders(status)],
+                             [o.get_order_id() for o in batch_broker.list_orders(status)])
+        for key, position in event_broker.account.open_positions.items():
+            self.assertEqual(position.get_quantity(), batch_broker.account.open_positions[key].get_quantity())
+            self.assertEqual(position.get_avg_price(), batch_broker.account.open_positions[key].get_avg_price())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+from backtest.broker.broker import Broker
+from backtest.broker.journal import EventJournal, EventType, LoggingSink
+from backtest.broker.order import Order, OrderSide, OrderType
+from data.fetcher.polygon_data_model import Trade
+
+
+class TestEventJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.broker = Broker(initial_balance=10000.0)
+
+    def _order(self, quantity=100, price=12.3):
+        return Order(symbol='AAPL', side=OrderSide.LONG, order_type=OrderType.LIMIT, quantity=quantity, limit_price=price)
+
+    def test_broker_events(self):
+        self.broker.on_trade(Trade('AAPL', 100, 12.5, 100))
+        order_id1 = self.broker.submit_order(self._order())
+        order_id2 = self.broker.submit_order(self._order(quantity=1000))
+        order_id3 = self.broker.submit_order(self._order(quantity=10, price=11.0))
+        self.broker.on_trade(Trade('AAPL', 200, 12.2, 100))
+        self.broker.cancel_order(order_id3)
+
+        events = self.broker.journal.list_events()
+        self.assertEqual([(e.event, e.order_id) for e in events], [
+            (EventType.ACCEPTED, order_id1),
+            (EventType.REJECTED, order_id2),
+            (EventType.ACCEPTED, order_id3),
+            (EventType.FILLED, order_id1),
+            (EventType.CANCELED, order_id3),
+        ])
+        self.assertEqual(events[0].timestamp, 100)
+        self.assertEqual(events[3].timestamp, 200)
+        self.assertEqual(events[3].price, 12.2)
+        self.assertEqual(events[3].side, OrderSide.LONG)
+        frame = self.broker.journal.to_frame()
+        self.assertEqual(list(frame['event']), ['ACCEPTED', 'REJECTED', 'ACCEPTED', 'FILLED', 'CANCELED'])
+
+    def test_ring_buffer(self):
+        journal = EventJournal(capacity=3)
+        orders = [self._order(quantity=i + 1) for i in range(5)]
+        for i, order in enumerate(orders):
+            order.set_order_id(str(i))
+            journal.record(EventType.ACCEPTED, i, order, order.get_price())
+        self.assertEqual(len(journal), 3)
+        self.assertEqual(journal.dropped, 2)
+        self.assertEqual([e.order_id for e in journal.list_events()], ['2', '3', '4'])
+
+    def test_growable_journal_and_sinks(self):
+        seen = []
+        journal = EventJournal(capacity=None, sinks=[seen.append, LoggingSink('DEBUG')])
+        order = self._order()
+        order.set_order_id('X1')
+        for i in range(3000):
+            journal.record(EventType.ACCEPTED, i, order, 12.3)
+        self.assertEqual(len(journal), 3000)
+        self.assertEqual(journal.dropped, 0)
+        self.assertEqual(len(seen), 3000)
+        self.assertEqual(journal.list_events()[-1].timestamp, 2999)
+
+    def test_disabled_journal(self):
+        broker = Broker(initial_balance=10000.0, enable_journal=False)
+        broker.submit_order(self._order())
+        self.assertIsNone(broker.journal)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+import unittest
+import pandas as pd
+from backtest.broker.broker import OrderStatus
+from backtest.broker.journal import EventType
+from backtest.exceptions.ares_exception import AresException
+from backtest.broker.order import Order, OrderSide, OrderType
+from backtest.orchestrator.orchestrator import Ares
+from backtest.strategy.strategy import BaseStrategy
+from data.feed.bar_aggregator import BarAggregator
+from data.fetcher.polygon_data_model import Trade
+
+
+class RecordingStrategy(BaseStrategy):
+    def __init__(self):
+        super().__init__()
+        self.trades = []
+        self.bars = []
+
+    def on_trade(self, trade):
+        self.trades.append(trade.timestamp)
+        if self.warming_up and self.broker:
+            self.broker.submit_order(Order(symbol=trade.symbol, side=OrderSide.LONG, order_type=OrderType.MARKET, quantity=1, market_price=trade.price))
+
+    def on_bar(self, bar):
+        self.bars.append(bar)
+
+
+class BuyOnceStrategy(BaseStrategy):
+    def __init__(self, symbol):
+        super().__init__()
+        self.symbol = symbol
+        self.order_id = None
+
+    def on_trade(self, trade):
+        if trade.symbol == self.symbol and self.order_id is None:
+            order = Order(symbol=self.symbol, side=OrderSide.LONG, order_type=OrderType.LIMIT, quantity=10, limit_price=trade.price - 0.05)
+            self.order_id = self.broker.submit_order(order)
+
+
+class TestAres(unittest.TestCase):
+
+    def setUp(self):
+        self.trades = [Trade('AMD', i, 80 + i * 0.01, 100) for i in range(50)]
+        self.strategy = RecordingStrategy()
+        self.ares = Ares()
+        self.ares.configure_backtest(lambda trade: None, self.strategy, 'AMD')
+
+    def test_bark_from_generator(self):
+        self.ares.load_data((t for t in self.trades), chunk_size=8, prefetch=2)
+        self.ares.bark()
+        self.assertEqual(self.strategy.trades, list(range(50)))
+
+    def test_bark_merges_symbols_in_time_order(self):
+        streams = {
+            'AMD': [Trade('AMD', ts, 80.0, 100) for ts in [1, 4, 4, 9]],
+            'AAPL': (Trade('AAPL', ts, 160.0, 100) for ts in [2, 3, 4, 10]),
+            'TSLA': [Trade('TSLA', ts, 180.0, 100) for ts in [0, 11]],
+        }
+        self.ares.load_data(streams, chunk_size=2)
+        self.ares.bark()
+        self.assertEqual(self.strategy.trades, [0, 1, 2, 3, 4, 4, 4, 9, 10, 11])
+
+    def test_bark_dispatches_to_broker(self):
+        strategy = BuyOnceStrategy('AMD')
+        ares = Ares()
+        ares.configure_backtest(None, strategy, ['AMD', 'AAPL'])
+        ares.load_data({
+            'AMD': [Trade('AMD', ts, price, 100) for ts, price in [(1, 80.0), (5, 79.9), (7, 79.95)]],
+            'AAPL': [Trade('AAPL', ts, 160.0, 100) for ts in [2, 6]],
+        })
+        ares.bark()
+        _, order_status = ares.broker.order_book.get_order(strategy.order_id)
+        self.assertEqual(order_status, OrderStatus.FILLED)
+        self.assertEqual(ares.broker.account.get_open_position('AMD', OrderSide.LONG).get_avg_price(), 79.9)
+
+    def test_replay_window(self):
+        self.ares.load_data((t for t in self.trades), chunk_size=8)
+        self.assertEqual(len(self.ares.build_index()), 50)
+        self.ares.replay(20, 30)
+        self.assertEqual(self.strategy.trades, list(range(20, 30)))
+        self.strategy.trades = []
+        self.ares.replay(45)
+        self.assertEqual(self.strategy.trades, list(range(45, 50)))
+
+    def test_replay_warmup(self):
+        self.ares.load_data(self.trades)
+        self.ares.replay(20, 25, warmup_ns=5)
+        self.assertEqual(self.strategy.trades, list(range(15, 25)))
+        # Orders submitted during warm-up are rejected
+        self.assertEqual(len(self.ares.broker.list_orders(OrderStatus.REJECTED)), 5)
+        self.assertEqual(len(self.ares.broker.list_orders(OrderStatus.ACCEPTED)), 0)
+        self.assertTrue(self.ares.broker.trading_enabled)
+        self.assertFalse(self.strategy.warming_up)
+
+    def test_fork(self):
+        ares = Ares()
+        ares.configure_backtest(None, BuyOnceStrategy('AMD'), 'AMD')
+        ares.load_data(self.trades)
+        ares.replay(end_ns=10)
+        snapshot = ares.broker.snapshot()
+        for _ in range(2):
+            strategy = RecordingStrategy()
+            fork = ares.fork(snapshot, strategy)
+            fork.replay(start_ns=10, warmup_ns=3)
+            self.assertEqual(strategy.trades, list(range(7, 50)))
+            self.assertIs(fork.batch, ares.batch)
+            # The limit order resting at the fork point can't fill on the rising tape
+            self.assertEqual(len(fork.broker.list_orders(OrderStatus.ACCEPTED)), 1)
+            self.assertEqual(len(fork.broker.list_orders(OrderStatus.REJECTED)), 3)
+        self.assertEqual(len(ares.broker.list_orders()), 1)
+
+    def test_fork_setup(self):
+        ares = Ares()
+        ares.configure_backtest(None, BuyOnceStrategy('AMD'), 'AMD')
+        ares.load_data(self.trades)
+        ares.enable_profiling()
+        snapshot = ares.broker.snapshot()
+        fork = ares.fork(snapshot, RecordingStrategy())
+        self.assertIsNotNone(fork.profiler)
+        self.assertIsNot(fork.profiler, ares.profiler)
+        ares.disable_profiling()
+
+        # Other strategies and bar aggregators can't be carried over
+        ares.add_bar_aggregator(BarAggregator())
+        with self.assertRaises(AresException):
+            ares.fork(snapshot, RecordingStrategy())
+        ares.bar_aggregators = []
+        ares.add_strategy(RecordingStrategy())
+        with self.assertRaises(AresException):
+            ares.fork(snapshot, RecordingStrategy())
+
+    def test_multiple_strategies_single_pass(self):
+        first, second, idle = BuyOnceStrategy('AMD'), BuyOnceStrategy('AMD'), RecordingStrategy()
+        ares = Ares()
+        ares.configure_backtest(None, first, 'AMD', starting_cash=30000)
+        second_broker = ares.add_strategy(second, starting_cash=500)
+        idle_broker = ares.add_strategy(idle)
+        ares.load_data([Trade('AMD', ts, price, 100) for ts, price in [(1, 80.0), (5, 79.9), (7, 79.95)]])
+        ares.bark()
+
+        self.assertEqual(idle.trades, [1, 5, 7])
+        # Accounts and order books are isolated
+        self.assertEqual(ares.broker.order_book.get_order(first.order_id)[1], OrderStatus.FILLED)
+        self.assertEqual(second_broker.order_book.get_order(second.order_id)[1], OrderStatus.REJECTED)
+        self.assertEqual(len(ares.broker.list_orders()), 1)
+        self.assertEqual(second_broker.account.get_balance(), 500)
+        # A broker without orders or positions never receives a trade, but its clock follows the replay
+        self.assertEqual(idle_broker.account.last_prices, {})
+        self.assertEqual(idle_broker.last_timestamp, 7)
+
+    def test_journal_timestamps_on_fast_path(self):
+        for extra_strategy in (False, True):
+            strategy = BuyOnceStrategy('AMD')
+            ares = Ares()
+            ares.configure_backtest(None, strategy, 'AMD')
+            if extra_strategy:
+                ares.add_strategy(RecordingStrategy())
+            ares.load_data([Trade('AMD', ts, price, 100) for ts, price in [(1000, 80.0), (2000, 80.5), (3000, 79.9)]])
+            ares.bark()
+            events = [(event.event, event.timestamp) for event in ares.broker.journal.list_events()]
+            # The broker skipped the first trade, the order is still journaled at it
+            self.assertEqual(events, [(EventType.ACCEPTED, 1000), (EventType.FILLED, 3000)])
+
+    def test_bar_aggregator(self):
+        start = 1679578200000000000
+        other = RecordingStrategy()
+        self.ares.add_strategy(other)
+        aggregator = self.ares.add_bar_aggregator(BarAggregator())
+        aggregator.subscribe(1, self.strategy.on_bar)
+        aggregator.subscribe(1, other.on_bar)
+        self.ares.load_data([Trade('AMD', start + ts * 10**9, price, 100) for ts, price in [(1, 80.0), (30, 80.5), (61, 79.9)]])
+        self.ares.bark()
+
+        # The last bar is flushed at the end of the data
+        for strategy in (self.strategy, other):
+            self.assertEqual([(bar.timestamp, bar.open, bar.close, bar.volume) for bar in strategy.bars],
+                             [(start, 80.0, 80.5, 200), (start + 60 * 10**9, 79.9, 79.9, 100)])
+
+    def test_bark_bars(self):
+        bars = pd.DataFrame({
+            'timestamp': pd.date_range('2023-03-23 09:30', periods=3, freq='1min', tz='America/New_York'),
+            'open': [80.0, 80.5, 79.5],
+            'close': [80.4, 79.6, 79.9],
+            'high': [80.6, 80.7, 80.0],
+            'low': [79.9, 79.5, 79.2],
+            'v': [1000, 1200, 900],
+            'vw': [80.2, 80.1, 79.6],
+        })
+        self.ares.load_bars(bars)
+        self.strategy.register_broker(self.ares.broker)
+        self.ares.broker.submit_order(Order(symbol='AMD', side=OrderSide.LONG, order_type=OrderType.LIMIT, quantity=10, limit_price=79.7))
+        self.ares.bark_bars()
+        self.assertEqual([bar.close for bar in self.strategy.bars], [80.4, 79.6, 79.9])
+        self.assertEqual(self.strategy.bars[0].timestamp, pd.Timestamp('2023-03-23 09:30', tz='America/New_York').value)
+        self.assertEqual(self.ares.broker.account.get_open_position('AMD', OrderSide.LONG).get_avg_price(), 79.7)
+
+
+if __name__ == '__main__':
+    unittest.main()
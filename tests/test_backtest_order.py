@@ -21,6 +21,7 @@ class TestOrder(unittest.TestCase):
         self.assertEqual(order2.get_side(), OrderSide.SHORT)
         self.assertIsNone(order2.get_order_id())
         self.assertEqual(order2.get_price(), 100.0)
+        self.assertEqual(order2.get_price_ticks(), 1000000)
 
     def test_order_creation_with_exception(self):
         with self.assertRaisesRegex(BrokerException, "You must and only can specify market price for a market order"):
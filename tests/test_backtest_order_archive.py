@@ -0,0 +1,113 @@
+import os
+import tempfile
+import unittest
+from backtest.broker.broker import OrderBook, OrderStatus
+from backtest.broker.order import Order, OrderSide, OrderType
+from backtest.broker.order_archive import OrderArchive
+from backtest.exceptions.broker_exception import BrokerException
+
+
+def make_order(i):
+    order = Order(symbol=['AAPL', 'AMZN'][i % 2], side=OrderSide.LONG, order_type=OrderType.LIMIT, quantity=i + 1, limit_price=10.0 + i)
+    order.set_order_id('X{}'.format(100000 + i))
+    return order
+
+
+class TestOrderArchive(unittest.TestCase):
+
+    def test_spill_to_disk(self):
+        with tempfile.TemporaryDirectory() as spill_dir:
+            archive = OrderArchive(chunk_size=4, spill_dir=spill_dir)
+            for i in range(10):
+                archive.append(make_order(i), i, OrderStatus.FILLED.value if i % 3 else OrderStatus.CANCELED.value)
+            self.assertEqual(len(archive), 10)
+            self.assertEqual(len(archive.chunks), 2)
+            # One file per sealed chunk with its columns, IDs and the two lookup tables
+            self.assertEqual(len(os.listdir(archive.spill.path)), 2)
+
+            order, status = archive.get('X100005')
+            self.assertEqual((order.get_symbol(), order.get_quantity(), order.get_price()), ('AMZN', 6, 15.0))
+            self.assertEqual(order.get_order_type(), OrderType.LIMIT)
+            self.assertEqual(status, OrderStatus.FILLED.value)
+            self.assertEqual(list(archive.rows(OrderStatus.CANCELED.value)), [0, 3, 6, 9])
+            self.assertEqual(list(archive.rows(OrderStatus.FILLED.value, 'AAPL')), [2, 4, 8])
+            self.assertEqual(len(archive.rows(symbol='TSLA')), 0)
+
+    def test_copy_shares_rows(self):
+        archive = OrderArchive(chunk_size=4)
+        for i in range(6):
+            archive.append(make_order(i), i, OrderStatus.FILLED.value)
+        copy = archive.copy()
+        # Sealed chunks and the partial active chunk are shared instead of copied
+        self.assertIs(copy.chunks[-1], archive.chunks[-1])
+        self.assertIs(copy.active, archive.active)
+        archive.append(make_order(6), 6, OrderStatus.CANCELED.value)
+        copy.append(make_order(7), 7, OrderStatus.FILLED.value)
+        self.assertIn('X100006', archive)
+        self.assertNotIn('X100006', copy)
+        self.assertEqual(copy.get('X100007')[1], OrderStatus.FILLED.value)
+        self.assertEqual(copy.get('X100002')[0].get_quantity(), 3)
+        self.assertEqual(list(copy.rows(OrderStatus.FILLED.value, 'AAPL')), [0, 2, 4])
+        self.assertEqual(archive.count(OrderStatus.CANCELED.value), 1)
+        self.assertEqual(copy.count(OrderStatus.FILLED.value, 'AMZN'), 4)
+        with self.assertRaises(KeyError):
+            copy.get('X100099')
+
+    def test_copy_churn_does_not_seal(self):
+        with tempfile.TemporaryDirectory() as spill_dir:
+            archive = OrderArchive(chunk_size=64, spill_dir=spill_dir)
+            copies = []
+            for i in range(100):
+                copies.append(archive.copy())
+                archive.append(make_order(i), i, OrderStatus.CANCELED.value)
+            # Only full chunks are sealed and spilled
+            self.assertEqual(len(archive.chunks), 1)
+            self.assertEqual(len(os.listdir(archive.spill.path)), 1)
+            self.assertEqual([len(copy) for copy in copies[:3]], [0, 1, 2])
+            self.assertEqual(copies[50].count(OrderStatus.CANCELED.value), 50)
+            self.assertNotIn('X100050', copies[50])
+            copies[50].append(make_order(500), 500, OrderStatus.FILLED.value)
+            self.assertEqual(list(copies[50].rows(OrderStatus.FILLED.value)), [50])
+            self.assertEqual(archive.get('X100050')[1], OrderStatus.CANCELED.value)
+            self.assertEqual(list(archive.rows(OrderStatus.FILLED.value)), [])
+
+    def test_spill_directory_is_removed(self):
+        with tempfile.TemporaryDirectory() as spill_dir:
+            archive = OrderArchive(chunk_size=2, spill_dir=spill_dir)
+            for i in range(5):
+                archive.append(make_order(i), i, OrderStatus.FILLED.value)
+            copy = archive.copy()
+            path = archive.spill.path
+            archive.close()
+            # The copy still reads the spilled chunks
+            self.assertTrue(os.path.isdir(path))
+            self.assertEqual(copy.get('X100001')[0].get_quantity(), 2)
+            del copy
+            self.assertFalse(os.path.exists(path))
+
+    def test_order_book_archives_terminal_orders(self):
+        book = OrderBook(OrderArchive(chunk_size=2))
+        orders = [make_order(i) for i in range(6)]
+        for order in orders:
+            book.add_order(order, OrderStatus.ACCEPTED)
+        for order in orders[4::-2]:
+            book.update_order(order.get_order_id(), OrderStatus.FILLED)
+        book.update_order('X100001', OrderStatus.CANCELED)
+        self.assertEqual(sorted(book.order_book), ['X100003', 'X100005'])
+        self.assertEqual(len(book.archive), 4)
+
+        _, status = book.get_order('X100002')
+        self.assertEqual(status, OrderStatus.FILLED)
+        self.assertEqual([o.get_order_id() for o in book.list_orders(OrderStatus.FILLED)], ['X100004', 'X100002', 'X100000'])
+        self.assertEqual([o.get_order_id() for o in book.list_orders(symbol='AMZN')], ['X100001', 'X100003', 'X100005'])
+        self.assertEqual([o.get_order_id() for o in book.list_orders()], ['X10000{}'.format(i) for i in range(6)])
+        self.assertEqual(book.count_orders(OrderStatus.FILLED, 'AAPL'), 3)
+        self.assertEqual(book.count_orders(symbol='AMZN'), 3)
+        with self.assertRaises(BrokerException):
+            book.update_order('X100002', OrderStatus.CANCELED)
+
+        fork = book.fork()
+        fork.update_order('X100003', OrderStatus.FILLED)
+        self.assertEqual(book.get_order('X100003')[1], OrderStatus.ACCEPTED)
+        self.assertEqual(fork.get_order('X100003')[1], OrderStatus.FILLED)
+        self.assertEqual(len(book.archive), 4)
@@ -0,0 +1,52 @@
+import unittest
+from backtest.analytics.profiler import BacktestProfiler
+from backtest.broker.order import Order, OrderSide, OrderType
+from backtest.orchestrator.orchestrator import Ares
+from backtest.strategy.strategy import BaseStrategy
+from data.fetcher.polygon_data_model import Trade
+
+
+class EveryTenthTickStrategy(BaseStrategy):
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def on_trade(self, trade):
+        self.count += 1
+        if self.count % 10 == 0:
+            self.broker.submit_order(Order(symbol=trade.symbol, side=OrderSide.LONG, order_type=OrderType.LIMIT,
+                                           quantity=1, limit_price=trade.price - 1))
+
+
+class TestBacktestProfiler(unittest.TestCase):
+
+    def test_profile_report(self):
+        ares = Ares()
+        ares.configure_backtest(None, EveryTenthTickStrategy(), 'AMD')
+        ares.load_data([Trade('AMD', i, 80.0 - i * 0.01, 100) for i in range(100)])
+        ares.enable_profiling()
+        ares.bark()
+        report = ares.profile_report()
+        self.assertEqual(report['ticks'], 100)
+        self.assertEqual(report['orders'], 10)
+        self.assertGreater(report['ticks_per_sec'], 0)
+        self.assertEqual(report['stages']['strategy.on_trade']['calls'], 100)
+        self.assertEqual(report['stages']['broker.submit_order']['calls'], 10)
+        self.assertIn('broker.on_trade', report['stages'])
+        self.assertEqual(report['tick_to_order_latency']['count'], 10)
+        self.assertEqual(sum(report['tick_to_order_latency']['histogram_ns'].values()), 10)
+
+        ares.disable_profiling()
+        self.assertNotIn('submit_order', ares.broker.__dict__)
+        self.assertNotIn('update_position', ares.broker.account.__dict__)
+        self.assertEqual(ares.profile_report(), {})
+
+    def test_latency_histogram(self):
+        profiler = BacktestProfiler()
+        for latency in [0, 1, 1000, 1023, 1024]:
+            profiler.record_latency(latency)
+        self.assertEqual(profiler.report()['tick_to_order_latency']['histogram_ns'], {2: 2, 1024: 2, 2048: 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
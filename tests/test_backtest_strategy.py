@@ -0,0 +1,75 @@
+import unittest
+import numpy as np
+import pandas as pd
+from backtest.exceptions.ares_exception import AresException
+from backtest.orchestrator.orchestrator import Ares
+from backtest.strategy.strategy import VectorizedStrategy
+from data.fetcher.polygon_data_model import Bar, Trade, TradeBatch
+
+
+class MovingAverageStrategy(VectorizedStrategy):
+    def __init__(self, window):
+        super().__init__()
+        self.window = window
+        self.seen = []
+
+    def init(self, data):
+        column = 'price' if 'price' in data else 'close'
+        self.add_signal('sma', data[column].rolling(self.window).mean().to_numpy())
+
+    def on_trade(self, trade):
+        self.seen.append((self.i, trade.price, self.signal('sma')))
+
+    def on_bar(self, bar):
+        self.seen.append((self.i, bar.close, self.signal('sma')))
+
+
+class TestVectorizedStrategy(unittest.TestCase):
+
+    def setUp(self):
+        self.prices = [80.0, 80.2, 80.4, 80.3, 80.1, 80.5]
+        self.trades = [Trade('AMD', i, price, 100) for i, price in enumerate(self.prices)]
+        self.expected_sma = pd.Series(self.prices).rolling(3).mean().to_numpy()
+
+    def _run(self, data, **kwargs):
+        strategy = MovingAverageStrategy(3)
+        ares = Ares()
+        ares.configure_backtest(None, strategy, 'AMD')
+        ares.load_data(data, **kwargs)
+        ares.bark()
+        return strategy
+
+    def test_signals_by_index(self):
+        for data in [self.trades, (t for t in self.trades), TradeBatch.from_trades(self.trades)]:
+            strategy = self._run(data, chunk_size=4)
+            self.assertEqual([i for i, _, _ in strategy.seen], list(range(len(self.prices))))
+            self.assertEqual([p for _, p, _ in strategy.seen], self.prices)
+            np.testing.assert_array_equal([s for _, _, s in strategy.seen], self.expected_sma)
+            self.assertEqual(list(strategy.data.columns), ['symbol', 'timestamp', 'price', 'quantity'])
+
+    def test_signals_in_partial_replay(self):
+        strategy = MovingAverageStrategy(3)
+        ares = Ares()
+        ares.configure_backtest(None, strategy, 'AMD')
+        ares.load_data(self.trades)
+        ares.replay(3, 5, warmup_ns=1)
+        self.assertEqual([i for i, _, _ in strategy.seen], [2, 3, 4])
+        np.testing.assert_array_equal([s for _, _, s in strategy.seen], self.expected_sma[2:5])
+
+    def test_signals_in_bar_mode(self):
+        strategy = MovingAverageStrategy(3)
+        ares = Ares()
+        ares.configure_backtest(None, strategy, 'AMD')
+        ares.load_bars([Bar('AMD', i * 60, p, p, p, p) for i, p in enumerate(self.prices)])
+        ares.bark_bars()
+        np.testing.assert_array_equal([s for _, _, s in strategy.seen], self.expected_sma)
+
+    def test_signal_length_mismatch(self):
+        strategy = MovingAverageStrategy(3)
+        strategy.init_signals(pd.DataFrame({'price': self.prices}))
+        with self.assertRaises(AresException):
+            strategy.add_signal('short', [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
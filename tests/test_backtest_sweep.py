@@ -0,0 +1,57 @@
+import unittest
+import numpy as np
+from backtest.broker.broker import OrderStatus
+from backtest.broker.order import Order, OrderSide, OrderType
+from backtest.strategy.strategy import BaseStrategy
+from backtest.study.sweep import ParameterSweep, SharedTradeData, expand_grid
+from data.fetcher.polygon_data_model import TradeBatch
+
+
+class DipBuyStrategy(BaseStrategy):
+    def __init__(self, dip, take_profit):
+        super().__init__()
+        self.dip = dip
+        self.take_profit = take_profit
+        self.entry_id = None
+        self.exit_id = None
+
+    def on_trade(self, trade):
+        if self.entry_id is None:
+            self.entry_price = trade.price - self.dip
+            self.entry_id = self.broker.submit_order(Order(symbol=trade.symbol, side=OrderSide.LONG, order_type=OrderType.LIMIT,
+                                                           quantity=10, limit_price=self.entry_price))
+        elif self.exit_id is None and self.broker.order_book.get_order(self.entry_id)[1] == OrderStatus.FILLED:
+            self.exit_id = self.broker.submit_order(Order(symbol=trade.symbol, side=OrderSide.LONG, order_type=OrderType.LIMIT,
+                                                          quantity=-10, limit_price=self.entry_price + self.take_profit))
+
+
+class TestParameterSweep(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        prices = np.round(80 + np.cumsum(rng.normal(0, 0.05, 3000)), 2)
+        self.batch = TradeBatch.from_arrays('AMD', np.arange(len(prices)), prices, np.full(len(prices), 100))
+
+    def test_expand_grid(self):
+        self.assertEqual(expand_grid({'a': [1, 2], 'b': ['x']}), [{'a': 1, 'b': 'x'}, {'a': 2, 'b': 'x'}])
+
+    def test_shared_trade_data(self):
+        with SharedTradeData(self.batch) as shared:
+            attached = SharedTradeData.attach(shared.descriptor)
+            self.assertEqual(attached.symbols, ['AMD'])
+            self.assertTrue(np.array_equal(attached.prices, self.batch.prices))
+            self.assertTrue(np.array_equal(attached.timestamps, self.batch.timestamps))
+
+    def test_sweep_matches_serial_run(self):
+        grid = {'dip': [0.1, 0.3], 'take_profit': [0.2, 0.5]}
+        serial = ParameterSweep(DipBuyStrategy, self.batch, starting_cash=10000, processes=1).run(grid)
+        parallel = ParameterSweep(DipBuyStrategy, self.batch, starting_cash=10000, processes=2).run(grid)
+        self.assertEqual(len(parallel), 4)
+        self.assertEqual(serial, parallel)
+        self.assertEqual(parallel[0]['params'], {'dip': 0.1, 'take_profit': 0.2})
+        self.assertEqual(parallel[0]['fills'], 2)
+        self.assertGreater(parallel[0]['realized_profit'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+import numpy as np
+from benchmarks import synthetic
+from benchmarks.run import compare, result
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_tick_arrays(self):
+        timestamps, prices, sizes = synthetic.tick_arrays(1000, seed=1)
+        self.assertTrue(np.all(np.diff(timestamps) >= 0))
+        self.assertEqual(len(prices), 1000)
+        self.assertEqual(sizes.dtype, np.int32)
+        np.testing.assert_array_equal(timestamps, synthetic.tick_arrays(1000, seed=1)[0])
+
+    def test_trade_batch_yields_python_values(self):
+        # Boxing numpy scalars per property read made the batch replay slower than a list of trades
+        trade = next(iter(synthetic.trade_batch(10)))
+        self.assertEqual([type(trade.timestamp), type(trade.price), type(trade.quantity)], [int, float, int])
+
+    def test_compare(self):
+        baseline = {'benchmarks': [result('ares.bark', {'ticks': 10}, [2.0, 3.0], 10)]}
+        current = {'benchmarks': [result('ares.bark', {'ticks': 10}, [1.0], 10),
+                                  result('broker.on_trade', {'ticks': 10}, [1.0], 10)]}
+        lines = compare(current, baseline)
+        self.assertEqual(len(lines), 1)
+        self.assertIn('x2.00', lines[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+import numpy as np
+import pandas as pd
+from data.feed.bar_aggregator import BarAggregator
+from data.feed.trade_feed import bars_from_frame
+from data.fetcher.polygon_data_model import Trade
+from utils.data_utils import DataUtils
+
+
+class TestBarAggregator(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        timestamps = np.sort(np.concatenate([1679578200000000000 + rng.integers(0, 3600 * 10**9, 1000),
+                                             1679664600000000000 + rng.integers(0, 600 * 10**9, 200)]))
+        self.frame = pd.DataFrame({'symbol': 'AMD', 'timestamp': timestamps,
+                                   'price': np.round(80 + rng.normal(0, 1, len(timestamps)), 2),
+                                   'quantity': rng.integers(1, 500, len(timestamps))})
+        self.trades = [Trade('AMD', int(ts), float(p), int(q)) for ts, p, q in
+                       zip(self.frame['timestamp'], self.frame['price'], self.frame['quantity'])]
+
+    def assert_bars_equal(self, bars, frame):
+        expected = [bar.to_dict() for bar in bars_from_frame(frame, 'AMD')]
+        pd.testing.assert_frame_equal(pd.DataFrame.from_records([bar.to_dict() for bar in bars]),
+                                      pd.DataFrame.from_records(expected), check_dtype=False)
+
+    def test_matches_resample_xmin_bars(self):
+        aggregator = BarAggregator()
+        bars = {1: [], 5: [], 15: []}
+        for multiplier, received in bars.items():
+            aggregator.subscribe(multiplier, received.append)
+        for trade in self.trades:
+            aggregator.on_trade(trade)
+        aggregator.flush()
+        for multiplier, received in bars.items():
+            expected = DataUtils.resample_xmin_bars(self.frame, multiplier)
+            self.assert_bars_equal(received, expected[expected['v'] > 0])
+
+    def test_emit_empty(self):
+        aggregator = BarAggregator(emit_empty=True)
+        bars = []
+        aggregator.subscribe(30, bars.append)
+        for trade in self.trades:
+            aggregator.on_trade(trade)
+        aggregator.flush()
+        self.assert_bars_equal(bars, DataUtils.resample_xmin_bars(self.frame, 30))
+
+    def test_bar_is_emitted_on_boundary(self):
+        aggregator = BarAggregator()
+        bars = []
+        aggregator.subscribe(1, bars.append)
+        start = 1679578200000000000
+        aggregator.on_trade(Trade('AMD', start, 80.0, 100))
+        aggregator.on_trade(Trade('AAPL', start + 10**9, 160.0, 10))
+        aggregator.on_trade(Trade('AMD', start + 30 * 10**9, 81.0, 300))
+        self.assertEqual(bars, [])
+        aggregator.on_trade(Trade('AMD', start + 60 * 10**9, 82.0, 100))
+        self.assertEqual([bar.to_dict() for bar in bars], [{'symbol': 'AMD', 'timestamp': start, 'open': 80.0, 'high': 81.0,
+                                                            'low': 80.0, 'close': 81.0, 'v': 400, 'vw': 80.75}])
+        # Symbols are aggregated separately
+        aggregator.flush()
+        self.assertEqual([(bar.symbol, bar.timestamp) for bar in bars[1:]], [('AMD', start + 60 * 10**9), ('AAPL', start)])
+
+if __name__ == '__main__':
+    unittest.main()
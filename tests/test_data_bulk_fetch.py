@@ -0,0 +1,112 @@
+import threading
+import unittest
+from types import SimpleNamespace
+import pandas as pd
+from data.fetcher.bulk_fetch import RateLimitedClient, RateLimiter, is_transient, with_retries
+from data.fetcher.polygon_data_fetcher import PolygonDataFetcher
+
+
+class FlakyClient(object):
+    '''Serves ten trades per (ticker, day) and fails the first request of every ticker.'''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.failed = set()
+        self.requests = 0
+
+    def list_trades(self, ticker, timestamp_gte, timestamp_lte, limit, sort, order):
+        with self.lock:
+            self.requests += 1
+            if ticker not in self.failed:
+                self.failed.add(ticker)
+                raise ConnectionError('connection reset')
+        step = (timestamp_lte - timestamp_gte) // 10
+        return iter([SimpleNamespace(sip_timestamp=timestamp_gte + i * step, price=10.0 + i, size=100 + i / 4) for i in range(10)])
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestBulkFetch(unittest.TestCase):
+
+    def test_fetch_trades_bulk(self):
+        client = FlakyClient()
+        fetcher = PolygonDataFetcher(client=client)
+        results = fetcher.fetch_trades_bulk(['AMD', 'AAPL', 'TSLA'], ['2023-04-03', '2023-04-04'], max_workers=4,
+                                            requests_per_second=1000, backoff=0, limit=4)
+        self.assertEqual(len(results), 6)
+        trades = results[('AMD', '2023-04-04')]
+        self.assertEqual(len(trades), 10)
+        self.assertEqual(trades.symbols, ['AMD'])
+        self.assertEqual(trades.timestamps[0], pd.Timestamp('2023-04-04 09:30', tz='America/New_York').value)
+        self.assertEqual(list(trades.prices), [10.0 + i for i in range(10)])
+        self.assertEqual(list(trades.sizes), [100 + i / 4 for i in range(10)])
+        self.assertEqual(client.requests, 9)
+
+        received = []
+        results = fetcher.fetch_trades_bulk(['AMD'], ['2023-04-03'], callback=lambda symbol, day, batch: received.append((symbol, day, len(batch))))
+        self.assertEqual(results, {})
+        self.assertEqual(received, [('AMD', '2023-04-03', 10)])
+
+        results = fetcher.fetch_trades_bulk(['AMD'], ['2023-04-03'], prefetch=0, limit=3)
+        self.assertEqual(list(results[('AMD', '2023-04-03')].prices), [10.0 + i for i in range(10)])
+
+    def test_fetch_trades_bulk_stops_on_failure(self):
+        client = FlakyClient()
+        list_trades = client.list_trades
+
+        def failing(ticker, **kwargs):
+            if ticker == 'BAD':
+                with client.lock:
+                    client.requests += 1
+                raise ValueError('unknown ticker')
+            return list_trades(ticker, **kwargs)
+        client.list_trades = failing
+        fetcher = PolygonDataFetcher(client=client)
+        with self.assertRaises(ValueError):
+            fetcher.fetch_trades_bulk(['BAD', 'AMD', 'AAPL'], ['2023-04-03', '2023-04-04'], max_workers=1, backoff=0)
+        # Jobs queued behind the failed one are cancelled, at most the one already picked up runs
+        self.assertLessEqual(client.requests, 2)
+
+    def test_rate_limiter(self):
+        clock = FakeClock()
+        limiter = RateLimiter(2, clock=clock, sleep=clock.sleep)
+        client = RateLimitedClient(SimpleNamespace(list_aggs=lambda **kwargs: iter(range(10))), limiter, page_size=3)
+        self.assertEqual(list(client.list_aggs(ticker='AMD')), list(range(10)))
+        # 4 pages at 2 requests per second, the first one free
+        self.assertAlmostEqual(clock.now, 1.5)
+
+    def test_with_retries(self):
+        delays = []
+        attempts = []
+
+        def job():
+            attempts.append(1)
+            raise TimeoutError()
+        with self.assertRaises(TimeoutError):
+            with_retries(job, retries=3, backoff=0.5, sleep=delays.append)
+        self.assertEqual(len(attempts), 4)
+        self.assertEqual(delays, [0.5, 1.0, 2.0])
+
+    def test_with_retries_only_transient(self):
+        attempts = []
+
+        def job():
+            attempts.append(1)
+            raise ValueError('unknown ticker')
+        with self.assertRaises(ValueError):
+            with_retries(job, retries=3, backoff=0, sleep=lambda seconds: None)
+        self.assertEqual(len(attempts), 1)
+
+        self.assertTrue(is_transient(ConnectionError()))
+        self.assertTrue(is_transient(SimpleNamespace(status=503)))
+        self.assertTrue(is_transient(SimpleNamespace(status=429)))
+        self.assertFalse(is_transient(SimpleNamespace(status=404)))
+        self.assertFalse(is_transient(KeyError('results')))
@@ -0,0 +1,51 @@
+import unittest
+import numpy as np
+from backtest.broker.account import Position
+from backtest.broker.order import Order, OrderSide, OrderType
+from data.fetcher.polygon_data_model import Trade, TradeBatch
+
+
+class TestPolygonDataModel(unittest.TestCase):
+
+    def test_models_are_slotted(self):
+        trade = Trade('AAPL', 123, 12.3, 100)
+        order = Order('AAPL', 10, OrderType.MARKET, OrderSide.LONG, market_price=100.0)
+        position = Position(symbol='AAPL', side=OrderSide.LONG, quantity=100, price=102.2)
+        for obj in (trade, order, position):
+            self.assertFalse(hasattr(obj, '__dict__'))
+        self.assertEqual(trade.to_dict(), {'symbol': 'AAPL', 'timestamp': 123, 'price': 12.3, 'quantity': 100})
+
+    def test_trade_batch(self):
+        trades = [Trade('AAPL', 1, 12.3, 100), Trade('AMZN', 2, 92.5, 10), Trade('AAPL', 3, 12.4, 200)]
+        batch = TradeBatch.from_trades(trades)
+        self.assertEqual(len(batch), 3)
+        self.assertEqual(batch.symbols, ['AAPL', 'AMZN'])
+        self.assertEqual(batch.timestamps.dtype, np.int64)
+        self.assertEqual(batch.prices.dtype, np.float64)
+        self.assertEqual(batch.sizes.dtype, np.int32)
+        self.assertEqual(batch.symbol_ids.tolist(), [0, 1, 0])
+        self.assertEqual([t.to_dict() for t in batch], [t.to_dict() for t in trades])
+        self.assertEqual(batch[-1].price, 12.4)
+        self.assertEqual(batch[1].symbol, 'AMZN')
+        with self.assertRaises(IndexError):
+            batch[3]
+
+        window = batch[1:]
+        self.assertEqual(len(window), 2)
+        self.assertEqual(window[0].timestamp, 2)
+        self.assertTrue(np.shares_memory(window.prices, batch.prices))
+
+    def test_trade_batch_from_arrays(self):
+        batch = TradeBatch.from_arrays('AMD', [1, 2], [80.1, 80.2], [100, 200])
+        self.assertEqual([t.symbol for t in batch], ['AMD', 'AMD'])
+        self.assertEqual(batch.symbol_id('AMD'), 0)
+        with self.assertRaises(ValueError):
+            TradeBatch.from_arrays('AMD', [1, 2], [80.1], [100, 200])
+
+        fractional = TradeBatch.from_arrays('BTC', [1, 2], [30000.0, 30001.0], [0.25, 1.5])
+        self.assertEqual(fractional.sizes.dtype, np.float64)
+        self.assertEqual([t.quantity for t in fractional], [0.25, 1.5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import tempfile
+import time
+import unittest
+from unittest import mock
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+from data.fetcher.polygon_data_fetcher import PolygonDataFetcher
+from data.fetcher.tick_cache import add_ranges, missing_ranges, split_days
+
+
+class StandInClient(object):
+    '''Serves a synthetic tape and records every requested range.'''
+    def __init__(self, trades, bars):
+        self.trades = trades
+        self.bars = bars
+        self.trade_calls = []
+        self.agg_calls = []
+
+    def list_trades(self, ticker, timestamp_gte, timestamp_lte, limit, sort, order):
+        self.trade_calls.append((timestamp_gte, timestamp_lte))
+        return iter([t for t in self.trades if timestamp_gte <= t.sip_timestamp <= timestamp_lte])
+
+    def list_aggs(self, ticker, multiplier, timespan, from_, to, adjusted, sort, limit):
+        self.agg_calls.append((from_, to))
+        return iter([b for b in self.bars if from_ <= b.timestamp <= to])
+
+
+class TestTickCache(unittest.TestCase):
+
+    def setUp(self):
+        self.open_ns = pd.Timestamp('2023-04-03 09:30', tz='America/New_York').value
+        self.trades = [SimpleNamespace(sip_timestamp=self.open_ns + i * 1_000_000_000, price=100 + i * 0.01, size=10, exchange=4)
+                       for i in range(100)]
+        self.bars = [SimpleNamespace(timestamp=self.open_ns // 1_000_000 + i * 60_000, open=1.0, high=2.0, low=0.5, close=1.5,
+                                     volume=100.0, vwap=None, transactions=3) for i in range(10)]
+        self.client = StandInClient(self.trades, self.bars)
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.fetcher = PolygonDataFetcher(client=self.client, cache_dir=self.cache_dir.name)
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def second(self, i):
+        return self.open_ns + i * 1_000_000_000
+
+    def test_fetch_trades_only_fetches_gaps(self):
+        trades = list(self.fetcher.fetch_trades('AMD', self.second(10), self.second(20)))
+        self.assertEqual([t.sip_timestamp for t in trades], [self.second(i) for i in range(10, 21)])
+        self.assertEqual(self.client.trade_calls, [(self.second(10), self.second(20))])
+
+        # Fully cached: no request
+        trades = list(self.fetcher.fetch_trades('AMD', self.second(12), self.second(15)))
+        self.assertEqual(len(trades), 4)
+        self.assertEqual(len(self.client.trade_calls), 1)
+
+        # Widened window: only the uncovered edges are requested
+        trades = list(self.fetcher.fetch_trades('AMD', self.second(5), self.second(30)))
+        self.assertEqual([t.sip_timestamp for t in trades], [self.second(i) for i in range(5, 31)])
+        self.assertAlmostEqual(trades[0].price, 100.05)
+        self.assertEqual(self.client.trade_calls[1:], [(self.second(5), self.second(10) - 1), (self.second(20) + 1, self.second(30))])
+
+        # A fresh fetcher reads the same cache from disk
+        client = StandInClient(self.trades, self.bars)
+        fetcher = PolygonDataFetcher(client=client, cache_dir=self.cache_dir.name)
+        self.assertEqual(len(list(fetcher.fetch_trades('AMD', self.second(5), self.second(30)))), 26)
+        self.assertEqual(client.trade_calls, [])
+
+    def test_fetched_pages_are_streamed(self):
+        pulled = []
+
+        def list_trades(ticker, timestamp_gte, timestamp_lte, limit, sort, order):
+            for trade in self.trades:
+                pulled.append(trade)
+                yield trade
+        self.client.list_trades = list_trades
+        with mock.patch('data.fetcher.tick_cache.PAGE_SIZE', 10):
+            trades = self.fetcher.fetch_trades('AMD', self.second(0), self.second(99))
+            self.assertEqual(next(trades).sip_timestamp, self.second(0))
+            self.assertEqual(len(pulled), 10)
+            self.assertEqual(len(list(trades)), 99)
+        # The day is stored once fully read
+        self.assertEqual(self.fetcher.cache.coverage('AMD', 'trades', '2023-04-03').tolist(), [[self.second(0), self.second(99)]])
+
+    def test_fetch_bars(self):
+        start_ms = self.open_ns // 1_000_000
+        bars = list(self.fetcher.fetch_bars('AMD', start_ms, start_ms + 4 * 60_000))
+        self.assertEqual(len(bars), 5)
+        self.assertTrue(np.isnan(bars[0].vwap))
+        self.assertEqual(bars[0].transactions, 3)
+        bars = list(self.fetcher.fetch_bars('AMD', start_ms, start_ms + 9 * 60_000))
+        self.assertEqual(len(bars), 10)
+        self.assertEqual(self.client.agg_calls, [(start_ms, start_ms + 4 * 60_000), (start_ms + 4 * 60_000 + 1, start_ms + 9 * 60_000)])
+
+    def test_future_is_not_covered(self):
+        now_ns = time.time_ns()
+        list(self.fetcher.fetch_trades('AMD', now_ns - 1_000_000_000, now_ns + 3600 * 1_000_000_000))
+        day = split_days(now_ns, now_ns)[0][0]
+        coverage = self.fetcher.cache.coverage('AMD', 'trades', day)
+        self.assertTrue(len(coverage) == 0 or coverage[:, 1].max() < now_ns + 3600 * 1_000_000_000)
+
+    def test_recent_trades_are_not_covered(self):
+        # Trades of the last minutes may not be published yet, so they are requested again next time
+        now_ns = time.time_ns()
+        window = (now_ns - 600 * 1_000_000_000, now_ns - 60 * 1_000_000_000)
+        for _ in range(2):
+            list(self.fetcher.fetch_trades('AMD', *window))
+        # One request per New York day of the window on every fetch
+        self.assertEqual(len(self.client.trade_calls), 2 * len(split_days(*window)))
+
+    def test_fetch_trades_by_date(self):
+        trades = list(self.fetcher.fetch_trades('AMD', '2023-04-03', '2023-04-03'))
+        self.assertEqual(len(trades), 100)
+        day_start = pd.Timestamp('2023-04-03', tz='America/New_York').value
+        day_end = pd.Timestamp('2023-04-04', tz='America/New_York').value - 1
+        self.assertEqual(self.client.trade_calls, [(day_start, day_end)])
+
+    def test_ranges(self):
+        coverage = add_ranges(np.zeros((0, 2), dtype=np.int64), [(10, 20), (30, 40), (21, 25)])
+        self.assertEqual(coverage.tolist(), [[10, 25], [30, 40]])
+        self.assertEqual(missing_ranges(coverage, 0, 50), [(0, 9), (26, 29), (41, 50)])
+        self.assertEqual(missing_ranges(coverage, 12, 24), [])
+        days = split_days(self.open_ns, self.open_ns + 24 * 3600 * 1_000_000_000)
+        self.assertEqual([d for d, _, _ in days], ['2023-04-03', '2023-04-04'])
+        self.assertEqual(days[0][2] + 1, days[1][1])
@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+import pandas as pd
+from data.feed.trade_feed import TradeFeed
+from data.fetcher.polygon_data_model import Trade, TradeBatch
+
+
+class PolygonTrade(object):
+    def __init__(self, sip_timestamp, price, size):
+        self.sip_timestamp = sip_timestamp
+        self.price = price
+        self.size = size
+
+
+class TestTradeFeed(unittest.TestCase):
+
+    def setUp(self):
+        self.trades = [Trade('AMD', i, 80 + i * 0.01, 100 + i) for i in range(25)]
+
+    def test_from_list(self):
+        feed = TradeFeed.from_iterable(self.trades, chunk_size=10)
+        self.assertEqual([len(chunk) for chunk in feed], [10, 10, 5])
+        # A feed built from a list can be replayed more than once
+        self.assertEqual([t.timestamp for t in feed.trades()], list(range(25)))
+        self.assertEqual([t.timestamp for t in feed.trades()], list(range(25)))
+
+    def test_from_generator(self):
+        feed = TradeFeed.from_iterable((t for t in self.trades), chunk_size=10, prefetch=2)
+        self.assertEqual([t.timestamp for t in feed.trades()], list(range(25)))
+
+    def test_from_trade_batch(self):
+        feed = TradeFeed.from_iterable(TradeBatch.from_trades(self.trades), chunk_size=7)
+        self.assertEqual([len(chunk) for chunk in feed], [7, 7, 7, 4])
+        self.assertEqual([t.to_dict() for t in feed.trades()], [t.to_dict() for t in self.trades])
+
+    def test_from_polygon(self):
+        polygon_trades = (PolygonTrade(t.timestamp, t.price, t.quantity) for t in self.trades)
+        feed = TradeFeed.from_polygon(polygon_trades, 'AMD', chunk_size=10)
+        self.assertEqual([t.to_dict() for t in feed.trades()], [t.to_dict() for t in self.trades])
+
+    def test_from_csv(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'trades.csv')
+            pd.DataFrame.from_records([t.to_dict() for t in self.trades]).to_csv(path, index=False)
+            feed = TradeFeed.from_csv(path, chunk_size=10, prefetch=1)
+            self.assertEqual([len(chunk) for chunk in feed], [10, 10, 5])
+            self.assertEqual([t.to_dict() for t in feed.trades()], [t.to_dict() for t in self.trades])
+
+    def test_prefetch_propagates_errors(self):
+        def broken():
+            yield self.trades[0]
+            raise RuntimeError('source failed')
+        feed = TradeFeed.from_iterable(broken(), chunk_size=1, prefetch=1)
+        with self.assertRaises(RuntimeError):
+            list(feed.trades())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+import numpy as np
+import pandas as pd
+from utils.data_utils import DataUtils
+
+
+class PolygonTrade(object):
+    def __init__(self, sip_timestamp, price, size):
+        self.sip_timestamp = sip_timestamp
+        self.price = price
+        self.size = size
+
+
+def pandas_resample(df: pd.DataFrame, multiplier: int) -> pd.DataFrame:
+    '''Reference bars from pandas resampling, as resample_xmin_bars used to compute them.
+    '''
+    df = df.copy()
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ns')
+    df.set_index('timestamp', inplace=True)
+    df.index = df.index.tz_localize('UTC').tz_convert('America/New_York')
+    rule = '{}min'.format(multiplier)
+    total_quantity = df['quantity'].resample(rule).sum()
+    df['price_quantity'] = df['price'] * df['quantity']
+    result = pd.DataFrame({
+        'open': df['price'].resample(rule).first(),
+        'close': df['price'].resample(rule).last(),
+        'high': df['price'].resample(rule).max(),
+        'low': df['price'].resample(rule).min(),
+        'v': total_quantity,
+        'vw': df['price_quantity'].resample(rule).sum() / total_quantity,
+    })
+    result['n'] = df['price'].resample(rule).count()
+    result.reset_index(inplace=True)
+    return result
+
+
+class TestDataUtils(unittest.TestCase):
+
+    def setUp(self):
+        self.trades = [PolygonTrade(1679578200000000000 + i * 10**9, 80 + i * 0.01, 100 + i) for i in range(25)]
+
+    def test_import_data_from_iter(self):
+        # A chunk size smaller than the data makes the buffers grow more than once
+        df = DataUtils.import_data_from_iter(iter(self.trades), 'AMD', chunk_size=4)
+        expected = pd.DataFrame.from_records([{'symbol': 'AMD', 'timestamp': t.sip_timestamp, 'price': t.price,
+                                               'quantity': t.size} for t in self.trades])
+        pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+        self.assertEqual(df['timestamp'].dtype, np.int64)
+        self.assertEqual(df['quantity'].dtype, np.int64)
+
+    def test_import_data_from_iter_fractional_sizes(self):
+        trades = self.trades[:5] + [PolygonTrade(1679578300000000000, 80.5, 0.5), PolygonTrade(1679578301000000000, 80.6, 2.25)]
+        df = DataUtils.import_data_from_iter(iter(trades), 'AMD', chunk_size=4)
+        self.assertEqual(df['quantity'].dtype, np.float64)
+        self.assertEqual(df['quantity'].tolist(), [t.size for t in trades])
+        chunks = list(DataUtils.iter_data_chunks(iter(trades), 'AMD', chunk_size=4))
+        self.assertEqual(pd.concat(chunks, ignore_index=True)['quantity'].tolist(), [t.size for t in trades])
+
+    def test_import_data_from_iter_empty(self):
+        df = DataUtils.import_data_from_iter(iter([]), 'AMD')
+        self.assertEqual(list(df.columns), ['symbol', 'timestamp', 'price', 'quantity'])
+        self.assertEqual(len(df), 0)
+
+    def test_iter_data_chunks(self):
+        chunks = list(DataUtils.iter_data_chunks(iter(self.trades), 'AMD', chunk_size=10))
+        self.assertEqual([len(chunk) for chunk in chunks], [10, 10, 5])
+        pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True),
+                                      DataUtils.import_data_from_iter(iter(self.trades), 'AMD'))
+
+    def test_resample_bars(self):
+        rng = np.random.default_rng(0)
+        # Two sessions with a gap, shuffled so the input isn't sorted
+        timestamps = np.concatenate([1679578200000000000 + rng.integers(0, 6 * 3600 * 10**9, 2000),
+                                     1679664600000000000 + rng.integers(0, 3600 * 10**9, 500)])
+        df = pd.DataFrame({'symbol': 'AMD', 'timestamp': timestamps,
+                           'price': np.round(80 + rng.normal(0, 1, len(timestamps)), 2),
+                           'quantity': rng.integers(1, 500, len(timestamps))})
+        bars = DataUtils.resample_bars(df, [1, 5, 7, 15, 30])
+        for multiplier, frame in bars.items():
+            pd.testing.assert_frame_equal(frame, pandas_resample(df, multiplier))
+        pd.testing.assert_frame_equal(DataUtils.resample_xmin_bars(df, 5), bars[5].drop(columns='n'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -21,13 +21,15 @@ def read_data(start_time, end_time):
     return df
 
 def load_data():
-    for date in dates:
-        start_time = '{}T09:30:00'.format(date)
-        end_time = '{}T16:00:00'.format(date)
-        data = read_data(start_time=start_time, end_time=end_time)
+    def save(symbol, date, trades):
+        data = pd.DataFrame({'symbol': symbol, 'timestamp': trades.timestamps, 'price': trades.prices, 'quantity': trades.sizes})
         data.to_csv('~/data/projects/ares-finance/raw/trade/amd/{}.csv'.format(date), index=False)
         df1 = DataUtils.resample_xmin_bars(data, 1)
         df1.to_csv('~/data/projects/ares-finance/generated/bar/amd/{}_1_min.csv'.format(date), index=False)
+
+    # Days are fetched concurrently; each one is saved as soon as it is complete
+    fetcher = PolygonDataFetcher()
+    fetcher.fetch_trades_bulk(['AMD'], dates, start_time='09:30', end_time='16:00', requests_per_second=5, callback=save)
         
 #load_data()
 def generate_img():
@@ -1,64 +1,201 @@
-from data.fetcher.polygon_data_model import Trade
-from typing import Iterator
+from typing import Dict, Iterable, Iterator, List
+from itertools import islice
 from polygon.rest.models import Trade as PTrade
+import numpy as np
 import pandas as pd
 
+DEFAULT_CHUNK_SIZE = 1 << 16
+BAR_MULTIPLIERS = (1, 5, 15, 30)
+NANOSECONDS_PER_MINUTE = 60 * 10**9
+MARKET_TZ = 'America/New_York'
+
 class DataUtils:
 
     @staticmethod
-    def import_data_from_iter(_iter: Iterator[PTrade], symbol: str) -> pd.DataFrame:
+    def import_data_from_iter(_iter: Iterable[PTrade], symbol: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> pd.DataFrame:
         '''Import data from Polygon iter to Panda DataFrame.
 
+        Trades are read chunk_size at a time straight into typed numpy buffers, which grow by
+        doubling and are trimmed in place at the end. The DataFrame wraps the buffers without copying.
+        Quantities are int64, or float64 once any size is a float, so fractional sizes are kept.
+
         Args:
-            _iter (Iterator[PTrade]): _description_
-            symbol (str): _description_
+            _iter (Iterable[PTrade]): Polygon trades, e.g. from PolygonDataFetcher.fetch_trades
+            symbol (str): Symbol of the trades
+            chunk_size (int, optional): Trades read per chunk. Defaults to DEFAULT_CHUNK_SIZE.
 
         Returns:
-            pd.DataFrame: Data Frame that contains trade data
+            pd.DataFrame: Data Frame with symbol, timestamp, price and quantity columns
+        '''
+        capacity = chunk_size
+        timestamps = np.empty(capacity, dtype=np.int64)
+        prices = np.empty(capacity, dtype=np.float64)
+        quantities = np.empty(capacity, dtype=np.int64)
+        size = 0
+        for chunk in _record_chunks(_iter, chunk_size):
+            end = size + len(chunk)
+            if end > capacity:
+                while end > capacity:
+                    capacity *= 2
+                for buffer in (timestamps, prices, quantities):
+                    buffer.resize(capacity, refcheck=False)
+            sizes = _fill(chunk, timestamps[size:end], prices[size:end])
+            if sizes.dtype.kind == 'f' and quantities.dtype.kind != 'f':
+                quantities = quantities.astype(np.float64)
+            quantities[size:end] = sizes
+            size = end
+        for buffer in (timestamps, prices, quantities):
+            buffer.resize(size, refcheck=False)
+        return _trade_frame(symbol, timestamps, prices, quantities)
+
+    @staticmethod
+    def iter_data_chunks(_iter: Iterable[PTrade], symbol: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+        '''Import data from Polygon iter as DataFrames of at most chunk_size trades, with the same
+        columns as import_data_from_iter. Only one chunk is held in memory at a time.
         '''
-        datas = []
-        for trade in _iter:
-            d = Trade(symbol, trade.sip_timestamp, trade.price, trade.size)
-            datas.append(d)
-        return pd.DataFrame.from_records([s.to_dict() for s in datas])
+        for chunk in _record_chunks(_iter, chunk_size):
+            timestamps = np.empty(len(chunk), dtype=np.int64)
+            prices = np.empty(len(chunk), dtype=np.float64)
+            sizes = _fill(chunk, timestamps, prices)
+            quantities = sizes.astype(np.float64 if sizes.dtype.kind == 'f' else np.int64, copy=False)
+            yield _trade_frame(symbol, timestamps, prices, quantities)
 
     @staticmethod
     def resample_xmin_bars(df: pd.DataFrame, multiplier: int) -> pd.DataFrame:
-        df = df.copy()
-        # Convert the timestamp from nanoseconds to datetime
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ns')
-
-        # Set the timestamp as the index
-        df.set_index('timestamp', inplace=True)
-
-        # Convert the timezone to New York
-        df.index = df.index.tz_localize('UTC').tz_convert('America/New_York')
-
-        # Resample and calculate open, high, low, and close prices
-        open_prices = df['price'].resample('{}min'.format(multiplier)).first()
-        high_prices = df['price'].resample('{}min'.format(multiplier)).max()
-        low_prices = df['price'].resample('{}min'.format(multiplier)).min()
-        close_prices = df['price'].resample('{}min'.format(multiplier)).last()
-        
-        # Resample and calculate the total quantity
-        total_quantity = df['quantity'].resample('{}min'.format(multiplier)).sum()
-
-        # Calculate the volume-weighted price
-        df['price_quantity'] = df['price'] * df['quantity']
-        volume_weighted_price_sum = df['price_quantity'].resample('{}min'.format(multiplier)).sum()
-        volume_weighted_price = volume_weighted_price_sum / total_quantity
-
-        # Combine the results into a new DataFrame
-        result = pd.DataFrame({
-            'open': open_prices,
-            'close': close_prices,
-            'high': high_prices,
-            'low': low_prices,
-            'v': total_quantity,
-            'vw': volume_weighted_price
-        })
-
-        # Reset the index to convert the DateTimeIndex back to a column
-        result.reset_index(inplace=True)
-
-        return result
\ No newline at end of file
+        '''Resample trades into bars of multiplier minutes with timestamp (New York time), open,
+        close, high, low, v and vw columns. Bars without trades are kept with NaN prices and zero volume.
+        '''
+        return DataUtils.resample_bars(df, [multiplier])[multiplier].drop(columns='n')
+
+    @staticmethod
+    def resample_bars(df: pd.DataFrame, multipliers: Iterable[int] = BAR_MULTIPLIERS) -> Dict[int, pd.DataFrame]:
+        '''Resample trades into bars of several sizes in one pass, see aggregate_bars.
+
+        Args:
+            df (pd.DataFrame): Trades with timestamp (nanoseconds), price and quantity columns
+            multipliers (Iterable[int], optional): Bar sizes in minutes. Defaults to BAR_MULTIPLIERS.
+
+        Returns:
+            Dict[int, pd.DataFrame]: Bars of every multiplier, with the columns of resample_xmin_bars
+                and the trade count in n
+        '''
+        timestamps = df['timestamp'].to_numpy()
+        prices = df['price'].to_numpy()
+        quantities = df['quantity'].to_numpy()
+        if len(timestamps) > 1 and (np.diff(timestamps) < 0).any():
+            order = np.argsort(timestamps, kind='stable')
+            timestamps, prices, quantities = timestamps[order], prices[order], quantities[order]
+        multipliers = list(multipliers)
+        bars = aggregate_bars(timestamps, prices, quantities, [m * NANOSECONDS_PER_MINUTE for m in multipliers])
+        return {multiplier: _bar_frame(columns) for multiplier, columns in zip(multipliers, bars)}
+
+
+def _record_chunks(_iter: Iterable, chunk_size: int) -> Iterator[list]:
+    iterator = iter(_iter)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _fill(chunk: list, timestamps: np.ndarray, prices: np.ndarray) -> np.ndarray:
+    '''Write the sip_timestamp and price of a chunk of Polygon trades into the given arrays and
+    return the sizes in their own dtype (integer, or float when any size is a float).
+    '''
+    timestamps[:] = [t.sip_timestamp for t in chunk]
+    prices[:] = [t.price for t in chunk]
+    return np.asarray([t.size for t in chunk])
+
+
+def _trade_frame(symbol: str, timestamps: np.ndarray, prices: np.ndarray, quantities: np.ndarray) -> pd.DataFrame:
+    return pd.DataFrame({'symbol': symbol, 'timestamp': timestamps, 'price': prices, 'quantity': quantities},
+                        index=pd.RangeIndex(len(timestamps)), copy=False)
+
+
+def aggregate_bars(timestamps: np.ndarray, prices: np.ndarray, quantities: np.ndarray,
+                   bar_sizes: List[int]) -> List[Dict[str, np.ndarray]]:
+    '''Open, high, low, close, volume, VWAP and trade count of trades sorted by timestamp, for
+    several bar sizes in nanoseconds. Bars are anchored like pandas resampling at midnight New York
+    time of the first trade and span the first to the last trade, bars without trades included.
+
+    Trades are bucketed once by integer division into bars of the greatest common divisor of the
+    sizes, and every size is then rolled up from those base bars, so each trade is visited once.
+
+    Returns:
+        List[Dict[str, np.ndarray]]: Columns timestamp (nanoseconds), open, close, high, low, v, vw
+            and n of every bar size, in the order of bar_sizes
+    '''
+    if len(timestamps) == 0:
+        return [_empty_bars(quantities.dtype) for _ in bar_sizes]
+    volume_dtype = quantities.dtype
+    if np.issubdtype(volume_dtype, np.integer):
+        # Sums are accumulated in 64 bits and returned in the quantity dtype, as pandas does
+        quantities = quantities.astype(np.int64, copy=False)
+    origin = pd.Timestamp(int(timestamps[0]), tz='UTC').tz_convert(MARKET_TZ).normalize().value
+    base_size = int(np.gcd.reduce(bar_sizes))
+    buckets = (timestamps - origin) // base_size
+    base = _reduce(buckets, prices, prices, prices, prices, quantities, prices * quantities, np.ones(len(buckets), np.int64))
+    results = []
+    for bar_size in bar_sizes:
+        ratio = bar_size // base_size
+        bars = base if ratio == 1 else _reduce(base['bucket'] // ratio, *(base[c] for c in AGG_COLUMNS))
+        results.append(_fill_range(bars, origin, bar_size, volume_dtype))
+    return results
+
+
+AGG_COLUMNS = ('open', 'close', 'high', 'low', 'v', 'pv', 'n')
+
+
+def _reduce(buckets: np.ndarray, opens, closes, highs, lows, volumes, price_volumes, counts) -> Dict[str, np.ndarray]:
+    '''Combine consecutive rows of equal sorted bucket into one row per non-empty bucket.
+    '''
+    starts = np.concatenate(([0], np.flatnonzero(buckets[1:] != buckets[:-1]) + 1))
+    ends = np.append(starts[1:], len(buckets)) - 1
+    return {
+        'bucket': buckets[starts],
+        'open': opens[starts],
+        'close': closes[ends],
+        'high': np.maximum.reduceat(highs, starts),
+        'low': np.minimum.reduceat(lows, starts),
+        'v': np.add.reduceat(volumes, starts),
+        'pv': np.add.reduceat(price_volumes, starts),
+        'n': np.add.reduceat(counts, starts),
+    }
+
+
+def _fill_range(bars: Dict[str, np.ndarray], origin: int, bar_size: int, volume_dtype) -> Dict[str, np.ndarray]:
+    '''Spread non-empty bars over every bucket from the first to the last one.
+    '''
+    first = bars['bucket'][0]
+    rows = bars['bucket'] - first
+    length = int(rows[-1]) + 1
+    columns = {'timestamp': origin + (first + np.arange(length, dtype=np.int64)) * bar_size}
+    for name in ('open', 'close', 'high', 'low'):
+        columns[name] = np.full(length, np.nan)
+        columns[name][rows] = bars[name]
+    volumes = np.zeros(length, dtype=bars['v'].dtype)
+    volumes[rows] = bars['v']
+    columns['v'] = volumes.astype(volume_dtype, copy=False)
+    pv = np.zeros(length)
+    pv[rows] = bars['pv']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        columns['vw'] = pv / volumes
+    columns['n'] = np.zeros(length, dtype=np.int64)
+    columns['n'][rows] = bars['n']
+    return columns
+
+
+def _empty_bars(volume_dtype) -> Dict[str, np.ndarray]:
+    columns = {'timestamp': np.zeros(0, dtype=np.int64)}
+    columns.update({name: np.zeros(0) for name in ('open', 'close', 'high', 'low')})
+    columns['v'] = np.zeros(0, dtype=volume_dtype)
+    columns['vw'] = np.zeros(0)
+    columns['n'] = np.zeros(0, dtype=np.int64)
+    return columns
+
+
+def _bar_frame(columns: Dict[str, np.ndarray]) -> pd.DataFrame:
+    frame = pd.DataFrame(columns, copy=False)
+    frame['timestamp'] = pd.to_datetime(frame['timestamp'], unit='ns').dt.tz_localize('UTC').dt.tz_convert(MARKET_TZ)
+    return frame